@@ -1,32 +1,81 @@
 import sys
 import os
-import re # Added for filename sanitization
-from datetime import datetime
-import fnmatch
-from typing import List, Tuple, Dict, Any, Optional, Set
+import re
+import json
+import time
+import threading
+import bisect
+from typing import List, Tuple, Dict, Any, Optional, Set, Iterable, Iterator
 from functools import partial # For connecting signals with arguments
 
 # Import PyQt6 modules
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLineEdit, QPushButton, QTreeView, QSizePolicy, QLabel, QTextEdit,
-    QFileDialog, QGroupBox, QDialog, QMessageBox, QAbstractItemView, QMenu
+    QFileDialog, QGroupBox, QDialog, QMessageBox, QAbstractItemView, QMenu, QCheckBox, QSpinBox, QComboBox, QAbstractScrollArea, QInputDialog
+)
+from PyQt6.QtGui import QTextCursor, QIcon, QDesktopServices, QFont, QBrush, QColor, QPainter, QKeySequence, QShortcut
+from PyQt6.QtCore import Qt, QDir, QModelIndex, QAbstractItemModel, QThread, pyqtSignal, QFileSystemWatcher, QSettings, QUrl, QSize, QTimer
+
+from context_compiler import (
+    OUTPUT_DIR, SCAN_MAX_WORKERS, SCAN_BATCH_INTERVAL_S, GENERATION_MAX_WORKERS, ITEM_IS_DIR, ITEM_ERROR, ITEM_REMOVED,
+    DEFAULT_EXCLUSION_MATCHER, GitIgnoreMatcher, ProjectItemStore, RenderedBlockCache, get_file_extension,
+    scan_directory, iter_directory_listings, scan_project_tree, scan_summary_message, iter_file_sizes,
+    iter_file_sniffs,
+    format_generation_progress, generate_text_from_selected_files, TokenCounter, available_tokenizers, load_tokenizer,
+    TokenBudget, parse_priority, LargeFilePolicy, LARGE_FILE_HEAD, LARGE_FILE_TAIL, MAX_FILE_SIZE_READ,
+    OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, COMPRESSIONS, ShardLimit, LineIndexedFile,
+    TRANSFORMS, TransformPolicy, transform_policy_from_rules, format_transform_savings, ContentIndex,
 )
-from PyQt6.QtGui import QStandardItemModel, QStandardItem, QIcon, QDesktopServices, QFont, QBrush
-from PyQt6.QtCore import Qt, QDir, QModelIndex, QFileSystemWatcher, QSettings, QUrl, QSize
 
 # --- Constants ---
-OUTPUT_DIR = "output"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
 # QSettings constants
 ORGANIZATION_NAME = "YourOrganizationName" # Change as you see fit
 APPLICATION_NAME = "LLMContextCompiler"
 SETTINGS_PINNED_DIRS = "pinnedDirectories"
 SETTINGS_RECENT_DIRS = "recentDirectories"
+SETTINGS_RESPECT_GITIGNORE = "respectGitignore"
+SETTINGS_GENERATION_WORKERS = "generationWorkers"
+SETTINGS_WATCH_PROJECT = "watchProject"
+SETTINGS_TOKENIZER = "tokenizer"
+SETTINGS_TOKEN_BUDGET = "tokenBudget"
+SETTINGS_BUDGET_PRIORITIES = "budgetPriorities"
+SETTINGS_LARGE_FILE_MODE = "largeFileMode"
+SETTINGS_LARGE_FILE_HEAD = "largeFileHead"
+SETTINGS_LARGE_FILE_TAIL = "largeFileTail"
+SETTINGS_OUTPUT_FORMAT = "outputFormat"
+SETTINGS_COMPRESSION = "compression"
+SETTINGS_SHARD_LIMIT = "shardLimit"
+SETTINGS_SHARD_UNIT = "shardUnit"
+SETTINGS_DEDUPLICATE = "deduplicate"
+SETTINGS_TRANSFORMS = "transforms"
+SETTINGS_CONTENT_INDEX = "contentIndex"
+SETTINGS_SELECTION_PROFILES = "selectionProfiles" # JSON: project path -> {"active": name, "profiles": {name: rules}}
+# Large file choices: label -> (LargeFilePolicy mode, unit)
+LARGE_FILE_MODES: Dict[str, Tuple[str, str]] = {
+    "Excerpt lines": ("excerpt", "lines"), "Excerpt tokens": ("excerpt", "tokens"), "Skip": ("skip", "lines"),
+}
+SHARD_UNITS = ("tokens", "KB") # Units of the part size limit
+TOKEN_REPORT_TOP_FILES = 10 # Largest files listed in the completion dialog
 MAX_PINNED_DIRS = 3
 MAX_RECENT_DIRS = 3
 
+# Viewer constants
+VIEWER_SEARCH_CHUNK = 4 * 1024 * 1024 # Bytes searched per timer tick
+VIEWER_COPY_MAX_BYTES = 64 * 1024 * 1024 # Largest file "Copy All" puts on the clipboard
+VIEWER_TAB_WIDTH = 4
+VIEWER_TEXT_MARGIN = 6 # Pixels around the line number gutter
+
+# Content search constants
+CONTENT_SEARCH_DEBOUNCE_MS = 250 # Typing pause before the content index is queried
+
+# Selection summary constants
+SELECTION_SUMMARY_INTERVAL_MS = 100 # Most check changes between two updates of the selection totals line
+
+# Watch mode constants
+WATCH_DEBOUNCE_MS = 300 # Quiet period before a burst of directory changes is applied
+WATCH_MAX_DIRECTORIES = 8192 # Keeps well inside typical inotify watch limits
+
 # --- Color Palette ---
 COLORS: Dict[str, str] = {
     # Base/Backgrounds
@@ -73,37 +122,6 @@ COLORS: Dict[str, str] = {
 }
 
 
-# Directories to exclude (lowercase, set for efficient lookup)
-EXCLUDE_DIRS: Set[str] = {
-    '.git', '.idea', 'venv', '__pycache__', 'node_modules', '.vscode',
-    'target', 'build', 'dist', 'out', '.gradle', '.mvn', '.venv', '.mypy_cache', '.pytest_cache',
-    '.ruff_cache', 'env', '.env', 'bower_components', 'jspm_packages',
-    'bin', 'obj', 'packages', 'logs', 'temp', 'tmp', '.terraform', '.terragrunt-cache',
-    '.angular', '.cache', 'coverage', 'docs_build', 'site', 'local_env',
-    '.serverless', '.dynamodb', '.localstack', '.vagrant', '.kitchen', '.next', '.nuxt',
-    'vendor', # Common for PHP/Ruby
-}
-# Files to exclude (lowercase)
-EXCLUDE_FILES_EXACT: Set[str] = {
-    '.ds_store', 'thumbs.db', '.gitignore', 'pipfile.lock',
-    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock',
-    'npm-debug.log', 'yarn-debug.log', 'yarn.error.log', '.npmrc', '.babelrc', '.eslintrc.js', '.eslintrc.json', '.eslintrc.yaml', '.eslintrc.yml', '.eslintrc', '.prettierrc.js', '.prettierrc.json', '.prettierrc.yaml', '.prettierrc.yml', '.prettierrc',
-    'pytest.ini', 'tox.ini', 'setup.cfg', 'pyproject.toml',
-    '.editorconfig', '.gitattributes', '.gitmodules',
-    'web.config', 'app.config', '.env.local', '.env.development', '.env.production', '.env.test',
-    'nohup.out',
-}
-EXCLUDE_FILES_PATTERNS: List[str] = [
-    '*.log', '*.tmp', '*.bak', '*.swp', '*.swo', '*.cache', '*.DS_Store',
-    '*.pyc', '*.pyo', '*.exe', '*.dll', '*.o', '*.so', '*.bin',
-    '*.zip', '*.tar.gz', '*.rar', '*.7z', '*.gz', '*.bz2', '*.xz',
-    '*.dmg', '*.iso',
-    '*.class', '*.jar', '*.war', '*.ear',
-    '*.pdf', '*.doc', '*.docx', '*.xls', '*.xlsx', '*.ppt', '*.pptx',
-    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.svg', '*.ico',
-    '*.mp3', '*.wav', '*.ogg', '*.mp4', '*.avi', '*.mkv',
-    '*.lock',
-]
 
 # --- Icon Mapping ---
 ICON_MAP: Dict[str, str] = {
@@ -156,6 +174,8 @@ QLineEdit[readOnly="true"] {{
     color: {COLORS['textSecondary']};
     border: 1px solid {COLORS['borderLight']};
 }}
+QAbstractScrollArea#pagedTextView {{ border: 1px solid {COLORS['borderDark']}; border-radius: 3px; }}
+QAbstractScrollArea#pagedTextView:focus {{ border: 1px solid {COLORS['lightBlue']}; }}
 QTextEdit {{ font-family: "Consolas", "Monaco", "DejaVu Sans Mono", "Courier New", monospace; }}
 QPushButton {{
     background-color: {COLORS['buttonNormalBg']};
@@ -265,216 +285,625 @@ QMessageBox {{ background-color: {COLORS['cardBackground']}; }}
 QMessageBox QLabel {{ color: {COLORS['textPrimary']}; }}
 """
 
-# --- Helper Functions ---
-
-def get_file_extension(filepath: str) -> str:
-    name = os.path.basename(filepath)
-    parts = name.split('.')
-    if len(parts) > 1 and parts[-1]: return parts[-1].lower()
-    common_names_without_ext = {
-        'dockerfile', 'makefile', 'readme', 'license', '.gitattributes',
-        '.editorconfig', 'jenkinsfile', 'vagrantfile', 'gemfile', 'procfile',
-        '.gitignore', '.env'
-    }
-    name_lower = name.lower()
-    if name_lower in common_names_without_ext: return name_lower
-    if name.startswith('.') and len(parts) == 1:
-        return name_lower[1:]
-    if name.startswith('.') and len(parts) > 1 and not parts[-1]:
-         return parts[1].lower() if len(parts) > 1 else 'text'
-    return 'text'
-
-def is_excluded(name: str, is_dir: bool) -> bool:
-     name_lower = name.lower()
-     if is_dir:
-         # Exclude dot-directories like .git, .idea, etc., but allow specific ones like .well-known
-         return name_lower in EXCLUDE_DIRS or (name.startswith('.') and name_lower not in {'.well-known'})
-     else:
-         # Exclude specific files and patterns, but allow some common dotfiles (like .env, .bashrc)
-         if name_lower in EXCLUDE_FILES_EXACT:
-             return True
-         # Allow .env, .<anything>rc files, and other dotfiles not in EXCLUDE_FILES_EXACT
-         if name.startswith('.') and name_lower not in EXCLUDE_FILES_EXACT and \
-            not name_lower.startswith(".git") and \
-            not name_lower == ".env" and \
-            not name_lower.endswith("rc"):
-            return True # Exclude if it's a dotfile not explicitly allowed/common
-
-         for pattern in EXCLUDE_FILES_PATTERNS:
-             if fnmatch.fnmatch(name_lower, pattern): return True
-         return False
-
-def list_project_items(project_path: str) -> Tuple[List[Dict[str, Any]], str]:
-    if not project_path or not os.path.isdir(project_path):
-        return [], "Error: Project path is invalid or not a directory."
-
-    items: List[Dict[str, Any]] = []
-    project_path_abs = os.path.abspath(project_path)
-
-    items.append({
-        'Select': True, 'Type': '📁 Dir', 'Path': "", 'Depth': 0,
-        'Name': os.path.basename(project_path_abs) or project_path_abs, 'IsDir': True
-    })
-
-    try:
-        for root, dirs, files in os.walk(project_path_abs, topdown=True):
-            current_relative_root = os.path.relpath(root, project_path_abs)
-            if current_relative_root == ".": current_relative_root = ""
-            current_dir_depth = current_relative_root.count(os.sep) if current_relative_root else 0
-
-            valid_dirs = [d for d in dirs if not is_excluded(d, is_dir=True)]
-            dirs[:] = valid_dirs
-
-            for dir_name in sorted(valid_dirs):
-                 dir_path_rel = os.path.join(current_relative_root, dir_name).replace("\\", "/")
-                 items.append({
-                     'Select': True, 'Type': '📁 Dir', 'Path': dir_path_rel,
-                     'Depth': current_dir_depth + 1, 'Name': dir_name, 'IsDir': True
-                 })
-
-            valid_files = [f for f in files if not is_excluded(f, is_dir=False)]
-            for file_name in sorted(valid_files):
-                 file_path_rel = os.path.join(current_relative_root, file_name).replace("\\", "/")
-                 items.append({
-                     'Select': True, 'Type': '📄 File', 'Path': file_path_rel,
-                     'Depth': current_dir_depth + 1, 'Name': file_name, 'IsDir': False
-                 })
-    except PermissionError as e:
-        error_path_rel = os.path.relpath(str(e.filename), project_path_abs) if e.filename else "Unknown Path"
-        error_path_rel = error_path_rel.replace("\\", "/")
-        items.append({
-            'Select': False, 'Type': '⚠️ Error Dir', 'Path': error_path_rel,
-            'Depth': error_path_rel.count(os.sep) if error_path_rel and error_path_rel != "." else 0,
-            'Name': os.path.basename(str(e.filename) or "Access Denied"),
-            'IsDir': True, 'Error': str(e)
-        })
-        print(f"Warning: Permission denied accessing '{e.filename}'. Added as error item.")
-    except Exception as e:
-        return items, f"An unexpected error occurred while scanning: {type(e).__name__}: {e}"
-
-    if len(items) <= 1:
-         try: has_any_entries = any(True for _ in os.scandir(project_path_abs))
-         except Exception: has_any_entries = False
-         if has_any_entries:
-              return items, "No displayable files or sub-directories found (all might be excluded or filtered)."
-         else:
-              return items, "Project directory appears to be empty or inaccessible."
-    return items, f"Found {len(items) - 1} items (excluding root). Scan complete."
-
-def generate_text_from_selected_files(project_path: str, selected_items_data: List[Dict[str, Any]], custom_filename_base: Optional[str] = None) -> Tuple[Optional[str], str, int, int]:
-    if not project_path or not os.path.isdir(project_path):
-        return None, "Error: Project path is invalid.", 0, 0
-    if not selected_items_data: return None, "Error: No file data provided for generation.", 0, 0
-
-    files_to_read_items = [
-        item for item in selected_items_data
-        if item.get('Select', False) and not item.get('IsDir', True) and item.get('Type') != '⚠️ Error Dir'
-    ]
-    if not files_to_read_items: return None, "No files selected to generate context.", 0, 0
-    files_to_read_items.sort(key=lambda x: x.get('Path', ''))
-
-    content_parts: List[str] = []
-    MAX_FILE_SIZE_READ = 1024 * 1024 # 1MB
-
-    for item in files_to_read_items:
-        relative_filepath = item['Path']
-        full_filepath = os.path.join(project_path, relative_filepath)
-        try:
-            if not os.path.isfile(full_filepath):
-                 content_parts.append(f"--- File: {relative_filepath} ---\nError: Path not found or is not a file.\n--- END OF FILE: {relative_filepath} ---\n")
-                 continue
-            file_size = os.path.getsize(full_filepath)
-            if file_size == 0:
-                 content_parts.append(f"--- File: {relative_filepath} ---\n(File is empty)\n--- END OF FILE: {relative_filepath} ---\n")
-                 continue
-            if file_size > MAX_FILE_SIZE_READ:
-                 content_parts.append(f"--- File: {relative_filepath} ---\nNote: Skipped file larger than {MAX_FILE_SIZE_READ // 1024}KB.\n--- END OF FILE: {relative_filepath} ---\n")
-                 continue
-            try:
-                with open(full_filepath, 'r', encoding='utf-8') as f: file_content = f.read()
-                if '\0' in file_content:
-                    content_parts.append(f"--- File: {relative_filepath} ---\nNote: Skipped potential binary file (contained NUL bytes).\n--- END OF FILE: {relative_filepath} ---\n")
-                    continue
-            except UnicodeDecodeError:
-                 try:
-                     with open(full_filepath, 'r', encoding='latin-1') as f: file_content = f.read()
-                     if '\0' in file_content:
-                          content_parts.append(f"--- File: {relative_filepath} ---\nNote: Skipped potential binary file (NUL bytes after latin-1).\n--- END OF FILE: {relative_filepath} ---\n")
-                          continue
-                     content_parts.append(f"--- File: {relative_filepath} (Latin-1 encoding) ---\n```\n{file_content.strip()}\n```\n--- END OF FILE: {relative_filepath} ---\n")
-                     continue
-                 except Exception:
-                    content_parts.append(f"--- File: {relative_filepath} ---\nError: Could not decode file (binary or unknown encoding).\n--- END OF FILE: {relative_filepath} ---\n")
-                    continue
-            except Exception as e:
-                 content_parts.append(f"--- File: {relative_filepath} ---\nError reading file content: {type(e).__name__}: {e}\n--- END OF FILE: {relative_filepath} ---\n")
-                 continue
-            lang_hint = get_file_extension(relative_filepath)
-            content_parts.append(f"--- File: {relative_filepath} ---\n```{lang_hint}\n{file_content.strip()}\n```\n--- END OF FILE: {relative_filepath} ---\n")
-        except Exception as e:
-            content_parts.append(f"--- File: {relative_filepath} ---\nUnexpected error processing file: {type(e).__name__}: {e}\n--- END OF FILE: {relative_filepath} ---\n")
-
-    if not content_parts: return None, "No content generated. Files might have issues or were skipped.", 0, 0
-    
-    # Construct the header
-    project_name = os.path.basename(project_path)
-    header = f"--- START OF PROJECT CONTEXT FOR: {project_name} ---\n"
-    header += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    header += f"Number of files included: {len(files_to_read_items)}\n"
-    header += "---\n\n"
-    
-    final_text = header + "\n".join(content_parts)
-    final_text += f"\n--- END OF PROJECT CONTEXT FOR: {project_name} ---"
-
-
-    word_count = len(final_text.split())
-    token_count_approx = int(len(final_text) / 4) # General LLM token approximation
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    if custom_filename_base and custom_filename_base.strip():
-        # Sanitize filename: replace non-alphanumeric, non-space, non-underscore, non-hyphen with nothing, then replace spaces with underscores.
-        sanitized_base = re.sub(r'[^\w\s-]', '', custom_filename_base).strip().replace(" ", "_")
-        if not sanitized_base: # Fallback if sanitized base is empty
-            sanitized_base = "project_context"
-        output_filename = f"{sanitized_base}_{timestamp}.txt"
-    else:
-        # Default filename based on project name, sanitize spaces
-        default_base = re.sub(r'[^\w\s-]', '', project_name).strip().replace(" ", "_")
-        if not default_base: default_base = "project_context"
-        output_filename = f"{default_base}_{timestamp}.txt"
-
-
-    output_filepath = os.path.join(OUTPUT_DIR, output_filename)
-    try:
-        with open(output_filepath, 'w', encoding='utf-8') as f: f.write(final_text)
-        return output_filepath, f"Context file generated: {output_filename} ({len(files_to_read_items)} files processed)", word_count, token_count_approx
-    except Exception as e:
-        return None, f"Error saving output file '{output_filename}': {e}", 0, 0
-
 # --- Helper Dialog for viewing file content ---
+class LineIndexWorker(QThread):
+    # Opens and indexes a LineIndexedFile off the GUI thread; an open failure is left in self.error
+    progress_changed = pyqtSignal('qint64', 'qint64') # indexed bytes, total bytes
+    file_opened = pyqtSignal()
+
+    def __init__(self, line_file: LineIndexedFile, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.line_file = line_file; self.error: Optional[str] = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self): self._cancel_event.set()
+
+    def run(self):
+        try: self.line_file.open(self._cancel_event)
+        except Exception as e: self.error = f"Could not read '{self.line_file.path}': {type(e).__name__}: {e}"; return
+        self.file_opened.emit()
+        self.line_file.build_index(self._cancel_event, self.progress_changed.emit)
+
+class PagedTextView(QAbstractScrollArea):
+    # Read-only view of a LineIndexedFile that decodes and paints only the lines in the viewport, so scrolling costs
+    # the same in a multi-GB file as in a small one. The vertical scroll bar counts lines and grows while the file
+    # is indexed; a gutter shows line numbers and the current search match is highlighted.
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setObjectName("pagedTextView")
+        font = QFont("Consolas", 10); font.setStyleHint(QFont.StyleHint.Monospace); self.setFont(font)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self._file: Optional[LineIndexedFile] = None
+        self._match: Optional[Tuple[int, int, int]] = None # line, byte offset, byte length
+        self._content_width = 0 # Widest line painted so far, for the horizontal scroll bar
+
+    def set_file(self, line_file: Optional[LineIndexedFile]):
+        self._file = line_file; self._match = None; self._content_width = 0
+        self.verticalScrollBar().setValue(0); self.horizontalScrollBar().setValue(0); self.update_scroll_ranges()
+
+    def _visible_rows(self) -> int: return max(self.viewport().height() // self.fontMetrics().lineSpacing(), 1)
+    def _gutter_width(self) -> int:
+        return self.fontMetrics().horizontalAdvance("9" * len(str(max(self._file.line_count() if self._file else 0, 1)))) + VIEWER_TEXT_MARGIN * 2
+
+    def update_scroll_ranges(self):
+        lines = self._file.line_count() if self._file else 0; rows = self._visible_rows()
+        vertical = self.verticalScrollBar(); vertical.setPageStep(rows); vertical.setRange(0, min(max(lines - rows + 1, 0), 2**31 - 1))
+        horizontal = self.horizontalScrollBar(); width = self.viewport().width()
+        horizontal.setPageStep(width); horizontal.setSingleStep(self.fontMetrics().horizontalAdvance("M") * 4)
+        horizontal.setRange(0, max(self._content_width + self._gutter_width() + VIEWER_TEXT_MARGIN * 2 - width, 0))
+        self.viewport().update()
+
+    def show_match(self, offset: int, length: int):
+        # Scrolls the match at byte offset into view (unless it is already visible) and highlights it
+        line = self._file.line_of_offset(offset); self._match = (line, offset, length)
+        vertical = self.verticalScrollBar(); rows = self._visible_rows()
+        if not vertical.value() <= line < vertical.value() + rows - 1: vertical.setValue(max(line - rows // 3, 0))
+        prefix = self._file.decode(self._file.line_start(line), offset).expandtabs(VIEWER_TAB_WIDTH)
+        x = self.fontMetrics().horizontalAdvance(prefix); horizontal = self.horizontalScrollBar()
+        self._content_width = max(self._content_width, x + self.fontMetrics().horizontalAdvance("M") * 20); self.update_scroll_ranges()
+        visible_width = self.viewport().width() - self._gutter_width() - VIEWER_TEXT_MARGIN * 2
+        if not horizontal.value() <= x < horizontal.value() + visible_width - 40: horizontal.setValue(max(x - visible_width // 3, 0))
+        self.viewport().update()
+
+    def clear_match(self): self._match = None; self.viewport().update()
+
+    def scrollContentsBy(self, dx: int, dy: int): self.viewport().update()
+    def resizeEvent(self, event): super().resizeEvent(event); self.update_scroll_ranges()
+
+    def keyPressEvent(self, event):
+        vertical = self.verticalScrollBar()
+        if event.key() == Qt.Key.Key_Home: vertical.setValue(0)
+        elif event.key() == Qt.Key.Key_End: vertical.setValue(vertical.maximum())
+        else: super().keyPressEvent(event)
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport()); rect = self.viewport().rect()
+        painter.fillRect(rect, QColor(COLORS['cardBackground']))
+        if self._file is None: return
+        metrics = self.fontMetrics(); line_height = metrics.lineSpacing(); gutter = self._gutter_width()
+        first = self.verticalScrollBar().value(); x = gutter + VIEWER_TEXT_MARGIN - self.horizontalScrollBar().value()
+        lines = self._file.lines(first, self._visible_rows() + 1); widest = self._content_width
+        for row, text in enumerate(lines):
+            y = row * line_height; display = text.expandtabs(VIEWER_TAB_WIDTH)
+            if self._match is not None and self._match[0] == first + row:
+                line, offset, length = self._match; line_start = self._file.line_start(line)
+                prefix = self._file.decode(line_start, offset).expandtabs(VIEWER_TAB_WIDTH); matched = self._file.decode(offset, offset + length)
+                painter.fillRect(x + metrics.horizontalAdvance(prefix), y, max(metrics.horizontalAdvance(matched), 2), line_height, QColor(COLORS['primaryBlue']))
+            painter.setPen(QColor(COLORS['textPrimary'])); painter.drawText(x, y + metrics.ascent(), display)
+            widest = max(widest, metrics.horizontalAdvance(display))
+        painter.fillRect(0, 0, gutter, rect.height(), QColor(COLORS['groupBoxBackground']))
+        painter.setPen(QColor(COLORS['disabledText']))
+        for row in range(len(lines)):
+            painter.drawText(0, row * line_height, gutter - VIEWER_TEXT_MARGIN, line_height,
+                             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, str(first + row + 1))
+        painter.end()
+        if widest > self._content_width: self._content_width = widest; QTimer.singleShot(0, self.update_scroll_ranges)
+
 class ViewFileDialog(QDialog):
-    def __init__(self, file_path: str, content: str, parent: Optional[QWidget] = None):
+    # Pages through a file of any size with a PagedTextView while a LineIndexWorker indexes it. Find searches the
+    # raw bytes a slice per timer tick from the current match (or the top line), wrapping around once, so typing
+    # stays responsive however large the file. With part_paths (the parts of a sharded output, file_path among them)
+    # a combo box switches between the parts. decompress opens compressed generated outputs.
+    def __init__(self, file_path: str, parent: Optional[QWidget] = None, part_paths: Optional[List[str]] = None,
+                 decompress: bool = False):
         super().__init__(parent)
-        self.setWindowTitle(f"View File: {os.path.basename(file_path)}")
         self.setMinimumSize(600, 400)
         self.setGeometry(150, 150, 900, 700)
         layout = QVBoxLayout(self)
         layout.setContentsMargins(10, 10, 10, 10)
-        self.text_edit = QTextEdit()
-        self.text_edit.setPlainText(content)
-        self.text_edit.setReadOnly(True)
-        self.text_edit.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
-        font = QFont("Consolas", 10); font.setStyleHint(QFont.StyleHint.Monospace)
-        self.text_edit.setFont(font)
-        layout.addWidget(self.text_edit)
-        button_box_layout = QHBoxLayout(); button_box_layout.setContentsMargins(0, 5, 0, 0); button_box_layout.addStretch()
+        self._decompress = decompress
+        self._file: Optional[LineIndexedFile] = None; self._worker: Optional[LineIndexWorker] = None
+        self._search: Optional[Dict[str, Any]] = None; self._match_offset = -1
+        self._search_timer = QTimer(self); self._search_timer.timeout.connect(self._search_step)
+        if part_paths and len(part_paths) > 1:
+            part_layout = QHBoxLayout(); part_layout.addWidget(QLabel(f"Part ({len(part_paths)}):"))
+            self.part_combo = QComboBox()
+            for part_path in part_paths: self.part_combo.addItem(os.path.basename(part_path), part_path)
+            self.part_combo.setCurrentIndex(max(self.part_combo.findData(file_path), 0))
+            self.part_combo.currentIndexChanged.connect(self.show_part)
+            part_layout.addWidget(self.part_combo, 1); layout.addLayout(part_layout)
+        search_layout = QHBoxLayout()
+        self.search_input = QLineEdit(); self.search_input.setPlaceholderText("Find (Enter: next, Shift+Enter: previous)")
+        self.search_input.textChanged.connect(lambda: self.start_search(backwards=False, from_match=True))
+        self.search_input.returnPressed.connect(lambda: self.start_search(backwards=False))
+        QShortcut(QKeySequence("Shift+Return"), self.search_input, lambda: self.start_search(backwards=True), context=Qt.ShortcutContext.WidgetShortcut)
+        QShortcut(QKeySequence(QKeySequence.StandardKey.Find), self, lambda: (self.search_input.setFocus(), self.search_input.selectAll()))
+        self.match_case_checkbox = QCheckBox("Match case"); self.match_case_checkbox.toggled.connect(lambda: self.start_search(backwards=False, from_match=True))
+        previous_button = QPushButton("Previous"); previous_button.clicked.connect(lambda: self.start_search(backwards=True))
+        next_button = QPushButton("Next"); next_button.clicked.connect(lambda: self.start_search(backwards=False))
+        search_layout.addWidget(self.search_input, 1); search_layout.addWidget(self.match_case_checkbox)
+        search_layout.addWidget(previous_button); search_layout.addWidget(next_button); layout.addLayout(search_layout)
+        self.text_view = PagedTextView()
+        layout.addWidget(self.text_view)
+        button_box_layout = QHBoxLayout(); button_box_layout.setContentsMargins(0, 5, 0, 0)
+        self.status_label = QLabel(); button_box_layout.addWidget(self.status_label, 1)
+        self.copy_button = QPushButton("Copy All"); self.copy_button.clicked.connect(self.copy_all); button_box_layout.addWidget(self.copy_button)
         close_button = QPushButton("Close"); close_button.clicked.connect(self.accept)
-        button_box_layout.addWidget(close_button); button_box_layout.addStretch()
+        button_box_layout.addWidget(close_button)
         layout.addLayout(button_box_layout)
         self.setLayout(layout)
+        for button in (previous_button, next_button, self.copy_button, close_button): button.setAutoDefault(False) # Enter belongs to Find
+        self.open_file(file_path)
+
+    def open_file(self, file_path: str):
+        self._close_file()
+        self.setWindowTitle(f"View File: {os.path.basename(file_path)}")
+        self._file = LineIndexedFile(file_path, self._decompress); self.text_view.set_file(self._file)
+        self.copy_button.setEnabled(False); self.status_label.setText("Opening...")
+        self._worker = LineIndexWorker(self._file, self)
+        self._worker.file_opened.connect(self._file_opened); self._worker.progress_changed.connect(self._index_progress)
+        self._worker.finished.connect(self._index_finished); self._worker.start()
+        if self.search_input.text(): self.start_search(backwards=False)
+
+    def show_part(self, combo_index: int): self.open_file(self.part_combo.itemData(combo_index))
+
+    def _file_opened(self):
+        if self.sender() is not self._worker: return # A file closed since
+        self.copy_button.setEnabled(self._file.size <= VIEWER_COPY_MAX_BYTES)
+        self.copy_button.setToolTip("" if self.copy_button.isEnabled() else f"Files over {VIEWER_COPY_MAX_BYTES // (1024 * 1024)}MB can't be copied in one piece.")
+
+    def _index_progress(self, indexed_bytes: int, total_bytes: int):
+        if self.sender() is not self._worker: return
+        self.text_view.update_scroll_ranges()
+        if not self._search_timer.isActive():
+            self.status_label.setText(f"Indexing... {indexed_bytes * 100 // max(total_bytes, 1)}% ({self._file.line_count():,} lines so far)")
+
+    def _index_finished(self):
+        worker = self.sender()
+        if worker is not self._worker: return
+        if worker.error: self.status_label.setText(worker.error); return
+        self.text_view.update_scroll_ranges()
+        if not self._search_timer.isActive(): self.status_label.setText(self._file_summary())
+
+    def _file_summary(self) -> str:
+        summary = f"{self._file.line_count():,} lines, {self._file.size / (1024 * 1024):.1f}MB"
+        if self._file.binary: summary += ". This looks like a binary file; NUL bytes are shown as ␀."
+        return summary
+
+    def start_search(self, backwards: bool, from_match: bool = False):
+        # from_match (the query was edited) starts at the current match, so it grows in place; otherwise after it
+        # (or before it, backwards). Without a match, the search starts at the top visible line.
+        self._search_timer.stop(); text = self.search_input.text()
+        if not text or self._file is None or not self._file.size:
+            self._search = None; self._match_offset = -1; self.text_view.clear_match()
+            if self._file is not None and self._file.complete: self.status_label.setText(self._file_summary())
+            return
+        try: needle = text.encode(self._file.encoding)
+        except UnicodeEncodeError: self.status_label.setText(f"'{text}' can't occur in this {self._file.encoding} file."); return
+        if self._match_offset >= 0: origin = self._match_offset if from_match or backwards else self._match_offset + 1
+        else: origin = self._file.line_start(self.text_view.verticalScrollBar().value())
+        self._search = {'needle': needle, 'ignore_case': not self.match_case_checkbox.isChecked(), 'backwards': backwards,
+                        'origin': origin, 'position': origin, 'wrapped': False}
+        self._search_timer.start(0)
+
+    def _search_step(self):
+        # Scans VIEWER_SEARCH_CHUNK bytes; forward searches wait for the index to reach matches beyond it
+        search = self._search; line_file = self._file
+        if search is None or line_file is None: self._search_timer.stop(); return
+        needle = search['needle']; ignore_case = search['ignore_case']; position = search['position']
+        if search['backwards']:
+            floor = search['origin'] if search['wrapped'] else 0; start = max(position - VIEWER_SEARCH_CHUNK, floor)
+            offset = line_file.find(needle, start, position, ignore_case, backwards=True) if position > start else -1
+            search['position'] = start
+            if offset < 0 and start <= floor:
+                if search['wrapped']: self._search_finished(-1); return
+                search['wrapped'] = True; search['position'] = line_file.indexed_bytes
+        else:
+            limit = search['origin'] if search['wrapped'] else line_file.indexed_bytes; end = min(position + VIEWER_SEARCH_CHUNK, limit)
+            offset = line_file.find(needle, position, end, ignore_case) if end > position else -1
+            search['position'] = max(end, position)
+            if offset < 0 and end >= limit:
+                if search['wrapped']: self._search_finished(-1); return
+                if not line_file.complete: self._search_timer.setInterval(50); self.status_label.setText("Searching... (waiting for the index)"); return
+                search['wrapped'] = True; search['position'] = 0
+        if offset >= 0: self._search_finished(offset); return
+        self._search_timer.setInterval(0)
+        self.status_label.setText(f"Searching... {'(wrapped) ' if search['wrapped'] else ''}line {line_file.line_of_offset(min(search['position'], max(line_file.indexed_bytes - 1, 0))):,}")
+
+    def _search_finished(self, offset: int):
+        self._search_timer.stop(); search = self._search; self._search = None
+        if offset < 0:
+            self._match_offset = -1; self.text_view.clear_match()
+            self.status_label.setText(f"No matches for '{self.search_input.text()}'."); return
+        self._match_offset = offset; self.text_view.show_match(offset, len(search['needle']))
+        self.status_label.setText(f"Match on line {self._file.line_of_offset(offset) + 1:,}{' (wrapped around)' if search['wrapped'] else ''}.")
+
+    def copy_all(self):
+        if self._file is not None and self._file.size <= VIEWER_COPY_MAX_BYTES: QApplication.clipboard().setText(self._file.decode(0, self._file.size))
+
+    def _close_file(self):
+        self._search_timer.stop(); self._search = None; self._match_offset = -1
+        if self._worker is not None: self._worker.cancel(); self._worker.wait(); self._worker = None
+        self.text_view.set_file(None)
+        if self._file is not None: self._file.close(); self._file = None
+
+    def done(self, result: int):
+        self._close_file(); super().done(result)
 
 # --- PyQt6 GUI Application ---
+class ProjectTreeModel(QAbstractItemModel):
+    # Single-column tree read straight from a ProjectItemStore. A folder's rows are only materialised (dirs first,
+    # then files, case-insensitive) when the view expands it, through canFetchMore/fetchMore. Check states are derived
+    # from the store's selection flags and counters (a folder with some of its files checked is partially checked),
+    # and internal ids are store indexes, so no per-row objects are kept. Binaries are greyed out once a background
+    # sniff (FileSniffWorker) has flagged them in the store; painting never reads files.
+    _ROOT = -1 # Key of the invisible root in _rows
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self._store = ProjectItemStore()
+        self._rows: Dict[int, List[int]] = {self._ROOT: []} # Fetched folder -> sorted child store indexes
+        self._row_of: Dict[int, int] = {} # Store index -> row within its (fetched) parent
+        self._loading: Set[int] = set() # Folders a background load hasn't read yet; shown as expandable
+        self._binary_brush = QBrush(QColor(COLORS['disabledText']))
+        self._highlighted: Set[int] = set() # Content search matches and the folders above them
+        self._highlight_brush = QBrush(QColor(COLORS['lightBlue']))
+        self._highlight_font = QFont(); self._highlight_font.setBold(True)
+
+    def store(self) -> ProjectItemStore: return self._store
+
+    def set_store(self, store: ProjectItemStore):
+        self.beginResetModel()
+        self._store = store
+        self._rows = {self._ROOT: [0] if store.paths else []}
+        self._row_of = {0: 0} if store.paths else {}
+        self._loading = set(); self._highlighted = set()
+        self.endResetModel()
+
+    def mark_loading(self, store_indexes: Iterable[int]): self._loading.update(store_indexes)
+    def loading_finished(self): self._loading.clear()
+
+    def clear(self): self.set_store(ProjectItemStore())
+
+    def _sort_key(self, index: int) -> Tuple[bool, str]:
+        return (not self._store.is_dir(index), self._store.names[index].lower())
+
+    def _renumber(self, rows: List[int], start: int):
+        for row in range(start, len(rows)): self._row_of[rows[row]] = row
+
+    def item_text(self, index: int) -> str:
+        store = self._store
+        path = store.paths[index]; name = store.names[index]
+        prefix = ""; display_text = name
+        if store.is_dir(index):
+            if store.is_error(index):
+                prefix = ICON_MAP.get('error', '⚠️')
+                display_text = f"{name} (Error: {store.errors.get(index, 'Access Denied')})"
+            else: prefix = ICON_MAP.get('dir', '📁')
+        else:
+            extension_or_type = get_file_extension(path)
+            prefix = ICON_MAP.get(extension_or_type, ICON_MAP.get('default', '📄'))
+        return f"{prefix} {display_text}"
+
+    def store_index(self, index: QModelIndex) -> Optional[int]:
+        return index.internalId() if index.isValid() else None
+
+    def index_for(self, store_index: int) -> QModelIndex:
+        # Model index of a store entry, or an invalid index while its folder hasn't been fetched
+        row = self._row_of.get(store_index)
+        return self.createIndex(row, 0, store_index) if row is not None else QModelIndex()
+
+    # --- QAbstractItemModel interface ---
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        rows = self._rows.get(parent.internalId() if parent.isValid() else self._ROOT)
+        if column != 0 or rows is None or not 0 <= row < len(rows): return QModelIndex()
+        return self.createIndex(row, 0, rows[row])
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        if not index.isValid(): return QModelIndex()
+        parent_index = self._store.parents[index.internalId()]
+        return self.index_for(parent_index) if parent_index >= 0 else QModelIndex()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid() and parent.column() != 0: return 0
+        return len(self._rows.get(parent.internalId() if parent.isValid() else self._ROOT, ()))
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int: return 1
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if not parent.isValid(): return bool(self._rows[self._ROOT])
+        index = parent.internalId()
+        if index in self._rows: return bool(self._rows[index])
+        return index in self._loading or (self._store.is_dir(index) and self._store.has_children(index))
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if not parent.isValid(): return False
+        index = parent.internalId()
+        return index not in self._rows and (index in self._loading or (self._store.is_dir(index) and self._store.has_children(index)))
+
+    def fetchMore(self, parent: QModelIndex):
+        if not self.canFetchMore(parent): return
+        index = parent.internalId()
+        children = sorted(self._store.children(index), key=self._sort_key)
+        if not children: self._rows[index] = []; return # Still loading; its entries are inserted as they arrive
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        self._rows[index] = children; self._renumber(children, 0)
+        self.endInsertRows()
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid(): return Qt.ItemFlag.NoItemFlags
+        item_flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if not self._store.is_error(index.internalId()): item_flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return item_flags
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid(): return None
+        store_index = index.internalId()
+        if role == Qt.ItemDataRole.DisplayRole: return self.item_text(store_index)
+        if role == Qt.ItemDataRole.CheckStateRole:
+            if self._store.is_error(store_index): return None
+            state = self._store.check_state(store_index)
+            if state is None: return Qt.CheckState.PartiallyChecked
+            return Qt.CheckState.Checked if state else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.UserRole: return store_index
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if self._store.is_binary(store_index): return self._binary_brush
+            return self._highlight_brush if store_index in self._highlighted else None
+        if role == Qt.ItemDataRole.FontRole: return self._highlight_font if store_index in self._highlighted else None
+        if role == Qt.ItemDataRole.ToolTipRole and self._store.is_binary(store_index): return "Binary file (skipped when generating)"
+        return None
+
+    def set_sniffed(self, sniffs: Iterable[Tuple[int, bool]]):
+        # Records (store index, is binary) pairs from a background sniff and repaints the binaries on screen, one
+        # signal per folder spanning their rows
+        store = self._store; row_ranges: Dict[int, List[int]] = {}
+        for store_index, binary in sniffs:
+            store.mark_sniffed(store_index, binary)
+            row = self._row_of.get(store_index)
+            if not binary or row is None: continue
+            row_range = row_ranges.setdefault(store.parents[store_index], [row, row])
+            row_range[0] = min(row_range[0], row); row_range[1] = max(row_range[1], row)
+        for parent_index, (first, last) in row_ranges.items():
+            rows = self._rows[parent_index]
+            self.dataChanged.emit(self.createIndex(first, 0, rows[first]), self.createIndex(last, 0, rows[last]),
+                                  [Qt.ItemDataRole.ForegroundRole, Qt.ItemDataRole.ToolTipRole])
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.ItemDataRole.EditRole) -> bool:
+        if role != Qt.ItemDataRole.CheckStateRole or not index.isValid(): return False
+        store_index = index.internalId()
+        if self._store.is_error(store_index): return False
+        checked = Qt.CheckState(value) != Qt.CheckState.Unchecked # Clicking a partially checked folder checks all of it
+        if self._store.is_dir(store_index): # A folder's check state applies to everything below it
+            self._store.set_subtree_selected(store_index, checked); self.refresh_check_states(store_index)
+        else:
+            self._store.set_selected(store_index, checked)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.CheckStateRole]); self.refresh_ancestor_check_states(store_index)
+        return True
+
+    def set_highlighted(self, store_indexes: Iterable[int]):
+        # Highlights content search matches and the folders above them, so matches in collapsed folders can be found
+        highlighted: Set[int] = set(); parents = self._store.parents
+        for store_index in store_indexes:
+            while store_index >= 0 and store_index not in highlighted: highlighted.add(store_index); store_index = parents[store_index]
+        changed = highlighted ^ self._highlighted; self._highlighted = highlighted
+        for store_index in changed:
+            if store_index in self._row_of:
+                model_index = self.index_for(store_index)
+                self.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.ForegroundRole, Qt.ItemDataRole.FontRole])
+
+    def refresh_ancestor_check_states(self, store_index: int):
+        # Repaints the folders above an entry, whose check states follow the counters of the files below them
+        parents = self._store.parents; store_index = parents[store_index]
+        while store_index >= 0:
+            if store_index in self._row_of:
+                model_index = self.index_for(store_index)
+                self.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.CheckStateRole])
+            store_index = parents[store_index]
+
+    def refresh_check_states(self, store_index: int = 0):
+        # Repaints the check boxes of an entry, its fetched descendants (one signal per folder) and the folders
+        # above it after a selection change in the store
+        self.refresh_ancestor_check_states(store_index)
+        if store_index in self._row_of:
+            model_index = self.index_for(store_index)
+            self.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.CheckStateRole])
+        stack = [store_index]
+        while stack:
+            rows = self._rows.get(stack.pop())
+            if not rows: continue
+            self.dataChanged.emit(self.createIndex(0, 0, rows[0]), self.createIndex(len(rows) - 1, 0, rows[-1]),
+                                  [Qt.ItemDataRole.CheckStateRole])
+            stack.extend(child for child in rows if child in self._rows)
+
+    # --- Incremental updates (watch mode) ---
+    def children_added(self, parent_index: int, child_indexes: Iterable[int]):
+        # Shows new children of a store entry (and, lazily, anything scanned below them) if the folder is on screen
+        child_indexes = sorted(child_indexes, key=self._sort_key)
+        rows = self._rows.get(parent_index)
+        was_loading = parent_index in self._loading; self._loading.discard(parent_index)
+        if not child_indexes: return
+        if rows is None:
+            # An unfetched folder that was empty until now gets its rows here, so the view learns it has children.
+            # Folders that were still loading already show as expandable and are simply fetched later.
+            if was_loading or parent_index not in self._row_of or len(self._store.children(parent_index)) != len(child_indexes): return
+            rows = self._rows[parent_index] = []
+        parent = self.index_for(parent_index)
+        if not rows:
+            self.beginInsertRows(parent, 0, len(child_indexes) - 1)
+            rows.extend(child_indexes); self._renumber(rows, 0)
+            self.endInsertRows(); return
+        for store_index in child_indexes:
+            row = bisect.bisect_left(rows, self._sort_key(store_index), key=self._sort_key)
+            self.beginInsertRows(parent, row, row)
+            rows.insert(row, store_index); self._renumber(rows, row)
+            self.endInsertRows()
+
+    def remove_entry(self, store_index: int):
+        # Removes an entry and its subtree from the store, and its row if it is on screen
+        parent_index = self._store.parents[store_index]
+        rows = self._rows.get(parent_index); row = self._row_of.get(store_index)
+        if rows is not None and row is not None: self.beginRemoveRows(self.index_for(parent_index), row, row)
+        for removed_index in self._store.remove_subtree(store_index):
+            self._rows.pop(removed_index, None); self._row_of.pop(removed_index, None)
+        if rows is not None and row is not None:
+            del rows[row]; self._renumber(rows, row)
+            self.endRemoveRows()
+
+    def rename_entry(self, store_index: int, new_name: str) -> List[int]:
+        # Renames an entry in the store and moves its row to the new sorted position; descendants keep their
+        # rows (and the view its expansion state) because store indexes don't change on rename.
+        affected = self._store.rename(store_index, new_name)
+        parent_index = self._store.parents[store_index]
+        rows = self._rows.get(parent_index); old_row = self._row_of.get(store_index)
+        if rows is None or old_row is None: return affected
+        others = rows[:old_row] + rows[old_row + 1:]
+        new_row = bisect.bisect_left(others, self._sort_key(store_index), key=self._sort_key)
+        if new_row != old_row:
+            parent = self.index_for(parent_index)
+            self.beginMoveRows(parent, old_row, old_row, parent, new_row if new_row < old_row else new_row + 1)
+            others.insert(new_row, store_index); rows[:] = others; self._renumber(rows, min(old_row, new_row))
+            self.endMoveRows()
+        model_index = self.index_for(store_index)
+        self.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.DisplayRole])
+        return affected
+
+class ProjectScanWorker(QThread):
+    # Reads the project's directories off the GUI thread and hands them over in batches. The GUI thread owns the
+    # ProjectItemStore and appends each batch itself, so the store and the tree model are never shared across threads.
+    batch_ready = pyqtSignal(object) # List of (dir_rel, (dirs, descend, files))
+
+    def __init__(self, project_path_abs: str, gitignore: Optional[GitIgnoreMatcher] = None,
+                 max_workers: int = SCAN_MAX_WORKERS, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.project_path_abs = project_path_abs; self.gitignore = gitignore; self.max_workers = max_workers
+        self.directories_read = 0; self.error: Optional[str] = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self): self._cancel_event.set()
+    def is_cancelled(self) -> bool: return self._cancel_event.is_set()
+
+    def run(self):
+        batch: List[Tuple[str, Tuple[List[str], List[str], List[str]]]] = []; last_emit = time.perf_counter()
+        try:
+            for listing in iter_directory_listings(self.project_path_abs, "", self.max_workers, None, self.gitignore, self._cancel_event):
+                batch.append(listing); self.directories_read += 1
+                now = time.perf_counter()
+                if now - last_emit >= SCAN_BATCH_INTERVAL_S: self.batch_ready.emit(batch); batch = []; last_emit = now
+            if batch and not self.is_cancelled(): self.batch_ready.emit(batch)
+        except Exception as e: self.error = f"An unexpected error occurred while scanning: {type(e).__name__}: {e}"
+
+class FileSizeWorker(QThread):
+    # Stats files off the GUI thread for the selection totals; (store indexes, sizes) batches are handed over
+    # every SCAN_BATCH_INTERVAL_S and applied to the store by the GUI thread
+    batch_ready = pyqtSignal(object) # (List of store indexes, List of results)
+
+    def __init__(self, project_path_abs: str, store_indexes: List[int], relative_filepaths: List[str], parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.project_path_abs = project_path_abs; self.store_indexes = store_indexes; self.relative_filepaths = relative_filepaths
+        self._cancel_event = threading.Event()
+
+    def cancel(self): self._cancel_event.set()
+    def is_cancelled(self) -> bool: return self._cancel_event.is_set()
+
+    def iter_results(self) -> Iterator[List[Any]]:
+        return iter_file_sizes(self.project_path_abs, self.relative_filepaths, cancel_event=self._cancel_event)
+
+    def run(self):
+        done = 0; pending: List[Any] = []; last_emit = time.perf_counter()
+        for results in self.iter_results():
+            pending.extend(results)
+            now = time.perf_counter()
+            if now - last_emit >= SCAN_BATCH_INTERVAL_S:
+                self.batch_ready.emit((self.store_indexes[done:done + len(pending)], pending))
+                done += len(pending); pending = []; last_emit = now
+        if pending and not self.is_cancelled(): self.batch_ready.emit((self.store_indexes[done:done + len(pending)], pending))
+
+class FileSniffWorker(FileSizeWorker):
+    # Sniffs files (their first few KB) off the GUI thread so the tree can grey out binaries; batches are
+    # (store indexes, is binary) and are applied through the tree model
+    def iter_results(self) -> Iterator[List[Any]]:
+        return iter_file_sniffs(self.project_path_abs, self.relative_filepaths, cancel_event=self._cancel_event)
+
+class ContentIndexWorker(QThread):
+    # Loads a project's saved ContentIndex (when load_saved) and brings it up to date with the project's files off
+    # the GUI thread. What was indexed is saved even if the update is cancelled.
+    progress_changed = pyqtSignal(int, int) # files indexed, files to index
+
+    def __init__(self, index: ContentIndex, relative_filepaths: List[str], load_saved: bool, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.index = index; self.relative_filepaths = relative_filepaths; self.load_saved = load_saved
+        self.changes: Tuple[int, int] = (0, 0); self.elapsed = 0.0; self.error: Optional[str] = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self): self._cancel_event.set()
+    def is_cancelled(self) -> bool: return self._cancel_event.is_set()
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            if self.load_saved: self.index.load()
+            self.changes = self.index.update(self.relative_filepaths, cancel=self._cancel_event, progress=self.progress_changed.emit)
+            self.index.save()
+        except Exception as e: self.error = f"Content index failed: {type(e).__name__}: {e}"
+        self.elapsed = time.perf_counter() - started
+
+class ContentSearchWorker(QThread):
+    # Runs one ContentIndex.search off the GUI thread (confirming candidates reads files); matching paths are left
+    # in self.matches
+    def __init__(self, index: ContentIndex, query: str, regex: bool, match_case: bool, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.index = index; self.query = query; self.regex = regex; self.match_case = match_case
+        self.matches: List[str] = []; self.elapsed = 0.0; self.error: Optional[str] = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self): self._cancel_event.set()
+
+    def run(self):
+        started = time.perf_counter()
+        try: self.matches = self.index.search(self.query, self.regex, self.match_case, cancel=self._cancel_event)
+        except re.error as e: self.error = f"Invalid regex: {e}"
+        except Exception as e: self.error = f"Search failed: {type(e).__name__}: {e}"
+        self.elapsed = time.perf_counter() - started
+
+class ContextGenerationWorker(QThread):
+    # Runs generate_text_from_selected_files off the GUI thread. Progress is throttled to a few updates a second;
+    # the result tuple is left in self.result for the finished handler.
+    progress_changed = pyqtSignal(int, int, int, float) # files_done, files_total, chars_done, elapsed seconds
+
+    def __init__(self, project_path: str, relative_filepaths: List[str], custom_filename_base: Optional[str],
+                 max_workers: int, cache: Optional[RenderedBlockCache], tokenizer_path: Optional[str] = None,
+                 token_budget: Optional[TokenBudget] = None, large_files: Optional[LargeFilePolicy] = None,
+                 output_format: str = DEFAULT_OUTPUT_FORMAT.name, compression: Optional[str] = None,
+                 shard_limit: Optional[ShardLimit] = None, deduplicate: bool = False,
+                 transforms: Optional[TransformPolicy] = None, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.project_path = project_path; self.relative_filepaths = relative_filepaths
+        self.custom_filename_base = custom_filename_base; self.max_workers = max_workers; self.cache = cache
+        self.tokenizer_path = tokenizer_path # None counts tokens as chars/4
+        self.token_budget = token_budget
+        self.large_files = large_files or LargeFilePolicy()
+        self.output_format = output_format; self.compression = compression # OUTPUT_FORMATS and COMPRESSIONS keys
+        self.shard_limit = shard_limit # None writes a single file
+        self.deduplicate = deduplicate; self.transforms = transforms
+        self.stats: Dict[str, Any] = {}
+        self.result: Tuple[Optional[str], str, int, int] = (None, "Generation did not run.", 0, 0)
+        self._cancel_event = threading.Event()
+        self._started = 0.0; self._last_progress = 0.0
+
+    def cancel(self): self._cancel_event.set()
+    def is_cancelled(self) -> bool: return self._cancel_event.is_set()
+
+    def _report(self, files_done: int, files_total: int, chars_done: int):
+        now = time.perf_counter()
+        if now - self._last_progress < 0.1 and files_done < files_total: return
+        self._last_progress = now
+        self.progress_changed.emit(files_done, files_total, chars_done, now - self._started)
+
+    def run(self):
+        self._started = time.perf_counter()
+        try:
+            token_counter = TokenCounter(load_tokenizer(self.tokenizer_path), self.cache) if self.tokenizer_path else None
+        except (OSError, ValueError) as e:
+            self.result = (None, f"Error loading tokenizer: {e}", 0, 0); return
+        try:
+            self.result = generate_text_from_selected_files(
+                self.project_path, self.relative_filepaths, self.custom_filename_base, max_workers=self.max_workers,
+                cache=self.cache, stats=self.stats, progress=self._report, cancel_event=self._cancel_event,
+                token_counter=token_counter, token_budget=self.token_budget, large_files=self.large_files,
+                output_format=OUTPUT_FORMATS[self.output_format], compression=self.compression, shard_limit=self.shard_limit,
+                deduplicate=self.deduplicate, transforms=self.transforms)
+        except Exception as e: self.result = (None, f"Unexpected error during generation: {type(e).__name__}: {e}", 0, 0)
+
 class ProjectContextGenerator(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -506,10 +935,22 @@ class ProjectContextGenerator(QMainWindow):
         self.path_input.setPlaceholderText("Enter project path or browse...")
         browse_button = QPushButton("Browse...")
         load_button = QPushButton("Load Project")
+        self.respect_gitignore_checkbox = QCheckBox("Respect .gitignore")
+        self.respect_gitignore_checkbox.setToolTip("Hide files matched by the project's .gitignore/.ignore files (applies on next load).")
+        self.respect_gitignore_checkbox.setChecked(self.settings.value(SETTINGS_RESPECT_GITIGNORE, True, type=bool))
         path_layout.addWidget(QLabel("Project Path:"))
         path_layout.addWidget(self.path_input, 1)
         path_layout.addWidget(browse_button)
         path_layout.addWidget(load_button)
+        self.cancel_load_button = QPushButton("Cancel")
+        self.cancel_load_button.setToolTip("Stop loading the project; entries found so far stay in the tree.")
+        self.cancel_load_button.setEnabled(False)
+        path_layout.addWidget(self.cancel_load_button)
+        path_layout.addWidget(self.respect_gitignore_checkbox)
+        self.watch_checkbox = QCheckBox("Watch for changes")
+        self.watch_checkbox.setToolTip("Update the tree in place when files are added, removed or renamed on disk.")
+        self.watch_checkbox.setChecked(self.settings.value(SETTINGS_WATCH_PROJECT, False, type=bool))
+        path_layout.addWidget(self.watch_checkbox)
         top_panel_layout.addLayout(path_layout)
         self.main_layout.addWidget(self.top_group_box, 1) # Stretch factor 1
 
@@ -523,13 +964,37 @@ class ProjectContextGenerator(QMainWindow):
         tree_and_selection_layout.setContentsMargins(10, 20, 10, 10)
         tree_and_selection_layout.setSpacing(6)
         
-        self.tree_model = QStandardItemModel()
+        content_search_layout = QHBoxLayout()
+        content_search_layout.setSpacing(6)
+        self.content_index_checkbox = QCheckBox("Index contents")
+        self.content_index_checkbox.setToolTip("Keep a trigram index of the project's text files (updated in the background after each load) to find files by their contents.")
+        self.content_index_checkbox.setChecked(self.settings.value(SETTINGS_CONTENT_INDEX, False, type=bool))
+        self.content_search_input = QLineEdit()
+        self.content_search_input.setPlaceholderText("Find files containing... (e.g., PaymentGateway)")
+        self.content_search_regex_checkbox = QCheckBox("Regex")
+        self.content_search_case_checkbox = QCheckBox("Match case")
+        self.check_matches_button = QPushButton("Check Matches")
+        self.check_matches_button.setToolTip("Check every file that matches the search (other checks are kept).")
+        self.check_matches_button.setEnabled(False)
+        self.content_search_status = QLabel("")
+        content_search_layout.addWidget(self.content_index_checkbox)
+        content_search_layout.addWidget(self.content_search_input, 1)
+        content_search_layout.addWidget(self.content_search_regex_checkbox)
+        content_search_layout.addWidget(self.content_search_case_checkbox)
+        content_search_layout.addWidget(self.check_matches_button)
+        content_search_layout.addWidget(self.content_search_status)
+        tree_and_selection_layout.addLayout(content_search_layout)
+
+        self.tree_model = ProjectTreeModel(self)
         self.tree_view = QTreeView()
         self.tree_view.setModel(self.tree_model)
         self.tree_view.setHeaderHidden(True)
         self.tree_view.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.tree_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         tree_and_selection_layout.addWidget(self.tree_view, 1) 
+        self.selection_summary_label = QLabel("")
+        self.selection_summary_label.setToolTip("Checked files, their size on disk and an estimate of their tokens (bytes / 4). Binaries and files skipped while generating are included.")
+        tree_and_selection_layout.addWidget(self.selection_summary_label)
 
         selection_button_layout = QHBoxLayout()
         selection_button_layout.setSpacing(6)
@@ -540,8 +1005,19 @@ class ProjectContextGenerator(QMainWindow):
         self.toggle_fullscreen_button = QPushButton("Toggle Fullscreen Tree") # New button
         self._is_tree_fullscreen = False # State variable for fullscreen toggle
 
+        self.profile_combo = QComboBox()
+        self.profile_combo.setToolTip("Selection profiles of this project. Picking one re-applies its checks; the last one picked is applied again on every load.")
+        self.profile_combo.setMinimumWidth(160)
+        self.save_profile_button = QPushButton("Save Profile...")
+        self.save_profile_button.setToolTip("Save the current checks as a named profile (stored as folder rules, so new files in checked folders are included).")
+        self.delete_profile_button = QPushButton("Delete Profile")
+
         selection_button_layout.addWidget(self.select_all_button)
         selection_button_layout.addWidget(self.deselect_all_button)
+        selection_button_layout.addWidget(QLabel("Profile:"))
+        selection_button_layout.addWidget(self.profile_combo)
+        selection_button_layout.addWidget(self.save_profile_button)
+        selection_button_layout.addWidget(self.delete_profile_button)
         selection_button_layout.addStretch(1) 
         selection_button_layout.addWidget(self.copy_names_button) 
         selection_button_layout.addWidget(self.toggle_fullscreen_button) # Add toggle button
@@ -559,11 +1035,95 @@ class ProjectContextGenerator(QMainWindow):
         self.output_filename_input = QLineEdit()
         self.output_filename_input.setPlaceholderText("e.g., my_project_context (optional)")
         filename_input_layout.addWidget(self.output_filename_input, 1)
+        filename_input_layout.addWidget(QLabel("Read Workers:"))
+        self.generation_workers_spinbox = QSpinBox()
+        self.generation_workers_spinbox.setRange(1, 64)
+        self.generation_workers_spinbox.setToolTip("Files read and rendered concurrently while generating (1 = sequential).")
+        self.generation_workers_spinbox.setValue(self.settings.value(SETTINGS_GENERATION_WORKERS, GENERATION_MAX_WORKERS, type=int))
+        filename_input_layout.addWidget(self.generation_workers_spinbox)
+        filename_input_layout.addWidget(QLabel("Tokenizer:"))
+        self.tokenizer_combo = QComboBox()
+        self.tokenizer_combo.setToolTip("Tokenizer used to count tokens. Local BPE tokenizers are read from the 'tokenizers' folder.")
+        self.tokenizer_combo.addItem("Approximate (chars/4)", "")
+        for tokenizer_name, tokenizer_path in available_tokenizers().items(): self.tokenizer_combo.addItem(tokenizer_name, tokenizer_path)
+        saved_tokenizer_index = self.tokenizer_combo.findText(self.settings.value(SETTINGS_TOKENIZER, "", type=str))
+        if saved_tokenizer_index > 0: self.tokenizer_combo.setCurrentIndex(saved_tokenizer_index)
+        filename_input_layout.addWidget(self.tokenizer_combo)
+        filename_input_layout.addWidget(QLabel("Format:"))
+        self.output_format_combo = QComboBox()
+        self.output_format_combo.setToolTip("text: fenced blocks; xml: <file> elements; jsonl: one JSON object per file; minimal: '==> path <==' lines.")
+        self.output_format_combo.addItems(list(OUTPUT_FORMATS))
+        self.output_format_combo.setCurrentIndex(max(self.output_format_combo.findText(self.settings.value(SETTINGS_OUTPUT_FORMAT, DEFAULT_OUTPUT_FORMAT.name, type=str)), 0))
+        filename_input_layout.addWidget(self.output_format_combo)
+        self.compression_combo = QComboBox()
+        self.compression_combo.setToolTip("Compress the output file while it is written (zstd needs Python 3.14+ or the 'zstandard' package).")
+        self.compression_combo.addItem("Uncompressed", "")
+        for compression_name in COMPRESSIONS: self.compression_combo.addItem(compression_name, compression_name)
+        self.compression_combo.setCurrentIndex(max(self.compression_combo.findData(self.settings.value(SETTINGS_COMPRESSION, "", type=str)), 0))
+        filename_input_layout.addWidget(self.compression_combo)
         output_group_layout.addLayout(filename_input_layout)
 
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Token Budget:"))
+        self.token_budget_spinbox = QSpinBox()
+        self.token_budget_spinbox.setRange(0, 100_000_000); self.token_budget_spinbox.setSingleStep(1000)
+        self.token_budget_spinbox.setSpecialValueText("No limit")
+        self.token_budget_spinbox.setToolTip("Keep only the most valuable selected files that fit in this many tokens; the dropped ones are listed in the header.")
+        self.token_budget_spinbox.setValue(self.settings.value(SETTINGS_TOKEN_BUDGET, 0, type=int))
+        budget_layout.addWidget(self.token_budget_spinbox)
+        budget_layout.addWidget(QLabel("Priorities:"))
+        self.budget_priorities_input = QLineEdit()
+        self.budget_priorities_input.setPlaceholderText("e.g., src/*=3, *.md=2, tests/*=0.5 (first match wins, 0 leaves files out)")
+        self.budget_priorities_input.setText(self.settings.value(SETTINGS_BUDGET_PRIORITIES, "", type=str))
+        budget_layout.addWidget(self.budget_priorities_input, 1)
+        budget_layout.addWidget(QLabel("Large Files:"))
+        self.large_file_mode_combo = QComboBox()
+        self.large_file_mode_combo.addItems(list(LARGE_FILE_MODES))
+        self.large_file_mode_combo.setToolTip(f"Files over {MAX_FILE_SIZE_READ // 1024}KB: keep their first and last lines (or tokens), or leave them out.")
+        saved_mode_index = self.large_file_mode_combo.findText(self.settings.value(SETTINGS_LARGE_FILE_MODE, "Skip", type=str))
+        self.large_file_mode_combo.setCurrentIndex(max(saved_mode_index, 0))
+        budget_layout.addWidget(self.large_file_mode_combo)
+        self.large_file_head_spinbox = QSpinBox(); self.large_file_tail_spinbox = QSpinBox()
+        for spinbox, prefix, setting, default in ((self.large_file_head_spinbox, "Head ", SETTINGS_LARGE_FILE_HEAD, LARGE_FILE_HEAD),
+                                                  (self.large_file_tail_spinbox, "Tail ", SETTINGS_LARGE_FILE_TAIL, LARGE_FILE_TAIL)):
+            spinbox.setRange(0, 1_000_000); spinbox.setPrefix(prefix)
+            spinbox.setValue(self.settings.value(setting, default, type=int))
+            budget_layout.addWidget(spinbox)
+        self.large_file_mode_combo.currentTextChanged.connect(self.update_large_file_controls); self.update_large_file_controls()
+        budget_layout.addWidget(QLabel("Split Parts:"))
+        self.shard_limit_spinbox = QSpinBox()
+        self.shard_limit_spinbox.setRange(0, 100_000_000); self.shard_limit_spinbox.setSingleStep(1000)
+        self.shard_limit_spinbox.setSpecialValueText("Single file")
+        self.shard_limit_spinbox.setToolTip("Split the output into name_part01, name_part02, ... each at most this size. Files are never split unless one alone is over the limit.")
+        self.shard_limit_spinbox.setValue(self.settings.value(SETTINGS_SHARD_LIMIT, 0, type=int))
+        budget_layout.addWidget(self.shard_limit_spinbox)
+        self.shard_unit_combo = QComboBox(); self.shard_unit_combo.addItems(list(SHARD_UNITS))
+        self.shard_unit_combo.setCurrentIndex(max(self.shard_unit_combo.findText(self.settings.value(SETTINGS_SHARD_UNIT, SHARD_UNITS[0], type=str)), 0))
+        budget_layout.addWidget(self.shard_unit_combo)
+        self.deduplicate_checkbox = QCheckBox("Deduplicate")
+        self.deduplicate_checkbox.setToolTip("Write files with the same contents as an earlier file as '(identical to ...)' instead of repeating them.")
+        self.deduplicate_checkbox.setChecked(self.settings.value(SETTINGS_DEDUPLICATE, False, type=bool))
+        budget_layout.addWidget(self.deduplicate_checkbox)
+        output_group_layout.addLayout(budget_layout)
+
+        transform_layout = QHBoxLayout()
+        transform_layout.addWidget(QLabel("Transforms:"))
+        self.transforms_input = QLineEdit()
+        self.transforms_input.setPlaceholderText("e.g., py,js,go=comments,license,blank_lines; *=blank_lines (optional)")
+        self.transforms_input.setToolTip(f"Token-reducing rewrites per file extension, rules separated by ';'. Transforms: {', '.join(TRANSFORMS)}.")
+        self.transforms_input.setText(self.settings.value(SETTINGS_TRANSFORMS, "", type=str))
+        transform_layout.addWidget(self.transforms_input, 1)
+        output_group_layout.addLayout(transform_layout)
+
+        generate_layout = QHBoxLayout()
         self.generate_button = QPushButton("Generate Context File")
         self.generate_button.setObjectName("generateButton")
-        output_group_layout.addWidget(self.generate_button)
+        generate_layout.addWidget(self.generate_button, 1)
+        self.cancel_generation_button = QPushButton("Cancel Generation")
+        self.cancel_generation_button.setToolTip("Stop generating; no partial output file is kept.")
+        self.cancel_generation_button.setEnabled(False)
+        generate_layout.addWidget(self.cancel_generation_button)
+        output_group_layout.addLayout(generate_layout)
 
         output_actions_layout = QHBoxLayout()
         output_actions_layout.setSpacing(6)
@@ -591,7 +1151,7 @@ class ProjectContextGenerator(QMainWindow):
         # --- Connections ---
         browse_button.clicked.connect(self.browse_directory)
         load_button.clicked.connect(self.load_project_files)
-        self.tree_model.itemChanged.connect(self.handle_item_changed)
+        self.cancel_load_button.clicked.connect(self.cancel_project_load)
         self.select_all_button.clicked.connect(lambda: self.update_all_selections(True))
         self.deselect_all_button.clicked.connect(lambda: self.update_all_selections(False))
         self.copy_names_button.clicked.connect(self.copy_selected_file_names) 
@@ -599,14 +1159,57 @@ class ProjectContextGenerator(QMainWindow):
         self.toggle_fullscreen_button.clicked.connect(self.toggle_tree_fullscreen) # Connect new button
         
         self.generate_button.clicked.connect(self.generate_context_file)
+        self.cancel_generation_button.clicked.connect(self.cancel_generation)
         self.open_output_folder_button.clicked.connect(self.open_output_folder)
         self.view_generated_file_button.clicked.connect(self.view_generated_file)
         self.tree_view.doubleClicked.connect(self.handle_tree_double_click)
 
         self._project_path: str = ""
-        self._all_items_data: List[Dict[str, Any]] = []
-        self._in_item_change_handler = False
+        self._all_items_data = self.tree_model.store()
+        self._load_worker: Optional[ProjectScanWorker] = None
+        self._load_dir_indexes: Dict[str, int] = {} # Directories still being read -> store index
+        self._load_started = 0.0
+        self._generation_worker: Optional[ContextGenerationWorker] = None
         self._current_generated_filepath: Optional[str] = None
+        self._generated_part_paths: List[str] = [] # All parts when the last output was split
+        self._block_cache = RenderedBlockCache()
+        self._watcher = QFileSystemWatcher(self)
+        self._scan_gitignore: Optional[GitIgnoreMatcher] = None
+        self._pending_changed_dirs: Set[str] = set()
+        self._watch_debounce_timer = QTimer(self)
+        self._watch_debounce_timer.setSingleShot(True); self._watch_debounce_timer.setInterval(WATCH_DEBOUNCE_MS)
+        self._watcher.directoryChanged.connect(self.handle_watched_directory_changed)
+        self._watcher.fileChanged.connect(self.handle_watched_file_changed)
+        self._watch_debounce_timer.timeout.connect(self.apply_pending_directory_changes)
+        self.watch_checkbox.toggled.connect(self.toggle_watch_mode)
+        self._size_worker: Optional[FileSizeWorker] = None
+        self._sizing_stale = False # Files were added while sizing; their sizes are read after it
+        self._sniff_worker: Optional[FileSniffWorker] = None
+        self._sniffing_stale = False
+        self._selection_summary_timer = QTimer(self)
+        self._selection_summary_timer.setSingleShot(True); self._selection_summary_timer.setInterval(SELECTION_SUMMARY_INTERVAL_MS)
+        self._selection_summary_timer.timeout.connect(self.update_selection_summary)
+        for signal in (self.tree_model.dataChanged, self.tree_model.rowsInserted, self.tree_model.rowsRemoved, self.tree_model.modelReset):
+            signal.connect(self.schedule_selection_summary)
+        self._content_index: Optional[ContentIndex] = None
+        self._content_index_worker: Optional[ContentIndexWorker] = None
+        self._content_index_stale = False # Files changed while an update was running; another one follows it
+        self._content_search_worker: Optional[ContentSearchWorker] = None
+        self._content_matches: List[int] = [] # Store indexes of the last search's matches
+        self._content_search_timer = QTimer(self)
+        self._content_search_timer.setSingleShot(True); self._content_search_timer.setInterval(CONTENT_SEARCH_DEBOUNCE_MS)
+        self._content_search_timer.timeout.connect(self.run_content_search)
+        self.content_search_input.textChanged.connect(self._content_search_timer.start)
+        self.content_search_input.returnPressed.connect(self.run_content_search)
+        self.content_search_regex_checkbox.toggled.connect(self.run_content_search)
+        self.content_search_case_checkbox.toggled.connect(self.run_content_search)
+        self.check_matches_button.clicked.connect(self.check_content_matches)
+        self.content_index_checkbox.toggled.connect(self.toggle_content_index)
+        self.update_content_search_controls()
+        self.profile_combo.activated.connect(self.apply_selection_profile)
+        self.save_profile_button.clicked.connect(self.save_selection_profile)
+        self.delete_profile_button.clicked.connect(self.delete_selection_profile)
+        self.update_profile_controls()
         self.update_pinned_buttons_ui()
         self.update_recent_buttons_ui()
 
@@ -677,8 +1280,33 @@ class ProjectContextGenerator(QMainWindow):
     def save_settings(self):
         self.settings.setValue(SETTINGS_PINNED_DIRS, [path for path in self._pinned_paths if path is not None])
         self.settings.setValue(SETTINGS_RECENT_DIRS, self._recent_paths[:MAX_RECENT_DIRS])
-
-    def closeEvent(self, event): self.save_settings(); super().closeEvent(event)
+        self.settings.setValue(SETTINGS_RESPECT_GITIGNORE, self.respect_gitignore_checkbox.isChecked())
+        self.settings.setValue(SETTINGS_GENERATION_WORKERS, self.generation_workers_spinbox.value())
+        self.settings.setValue(SETTINGS_WATCH_PROJECT, self.watch_checkbox.isChecked())
+        self.settings.setValue(SETTINGS_TOKENIZER, self.tokenizer_combo.currentText() if self.tokenizer_combo.currentIndex() > 0 else "")
+        self.settings.setValue(SETTINGS_TOKEN_BUDGET, self.token_budget_spinbox.value())
+        self.settings.setValue(SETTINGS_BUDGET_PRIORITIES, self.budget_priorities_input.text().strip())
+        self.settings.setValue(SETTINGS_LARGE_FILE_MODE, self.large_file_mode_combo.currentText())
+        self.settings.setValue(SETTINGS_LARGE_FILE_HEAD, self.large_file_head_spinbox.value())
+        self.settings.setValue(SETTINGS_LARGE_FILE_TAIL, self.large_file_tail_spinbox.value())
+        self.settings.setValue(SETTINGS_OUTPUT_FORMAT, self.output_format_combo.currentText())
+        self.settings.setValue(SETTINGS_COMPRESSION, self.compression_combo.currentData() or "")
+        self.settings.setValue(SETTINGS_SHARD_LIMIT, self.shard_limit_spinbox.value())
+        self.settings.setValue(SETTINGS_SHARD_UNIT, self.shard_unit_combo.currentText())
+        self.settings.setValue(SETTINGS_DEDUPLICATE, self.deduplicate_checkbox.isChecked())
+        self.settings.setValue(SETTINGS_TRANSFORMS, self.transforms_input.text().strip())
+        self.settings.setValue(SETTINGS_CONTENT_INDEX, self.content_index_checkbox.isChecked())
+
+    def closeEvent(self, event):
+        self.save_settings()
+        for worker in (self._load_worker, self._generation_worker, self._content_index_worker, self._content_search_worker, self._size_worker,
+                       self._sniff_worker):
+            if worker is not None: worker.cancel(); worker.wait()
+        self._load_worker = None; self._generation_worker = None; self._content_index_worker = None; self._content_search_worker = None
+        self._size_worker = None; self._sniff_worker = None
+        try: self._block_cache.close()
+        except Exception as e: print(f"Warning: Could not close block cache: {type(e).__name__}: {e}")
+        super().closeEvent(event)
 
     def update_pinned_buttons_ui(self):
         for i in range(MAX_PINNED_DIRS):
@@ -794,10 +1422,13 @@ class ProjectContextGenerator(QMainWindow):
         if directory: self.path_input.setText(directory); self.load_project_files()
 
     def load_project_files(self):
+        self._stop_watching(); self._stop_content_index(); self._stop_sizing(); self._stop_sniffing()
+        if self._load_worker is not None: # A new load supersedes the one in flight
+            self._load_worker.cancel(); self._load_worker = None; self.cancel_load_button.setEnabled(False)
         project_path = self.path_input.text().strip()
         if not project_path:
             self.status_output.setText("Status: Please enter or browse to a project path.")
-            self.tree_model.clear(); self._all_items_data = []; self._project_path = ""
+            self.tree_model.clear(); self._all_items_data = self.tree_model.store(); self._project_path = ""
             self._current_generated_filepath = None; self.output_file_path_display.clear()
             self.view_generated_file_button.setEnabled(False); return
 
@@ -805,146 +1436,433 @@ class ProjectContextGenerator(QMainWindow):
         if not os.path.isdir(project_path_abs):
             self.status_output.setText(f"Status: Error - Path '{project_path}' is not a valid directory.")
             QMessageBox.warning(self, "Load Error", f"Path '{project_path}' is not a valid directory.")
-            self.tree_model.clear(); self._all_items_data = []; self._project_path = ""
+            self.tree_model.clear(); self._all_items_data = self.tree_model.store(); self._project_path = ""
             self._current_generated_filepath = None; self.output_file_path_display.clear()
             self.view_generated_file_button.setEnabled(False); return
 
-        self.status_output.setText(f"Status: Loading from {project_path_abs}..."); QApplication.processEvents()
-        items_list, msg = list_project_items(project_path_abs)
-        self._project_path = project_path_abs; self._all_items_data = items_list
+        self.status_output.setText(f"Status: Loading from {project_path_abs}...")
+        self._scan_gitignore = GitIgnoreMatcher(project_path_abs) if self.respect_gitignore_checkbox.isChecked() else None
+        items = ProjectItemStore(); items.add_root(os.path.basename(project_path_abs) or project_path_abs)
+        self._project_path = project_path_abs; self._all_items_data = items
         self._current_generated_filepath = None; self.add_to_recent_directories(project_path_abs)
-        self.tree_model.clear(); self.output_file_path_display.clear(); self.view_generated_file_button.setEnabled(False)
-
-        if len(items_list) <= 1 and items_list[0]['Path'] == "": 
-             self.status_output.setText(f"Status: {msg}")
-             if "Error:" in msg or "Could not" in msg or "denied" in msg : QMessageBox.warning(self, "Load Problem", msg)
-             elif "No displayable" in msg or "empty" in msg or "filtered" in msg: QMessageBox.information(self, "Load Info", msg)
+        self.output_file_path_display.clear(); self.view_generated_file_button.setEnabled(False)
+        self.tree_model.set_store(items) # Rows are created lazily as folders are expanded
+        self.update_profile_controls()
+        self.tree_model.mark_loading([0]); self._expand_store_item(0)
+
+        # The scan runs on a worker thread; entries reach the tree in batches as directories are read
+        self._load_dir_indexes = {"": 0}; self._load_started = time.perf_counter()
+        worker = ProjectScanWorker(project_path_abs, self._scan_gitignore, parent=self)
+        worker.batch_ready.connect(partial(self.handle_scan_batch, worker))
+        worker.finished.connect(partial(self.handle_scan_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._load_worker = worker; self.cancel_load_button.setEnabled(True)
+        worker.start()
+
+    def cancel_project_load(self):
+        if self._load_worker is None: return
+        self._load_worker.cancel(); self.cancel_load_button.setEnabled(False)
+        self.status_output.setText("Status: Cancelling load...")
+
+    def handle_scan_batch(self, worker: ProjectScanWorker, batch: List[Tuple[str, Tuple[List[str], List[str], List[str]]]]):
+        if worker is not self._load_worker or worker.is_cancelled(): return
+        items = self._all_items_data; dir_indexes = self._load_dir_indexes
+        for dir_rel, (dirs, descend, files) in batch:
+            dir_index = dir_indexes.pop(dir_rel, None)
+            if dir_index is None: continue
+            first = items.add_children(dir_index, dirs, files, items.is_selected(dir_index))
+            if descend:
+                prefix = f"{dir_rel}/" if dir_rel else ""
+                index_by_name = {dir_name: first + offset for offset, dir_name in enumerate(dirs)}
+                for dir_name in descend: dir_indexes[prefix + dir_name] = index_by_name[dir_name]
+                self.tree_model.mark_loading(index_by_name[dir_name] for dir_name in descend)
+            self.tree_model.children_added(dir_index, range(first, len(items.paths)))
+        self.schedule_selection_summary()
+        elapsed = time.perf_counter() - self._load_started
+        self.status_output.setText(f"Status: Loading... {len(items) - 1} entries ({(len(items) - 1) / max(elapsed, 1e-6):.0f} entries/s)")
+
+    def handle_scan_finished(self, worker: ProjectScanWorker):
+        if worker is not self._load_worker: return # Superseded by a newer load
+        self._load_worker = None; self._load_dir_indexes = {}; self.cancel_load_button.setEnabled(False)
+        self.tree_model.loading_finished()
+        elapsed = time.perf_counter() - self._load_started; item_count = len(self._all_items_data) - 1
+        self.log_output.append(f"Scan timings: {worker.directories_read} dirs, {item_count} entries in {elapsed:.3f}s "
+                               f"({item_count / max(elapsed, 1e-6):.0f} entries/s).")
+        if worker.is_cancelled():
+            self.status_output.setText(f"Status: Loading cancelled after {item_count} entries.")
+            self.log_output.append("Load cancelled; the tree only shows the entries found so far."); return
+        if worker.error:
+            self.status_output.setText(f"Status: {worker.error}"); QMessageBox.warning(self, "Load Problem", worker.error); return
+
+        msg = scan_summary_message(self._project_path, item_count)
+        self.status_output.setText(f"Status: {msg}")
+        if item_count <= 0:
+             if "No displayable" in msg or "empty" in msg or "filtered" in msg: QMessageBox.information(self, "Load Info", msg)
              return
-
-        invisible_root_model_item = self.tree_model.invisibleRootItem()
-        qt_items_map: Dict[str, QStandardItem] = {}
-        children_by_parent: Dict[str, List[QStandardItem]] = {}
-        self._in_item_change_handler = True
-
-        for item_data in self._all_items_data:
-            path = item_data.get('Path', ''); name = item_data.get('Name', 'Unknown')
-            is_dir = item_data.get('IsDir', False)
-            item_type = item_data.get('Type', '📄 File' if not is_dir else '📁 Dir')
-            is_selected = item_data.get('Select', True); prefix = ""; display_text = name
-            if is_dir:
-                if item_type == '⚠️ Error Dir':
-                    prefix = ICON_MAP.get('error', '⚠️')
-                    display_text = f"{name} (Error: {item_data.get('Error', 'Access Denied')})"
-                else: prefix = ICON_MAP.get('dir', '📁')
-            else:
-                extension_or_type = get_file_extension(path)
-                prefix = ICON_MAP.get(extension_or_type, ICON_MAP.get('default', '📄'))
-            qt_item = QStandardItem(f"{prefix} {display_text}"); qt_item.setEditable(False)
-            qt_item.setData(item_data, Qt.ItemDataRole.UserRole)
-            if item_type != '⚠️ Error Dir':
-                qt_item.setFlags(qt_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-                qt_item.setCheckState(Qt.CheckState.Checked if is_selected else Qt.CheckState.Unchecked)
-            else: qt_item.setFlags(qt_item.flags() & ~Qt.ItemFlag.ItemIsUserCheckable)
-            qt_items_map[path] = qt_item
-            if path == "": continue
-            parent_path = os.path.dirname(path).replace("\\", "/")
-            if parent_path not in children_by_parent: children_by_parent[parent_path] = []
-            children_by_parent[parent_path].append(qt_item)
-
-        def sort_key_dirs_first(item: QStandardItem):
-            item_data = item.data(Qt.ItemDataRole.UserRole)
-            is_dir = item_data.get('IsDir', False); name = item_data.get('Name', '')
-            return (not is_dir, name.lower())
-
-        root_path = ""; root_qt_item = qt_items_map.get(root_path)
-        if root_qt_item:
-            invisible_root_model_item.appendRow(root_qt_item)
-            root_children_items = children_by_parent.get(root_path, [])
-            sorted_root_children = sorted(root_children_items, key=sort_key_dirs_first)
-            for child_qt_item in sorted_root_children: root_qt_item.appendRow(child_qt_item)
-        else:
-            print(f"Error: Project root item (path='') not found."); self.status_output.setText("Status: Error - Could not load project root.")
-            self._in_item_change_handler = False; return
-
-        sorted_parent_paths_for_processing = sorted(
-            [p for p in children_by_parent.keys() if p != root_path],
-            key=lambda p: (p.count(os.sep), p)
-        )
-        for parent_path in sorted_parent_paths_for_processing:
-            parent_qt_item = qt_items_map.get(parent_path)
-            if not parent_qt_item:
-                print(f"Warning: Parent QStandardItem for path '{parent_path}' not found."); continue
-            children_items = children_by_parent.get(parent_path, [])
-            sorted_children = sorted(children_items, key=sort_key_dirs_first)
-            for child_qt_item in sorted_children: parent_qt_item.appendRow(child_qt_item)
-
-        self._in_item_change_handler = False; self.status_output.setText(f"Status: {msg}")
-        if root_qt_item:
-            self.tree_view.expand(root_qt_item.index())
-            self.tree_view.resizeColumnToContents(0)
+        self.tree_view.resizeColumnToContents(0)
         self.update_copy_button_state() 
-
-    def handle_item_changed(self, item: QStandardItem):
-        if self._in_item_change_handler: return
-        self._in_item_change_handler = True
-        try:
-            item_data = item.data(Qt.ItemDataRole.UserRole);
-            if not item_data or not (item.flags() & Qt.ItemFlag.ItemIsUserCheckable):
-                self._in_item_change_handler = False; return
-            new_state = item.checkState() == Qt.CheckState.Checked; item_path = item_data.get('Path')
-            if item_path is not None:
-                 try:
-                     found_data = next(d for d in self._all_items_data if d.get('Path') == item_path)
-                     found_data['Select'] = new_state
-                 except StopIteration: print(f"Warning: Could not find item path {item_path} in _all_items_data.")
-            if item_data.get('IsDir', False) or item_path == "": self._propagate_selection_to_children(item, new_state)
-        finally: self._in_item_change_handler = False
-
-    def _propagate_selection_to_children(self, parent_qstandard_item: QStandardItem, select_value_for_children: bool):
-        check_state_to_set = Qt.CheckState.Checked if select_value_for_children else Qt.CheckState.Unchecked
-        for row in range(parent_qstandard_item.rowCount()):
-            child_qstandard_item = parent_qstandard_item.child(row, 0)
-            if child_qstandard_item:
-                child_data = child_qstandard_item.data(Qt.ItemDataRole.UserRole)
-                if child_data and child_data.get('Type') != '⚠️ Error Dir':
-                    child_path = child_data.get('Path')
-                    if child_path is not None:
-                        try:
-                            found_child_data_dict = next(
-                                data_dict for data_dict in self._all_items_data
-                                if data_dict.get('Path') == child_path
-                            )
-                            found_child_data_dict['Select'] = select_value_for_children
-                        except StopIteration:
-                            print(f"Warning: Could not find child item path {child_path} in _all_items_data during propagation.")
-                if child_qstandard_item.flags() & Qt.ItemFlag.ItemIsUserCheckable:
-                    if child_qstandard_item.checkState() != check_state_to_set:
-                        child_qstandard_item.setCheckState(check_state_to_set)
-                if child_qstandard_item.hasChildren():
-                    self._propagate_selection_to_children(child_qstandard_item, select_value_for_children)
+        active_profile = self._project_profiles().get("active")
+        if active_profile: self.apply_selection_profile(profile_name=active_profile)
+        self._start_watching()
+        self.start_sizing(); self.start_sniffing()
+        self.start_content_index()
+
+    def _item_index(self, index: QModelIndex) -> Optional[int]:
+        # Tree rows carry their ProjectItemStore index
+        return self.tree_model.store_index(index)
+
+    def _expand_store_item(self, store_index: int):
+        model_index = self.tree_model.index_for(store_index)
+        if not model_index.isValid(): return
+        if self.tree_model.canFetchMore(model_index): self.tree_model.fetchMore(model_index)
+        self.tree_view.expand(model_index)
+
+    # --- Watch mode: incremental tree updates from QFileSystemWatcher ---
+    def _abs_project_path(self, path_rel: str) -> str:
+        return os.path.join(self._project_path, path_rel) if path_rel else self._project_path
+
+    def _start_watching(self):
+        self._stop_watching()
+        store = self._all_items_data
+        if not self.watch_checkbox.isChecked() or not self._project_path or not store: return
+        dir_mask = ITEM_IS_DIR | ITEM_ERROR | ITEM_REMOVED
+        dir_paths = [self._abs_project_path(store.paths[index]) for index, item_flags in enumerate(store.flags)
+                     if item_flags & dir_mask == ITEM_IS_DIR]
+        if len(dir_paths) > WATCH_MAX_DIRECTORIES:
+            self.log_output.append(f"Warning: Watching only the first {WATCH_MAX_DIRECTORIES} of {len(dir_paths)} directories.")
+            dir_paths = dir_paths[:WATCH_MAX_DIRECTORIES]
+        failed = self._watcher.addPaths(dir_paths)
+        if failed: self.log_output.append(f"Warning: Could not watch {len(failed)} directories (OS watch limit?).")
+        self._watch_ignore_files()
+        self.log_output.append(f"Watching {len(dir_paths) - len(failed)} directories for changes.")
+
+    def _watch_ignore_files(self):
+        # Edits to an ignore file don't touch its directory's entries, so the files are watched themselves
+        if self._scan_gitignore is None: return
+        watched_files = set(self._watcher.files())
+        new_files = [path for path in self._scan_gitignore.loaded_files if path not in watched_files and os.path.isfile(path)]
+        if new_files: self._watcher.addPaths(new_files)
+
+    def handle_watched_file_changed(self, file_abs: str):
+        self.handle_watched_directory_changed(os.path.dirname(file_abs))
+
+    def _stop_watching(self):
+        self._watch_debounce_timer.stop(); self._pending_changed_dirs.clear()
+        watched = self._watcher.directories() + self._watcher.files()
+        if watched: self._watcher.removePaths(watched)
+
+    def toggle_watch_mode(self, checked: bool):
+        if checked: self._start_watching()
+        else: self._stop_watching(); self.status_output.setText("Status: Watch mode disabled.")
+
+    def handle_watched_directory_changed(self, dir_abs: str):
+        # Changes usually arrive in bursts (checkouts, builds); collect them and apply once things settle
+        self._pending_changed_dirs.add(dir_abs)
+        self._watch_debounce_timer.start()
+
+    def apply_pending_directory_changes(self):
+        if not self._project_path: self._pending_changed_dirs.clear(); return
+        changed_dirs = sorted(self._pending_changed_dirs, key=lambda p: (p.count(os.sep), p)); self._pending_changed_dirs.clear()
+        totals = {'added': 0, 'removed': 0, 'renamed': 0}
+        for dir_abs in changed_dirs:
+            dir_rel = os.path.relpath(dir_abs, self._project_path).replace("\\", "/")
+            if dir_rel == ".": dir_rel = ""
+            if dir_rel == ".." or dir_rel.startswith("../"): continue
+            for key, count in self._refresh_directory(dir_rel).items(): totals[key] += count
+        self._watch_ignore_files() # Picks up new ignore files and ones that editors replaced
+        if any(totals.values()):
+            self.start_sizing(); self.start_sniffing(); self.start_content_index()
+            self.status_output.setText(f"Status: Project changed on disk: {totals['added']} added, {totals['removed']} removed, {totals['renamed']} renamed.")
+
+    def _refresh_directory(self, dir_rel: str) -> Dict[str, int]:
+        # Re-reads one directory and applies the difference to its children in place, so untouched items keep
+        # their check and expansion state.
+        counts = {'added': 0, 'removed': 0, 'renamed': 0}
+        store = self._all_items_data; dir_index = store.index_of(dir_rel)
+        dir_abs = self._abs_project_path(dir_rel)
+        if dir_index is None or not store.is_dir(dir_index) or not os.path.isdir(dir_abs): return counts # A removed dir is handled by its parent's change
+        gitignore = self._scan_gitignore; rules_changed = False
+        if gitignore is not None:
+            rules_before = gitignore.rules_for(dir_rel).rules
+            gitignore.invalidate(dir_rel)
+            rules_changed = gitignore.rules_for(dir_rel).rules != rules_before
+        parent_rules = gitignore.rules_for(dir_rel.rpartition('/')[0]) if gitignore is not None and dir_rel else None
+        (dirs, descend, files), _ = scan_directory(dir_abs, dir_rel, DEFAULT_EXCLUSION_MATCHER, gitignore, parent_rules)
+
+        current: Dict[Tuple[str, bool], int] = {(store.names[child], store.is_dir(child)): child for child in store.children(dir_index)}
+        expected = [(name, True) for name in dirs] + [(name, False) for name in files]
+        # Changed ignore rules can affect anything below this directory, so its children are rebuilt from scratch
+        if rules_changed: removed, added = list(current), expected
+        else:
+            expected_set = set(expected)
+            removed = [key for key in current if key not in expected_set]; added = [key for key in expected if key not in current]
+            # One name gone and one new name of the same kind in a directory is treated as a rename
+            for is_dir in (True, False):
+                removed_kind = [key for key in removed if key[1] == is_dir]; added_kind = [key for key in added if key[1] == is_dir]
+                if len(removed_kind) == 1 and len(added_kind) == 1:
+                    self._rename_tree_item(current[removed_kind[0]], added_kind[0][0])
+                    removed.remove(removed_kind[0]); added.remove(added_kind[0]); counts['renamed'] += 1
+
+        previous_select: Dict[str, bool] = {}; previously_expanded: Set[str] = set() # Restored for entries that come back
+        for key in removed:
+            child_index = current[key]; watched_dirs = []
+            for index in store.iter_subtree(child_index):
+                path = store.paths[index]; previous_select[path] = store.is_selected(index)
+                model_index = self.tree_model.index_for(index)
+                if model_index.isValid() and self.tree_view.isExpanded(model_index): previously_expanded.add(path)
+                if store.is_dir(index): watched_dirs.append(self._abs_project_path(path))
+            self.tree_model.remove_entry(child_index)
+            if watched_dirs: self._watcher.removePaths(watched_dirs)
+            counts['removed'] += 1
+
+        select_new = store.check_state(dir_index) # New entries follow their folder's check state (its own flag when mixed)
+        if select_new is None: select_new = store.is_selected(dir_index)
+        for name, is_dir in added:
+            first = store.add_children(dir_index, [name] if is_dir else [], [] if is_dir else [name], select_new)
+            if is_dir and name in descend: scan_project_tree(self._project_path, store, first, gitignore=gitignore)
+            new_indexes = range(first, len(store.paths))
+            for index in new_indexes: store.set_selected(index, previous_select.get(store.paths[index], select_new))
+            self.tree_model.children_added(dir_index, [first])
+            for index in new_indexes: # Parents come before their children, so each one is on screen by the time it's expanded
+                if store.paths[index] in previously_expanded: self._expand_store_item(index)
+            new_dirs = [self._abs_project_path(store.paths[index]) for index in new_indexes if store.is_dir(index)]
+            if new_dirs: self._watcher.addPaths(new_dirs)
+            counts['added'] += 1
+        if removed or added: self.tree_model.refresh_check_states(dir_index) # Folder check states follow their files
+        return counts
+
+    def _rename_tree_item(self, index: int, new_name: str):
+        store = self._all_items_data
+        old_paths = {current: store.paths[current] for current in store.iter_subtree(index)}
+        old_dirs: List[str] = []; new_dirs: List[str] = []
+        for current in self.tree_model.rename_entry(index, new_name):
+            if not store.is_dir(current): continue
+            old_dirs.append(self._abs_project_path(old_paths[current])); new_dirs.append(self._abs_project_path(store.paths[current]))
+        if old_dirs: self._watcher.removePaths(old_dirs); self._watcher.addPaths(new_dirs)
+
+    # --- Content index: search-to-select ---
+    def update_content_search_controls(self):
+        enabled = self.content_index_checkbox.isChecked()
+        for widget in (self.content_search_input, self.content_search_regex_checkbox, self.content_search_case_checkbox):
+            widget.setEnabled(enabled)
+        self.check_matches_button.setEnabled(enabled and bool(self._content_matches))
+
+    def toggle_content_index(self, checked: bool):
+        if checked: self.start_content_index()
+        else:
+            self._stop_content_index(); self._content_index = None
+            self.tree_model.set_highlighted(()); self.content_search_status.setText("")
+        self.update_content_search_controls()
+
+    def _stop_content_index(self):
+        self._content_search_timer.stop()
+        for worker in (self._content_index_worker, self._content_search_worker):
+            if worker is not None: worker.cancel(); worker.wait()
+        self._content_index_worker = None; self._content_search_worker = None; self._content_index_stale = False
+        self._content_matches = []; self.check_matches_button.setEnabled(False)
+
+    def start_content_index(self):
+        # Brings the loaded project's content index up to date in the background; while an update runs, another
+        # one is queued instead
+        if not self.content_index_checkbox.isChecked() or not self._project_path or self._load_worker is not None: return
+        if self._content_index_worker is not None: self._content_index_stale = True; return
+        load_saved = self._content_index is None or self._content_index.project_path != self._project_path
+        if load_saved: self._content_index = ContentIndex(self._project_path)
+        store = self._all_items_data
+        file_paths = [store.paths[index] for index in range(1, len(store.paths)) if not store.is_dir(index) and not store.is_removed(index)]
+        worker = ContentIndexWorker(self._content_index, file_paths, load_saved, parent=self)
+        worker.progress_changed.connect(partial(self.handle_content_index_progress, worker))
+        worker.finished.connect(partial(self.handle_content_index_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._content_index_worker = worker; self._content_index_stale = False
+        self.content_search_status.setText("Indexing...")
+        worker.start()
+
+    def handle_content_index_progress(self, worker: ContentIndexWorker, files_done: int, files_total: int):
+        if worker is self._content_index_worker: self.content_search_status.setText(f"Indexing {files_done}/{files_total}...")
+
+    def handle_content_index_finished(self, worker: ContentIndexWorker):
+        if worker is not self._content_index_worker: return
+        self._content_index_worker = None
+        if worker.error: self.content_search_status.setText("Index failed"); self.log_output.append(worker.error)
+        else:
+            files_read, files_dropped = worker.changes
+            self.content_search_status.setText(f"{worker.index.indexed_count()} files indexed")
+            self.log_output.append(f"Content index: {worker.index.indexed_count()} files indexed, {files_read} read and "
+                                   f"{files_dropped} dropped in {worker.elapsed:.2f}s.")
+        if self._content_index_stale: self.start_content_index()
+        elif self.content_search_input.text(): self.run_content_search() # Results may have changed
+
+    def run_content_search(self):
+        self._content_search_timer.stop()
+        if self._content_search_worker is not None: self._content_search_worker.cancel(); self._content_search_worker = None
+        query = self.content_search_input.text()
+        if not query or self._content_index is None:
+            self._content_matches = []; self.tree_model.set_highlighted(()); self.update_content_search_controls(); return
+        worker = ContentSearchWorker(self._content_index, query, self.content_search_regex_checkbox.isChecked(),
+                                     self.content_search_case_checkbox.isChecked(), parent=self)
+        worker.finished.connect(partial(self.handle_content_search_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._content_search_worker = worker; worker.start()
+
+    def handle_content_search_finished(self, worker: ContentSearchWorker):
+        if worker is not self._content_search_worker: return
+        self._content_search_worker = None
+        if worker.error: self.content_search_status.setText(worker.error); return
+        store = self._all_items_data
+        self._content_matches = [index for index in map(store.index_of, worker.matches) if index is not None]
+        self.tree_model.set_highlighted(self._content_matches); self.update_content_search_controls()
+        indexing_note = ", still indexing" if self._content_index_worker is not None else ""
+        self.content_search_status.setText(f"{len(self._content_matches)} files match ({worker.elapsed * 1000:.0f} ms{indexing_note})")
+
+    def check_content_matches(self):
+        store = self._all_items_data
+        for store_index in self._content_matches:
+            if not store.is_removed(store_index): store.set_selected(store_index, True)
+        self.tree_model.refresh_check_states()
+        self.status_output.setText(f"Status: Checked {len(self._content_matches)} files containing '{self.content_search_input.text()}'.")
+
+    # --- Selection profiles: named check states per project, stored as prefix rules ---
+    def _all_profiles(self) -> Dict[str, Any]:
+        try: profiles = json.loads(self.settings.value(SETTINGS_SELECTION_PROFILES, "", type=str) or "{}")
+        except ValueError: profiles = {}
+        return profiles if isinstance(profiles, dict) else {}
+
+    def _project_profiles(self) -> Dict[str, Any]:
+        entry = self._all_profiles().get(self._project_path) if self._project_path else None
+        return entry if isinstance(entry, dict) and isinstance(entry.get("profiles"), dict) else {"active": None, "profiles": {}}
+
+    def _store_project_profiles(self, entry: Dict[str, Any]):
+        profiles = self._all_profiles()
+        if entry["profiles"]: profiles[self._project_path] = entry
+        else: profiles.pop(self._project_path, None)
+        self.settings.setValue(SETTINGS_SELECTION_PROFILES, json.dumps(profiles, separators=(",", ":")))
+
+    def update_profile_controls(self):
+        entry = self._project_profiles()
+        self.profile_combo.blockSignals(True); self.profile_combo.clear()
+        self.profile_combo.addItem("(no profile)", "")
+        for name in sorted(entry["profiles"], key=str.lower): self.profile_combo.addItem(name, name)
+        self.profile_combo.setCurrentIndex(max(self.profile_combo.findData(entry.get("active") or ""), 0))
+        self.profile_combo.blockSignals(False)
+        self.profile_combo.setEnabled(bool(self._project_path)); self.save_profile_button.setEnabled(bool(self._project_path))
+        self.delete_profile_button.setEnabled(self.profile_combo.currentIndex() > 0)
+
+    def apply_selection_profile(self, combo_index: int = -1, profile_name: Optional[str] = None):
+        # From the combo box (combo_index) or after a load (profile_name); the profile becomes the active one
+        if profile_name is None: profile_name = self.profile_combo.itemData(combo_index) or ""
+        entry = self._project_profiles(); rules = entry["profiles"].get(profile_name)
+        entry["active"] = profile_name if rules is not None else None
+        if self._project_path: self._store_project_profiles(entry)
+        self.update_profile_controls()
+        if rules is None: return
+        started = time.perf_counter()
+        try: checked_files = self._all_items_data.apply_selection_rules(rules)
+        except ValueError as e: self.status_output.setText(f"Status: Profile '{profile_name}' is damaged: {e}"); return
+        self.tree_model.refresh_check_states()
+        self.status_output.setText(f"Status: Applied profile '{profile_name}': {checked_files} files checked.")
+        self.log_output.append(f"Profile '{profile_name}': {len(rules)} rules applied in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+    def save_selection_profile(self):
+        if not self._project_path: return
+        entry = self._project_profiles()
+        name, accepted = QInputDialog.getText(self, "Save Selection Profile", "Profile name:", text=entry.get("active") or "")
+        name = name.strip()
+        if not accepted or not name: return
+        if name in entry["profiles"] and name != entry.get("active"):
+            if QMessageBox.question(self, "Save Selection Profile", f"Replace the profile '{name}'?") != QMessageBox.StandardButton.Yes: return
+        rules = self._all_items_data.selection_rules()
+        entry["profiles"][name] = rules; entry["active"] = name
+        self._store_project_profiles(entry); self.update_profile_controls()
+        checked_files = len(self._all_items_data.selected_file_paths())
+        self.status_output.setText(f"Status: Saved profile '{name}': {checked_files} checked files as {len(rules)} rules.")
+
+    def delete_selection_profile(self):
+        name = self.profile_combo.currentData()
+        if not name: return
+        entry = self._project_profiles(); entry["profiles"].pop(name, None)
+        if entry.get("active") == name: entry["active"] = None
+        self._store_project_profiles(entry); self.update_profile_controls()
+        self.status_output.setText(f"Status: Deleted profile '{name}'.")
 
     def update_all_selections(self, select_value: bool):
         if not self._all_items_data:
             self.status_output.setText("Status: No project items loaded.")
             return
-        self._in_item_change_handler = True 
-        check_state_to_set = Qt.CheckState.Checked if select_value else Qt.CheckState.Unchecked
-        for item_data_dict in self._all_items_data:
-            if item_data_dict.get('Type') != '⚠️ Error Dir':
-                item_data_dict['Select'] = select_value
-        def _recursive_set_check_state(parent_qstandard_item: QStandardItem):
-            for row in range(parent_qstandard_item.rowCount()):
-                child_qstandard_item = parent_qstandard_item.child(row, 0)
-                if child_qstandard_item:
-                    if child_qstandard_item.flags() & Qt.ItemFlag.ItemIsUserCheckable:
-                        child_qstandard_item.setCheckState(check_state_to_set)
-                    if child_qstandard_item.hasChildren():
-                        _recursive_set_check_state(child_qstandard_item)
-        invisible_root = self.tree_model.invisibleRootItem()
-        _recursive_set_check_state(invisible_root)
-        self._in_item_change_handler = False
+        self._all_items_data.set_all_selected(select_value)
+        self.tree_model.refresh_check_states()
         self.status_output.setText(f"Status: {'All checkable items selected' if select_value else 'All checkable items deselected'}.")
 
+    # --- Selection totals: checked files, bytes and ~tokens from the store's counters ---
+    def schedule_selection_summary(self, *args):
+        # Coalesces bursts of check and row changes into one label update
+        if not self._selection_summary_timer.isActive(): self._selection_summary_timer.start()
+
+    def update_selection_summary(self):
+        store = self._all_items_data
+        if not store.paths or not self._project_path: self.selection_summary_label.setText(""); return
+        selected_bytes = store.selected_bytes[0]
+        sizing_note = ", sizing..." if self._size_worker is not None else ""
+        self.selection_summary_label.setText(
+            f"Selected: {store.selected_files[0]:,} of {store.file_totals[0]:,} files, {selected_bytes / (1024 * 1024):.1f}MB, "
+            f"~{selected_bytes // 4:,} tokens (est.{sizing_note})")
+
+    def _stop_sizing(self):
+        if self._size_worker is not None: self._size_worker.cancel(); self._size_worker.wait()
+        self._size_worker = None; self._sizing_stale = False
+
+    def start_sizing(self):
+        # Stats the files whose size isn't known yet (all of them after a load, new ones after a watch update) in the
+        # background; while one runs, another is queued instead
+        if not self._project_path or self._load_worker is not None: return
+        if self._size_worker is not None: self._sizing_stale = True; return
+        store = self._all_items_data; store_indexes = store.unsized_files()
+        if not store_indexes: self.schedule_selection_summary(); return
+        worker = FileSizeWorker(self._project_path, store_indexes, [store.fs_path(index) for index in store_indexes], parent=self)
+        worker.batch_ready.connect(partial(self.handle_sizes_ready, worker))
+        worker.finished.connect(partial(self.handle_sizing_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._size_worker = worker; self._sizing_stale = False
+        worker.start(); self.schedule_selection_summary()
+
+    def handle_sizes_ready(self, worker: FileSizeWorker, batch: Tuple[List[int], List[int]]):
+        if worker is not self._size_worker or worker.is_cancelled(): return
+        self._all_items_data.set_file_sizes(zip(*batch)); self.schedule_selection_summary()
+
+    def handle_sizing_finished(self, worker: FileSizeWorker):
+        if worker is not self._size_worker: return
+        self._size_worker = None
+        if self._sizing_stale: self.start_sizing()
+        else: self.schedule_selection_summary()
+
+    # --- Binary sniffing: greys out binaries in the tree without reading files while painting ---
+    def _stop_sniffing(self):
+        if self._sniff_worker is not None: self._sniff_worker.cancel(); self._sniff_worker.wait()
+        self._sniff_worker = None; self._sniffing_stale = False
+
+    def start_sniffing(self):
+        # Sniffs the files not sniffed yet (all of them after a load, new ones after a watch update) in the
+        # background; while one runs, another is queued instead
+        if not self._project_path or self._load_worker is not None: return
+        if self._sniff_worker is not None: self._sniffing_stale = True; return
+        store = self._all_items_data; store_indexes = store.unsniffed_files()
+        if not store_indexes: return
+        worker = FileSniffWorker(self._project_path, store_indexes, [store.fs_path(index) for index in store_indexes], parent=self)
+        worker.batch_ready.connect(partial(self.handle_sniffs_ready, worker))
+        worker.finished.connect(partial(self.handle_sniffing_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._sniff_worker = worker; self._sniffing_stale = False
+        worker.start()
+
+    def handle_sniffs_ready(self, worker: FileSniffWorker, batch: Tuple[List[int], List[bool]]):
+        if worker is not self._sniff_worker or worker.is_cancelled(): return
+        self.tree_model.set_sniffed(zip(*batch))
+
+    def handle_sniffing_finished(self, worker: FileSniffWorker):
+        if worker is not self._sniff_worker: return
+        self._sniff_worker = None
+        if self._sniffing_stale: self.start_sniffing()
+
     def update_copy_button_state(self):
         selected_indexes = self.tree_view.selectionModel().selectedRows()
         self.copy_names_button.setEnabled(bool(selected_indexes))
@@ -952,18 +1870,17 @@ class ProjectContextGenerator(QMainWindow):
     def copy_selected_file_names(self):
         selected_paths: List[str] = []
         selected_indexes = self.tree_view.selectionModel().selectedRows()
+        store = self._all_items_data
         for index in selected_indexes:
-            item = self.tree_model.itemFromIndex(index)
-            if item:
-                item_data = item.data(Qt.ItemDataRole.UserRole)
-                if item_data:
-                    path_to_copy = item_data.get('Path', '')
-                    if path_to_copy == "" and self._project_path: # Root project directory
-                        selected_paths.append(os.path.basename(self._project_path) or item_data.get('Name', ''))
-                    elif path_to_copy: # Other items with a path
-                        selected_paths.append(path_to_copy)
-                    elif not path_to_copy and not self._project_path: # Fallback for odd cases
-                         selected_paths.append(item_data.get('Name', 'Unknown Item'))
+            item_index = self._item_index(index)
+            if item_index is not None:
+                path_to_copy = store.paths[item_index]
+                if path_to_copy == "" and self._project_path: # Root project directory
+                    selected_paths.append(os.path.basename(self._project_path) or store.names[item_index])
+                elif path_to_copy: # Other items with a path
+                    selected_paths.append(path_to_copy)
+                elif not path_to_copy and not self._project_path: # Fallback for odd cases
+                     selected_paths.append(store.names[item_index] or 'Unknown Item')
 
         if not selected_paths:
             self.log_output.append("Info: No items selected to copy."); return
@@ -1009,28 +1926,124 @@ class ProjectContextGenerator(QMainWindow):
         # It might be necessary to force the layout to update immediately
         self.main_layout.activate()
 
+    def update_large_file_controls(self):
+        excerpting = LARGE_FILE_MODES[self.large_file_mode_combo.currentText()][0] == "excerpt"
+        self.large_file_head_spinbox.setEnabled(excerpting); self.large_file_tail_spinbox.setEnabled(excerpting)
+
+    def shard_limit(self) -> Optional[ShardLimit]:
+        limit = self.shard_limit_spinbox.value()
+        if limit <= 0: return None
+        return ShardLimit(max_tokens=limit) if self.shard_unit_combo.currentText() == "tokens" else ShardLimit(max_bytes=limit * 1024)
+
+    def large_file_policy(self) -> LargeFilePolicy:
+        mode, unit = LARGE_FILE_MODES[self.large_file_mode_combo.currentText()]
+        return LargeFilePolicy(mode, self.large_file_head_spinbox.value(), self.large_file_tail_spinbox.value(), unit)
+
     def generate_context_file(self):
+        if self._generation_worker is not None: return
         if not self._project_path:
             self.log_output.append("Error: No project loaded."); QMessageBox.warning(self, "Generate Error", "No project loaded."); return
-        selected_data = [item for item in self._all_items_data if item.get('Select', False)]
-        if not any(not item.get('IsDir', True) for item in selected_data):
+        if self._load_worker is not None:
+            self.log_output.append("Info: Project is still loading."); QMessageBox.information(self, "Generate Info", "The project is still loading; wait for it to finish or cancel it first."); return
+        selected_paths = self._all_items_data.selected_file_paths() # Snapshot, so the tree stays usable meanwhile
+        if not selected_paths:
             self.log_output.append("Info: No files selected."); QMessageBox.information(self, "Generate Info", "No files selected."); return
         custom_filename_base = self.output_filename_input.text().strip()
-        self.log_output.clear(); self.log_output.append("Generating context file..."); QApplication.processEvents()
-        output_filepath_val, msg, word_count, token_count_approx = generate_text_from_selected_files(
-            self._project_path, selected_data, custom_filename_base
-        )
+        token_budget = None
+        if self.token_budget_spinbox.value() > 0:
+            try: priorities = [parse_priority(spec.strip()) for spec in self.budget_priorities_input.text().split(',') if spec.strip()]
+            except ValueError as e:
+                self.log_output.append(f"Error: {e}"); QMessageBox.warning(self, "Generate Error", str(e)); return
+            token_budget = TokenBudget(self.token_budget_spinbox.value(), priorities)
+        try: transforms = transform_policy_from_rules(rule.strip() for rule in self.transforms_input.text().split(';') if rule.strip())
+        except ValueError as e:
+            self.log_output.append(f"Error: {e}"); QMessageBox.warning(self, "Generate Error", str(e)); return
+        self.log_output.clear(); self.log_output.append("Generating context file...")
+        self.log_output.append(format_generation_progress(0, len(selected_paths), 0, 0.0))
+        worker = ContextGenerationWorker(self._project_path, selected_paths, custom_filename_base,
+                                         self.generation_workers_spinbox.value(), self._block_cache,
+                                         self.tokenizer_combo.currentData() or None, token_budget, self.large_file_policy(),
+                                         self.output_format_combo.currentText(), self.compression_combo.currentData() or None,
+                                         self.shard_limit(), self.deduplicate_checkbox.isChecked(), transforms, self)
+        worker.progress_changed.connect(partial(self.handle_generation_progress, worker))
+        worker.finished.connect(partial(self.handle_generation_finished, worker))
+        worker.finished.connect(worker.deleteLater)
+        self._generation_worker = worker
+        self.generate_button.setEnabled(False); self.cancel_generation_button.setEnabled(True)
+        self.status_output.setText(f"Status: Generating context from {len(selected_paths)} files...")
+        worker.start()
+
+    def cancel_generation(self):
+        if self._generation_worker is None: return
+        self._generation_worker.cancel(); self.cancel_generation_button.setEnabled(False)
+        self.status_output.setText("Status: Cancelling generation...")
+
+    def _replace_last_log_line(self, text: str):
+        cursor = self.log_output.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.movePosition(QTextCursor.MoveOperation.StartOfBlock, QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(text)
+
+    def handle_generation_progress(self, worker: ContextGenerationWorker, files_done: int, files_total: int, chars_done: int, elapsed: float):
+        if worker is not self._generation_worker or worker.is_cancelled(): return
+        self._replace_last_log_line(format_generation_progress(files_done, files_total, chars_done, elapsed))
+
+    def handle_generation_finished(self, worker: ContextGenerationWorker):
+        if worker is not self._generation_worker: return
+        self._generation_worker = None
+        self.generate_button.setEnabled(True); self.cancel_generation_button.setEnabled(False)
+        output_filepath_val, msg, word_count, token_count = worker.result
+        generation_stats = worker.stats
         self.log_output.append(msg)
+        if 'cache_hits' in generation_stats:
+            self.log_output.append(f"Block cache: {generation_stats['cache_hits']} hits, {generation_stats['cache_misses']} misses.")
         if output_filepath_val:
-            self.output_file_path_display.setText(output_filepath_val)
+            self.status_output.setText("Status: Context file generated.")
             self._current_generated_filepath = output_filepath_val
+            self._generated_part_paths = [path for path, _, _ in generation_stats.get('parts', [])]
             self.view_generated_file_button.setEnabled(True)
-            self.log_output.append(f"Success: Output saved to {os.path.basename(output_filepath_val)}")
-            self.log_output.append(f"Content stats: {word_count} words, ~{token_count_approx} tokens.")
+            if len(self._generated_part_paths) > 1:
+                self.output_file_path_display.setText(f"{output_filepath_val} (+{len(self._generated_part_paths) - 1} more parts)")
+                self.output_file_path_display.setToolTip("\n".join(self._generated_part_paths))
+                self.log_output.append(f"Success: Output saved to {len(self._generated_part_paths)} parts:")
+                self.log_output.append("\n".join(f"  {os.path.basename(path)}: {file_count} files, {tokens} tokens"
+                                                 for path, file_count, tokens in generation_stats['parts']))
+            else:
+                self.output_file_path_display.setText(output_filepath_val); self.output_file_path_display.setToolTip("")
+                self.log_output.append(f"Success: Output saved to {os.path.basename(output_filepath_val)}")
+            if generation_stats.get('transform_savings'):
+                self.log_output.append("Transforms:\n" + "\n".join(f"  {line}" for line in format_transform_savings(generation_stats['transform_savings'])))
+            duplicates: Dict[str, str] = generation_stats.get('duplicates', {})
+            if duplicates:
+                approx = "" if 'tokenizer' in generation_stats else "~"
+                self.log_output.append(f"Deduplicated: {len(duplicates)} files identical to earlier ones, saving "
+                                       f"{generation_stats['dedup_saved_bytes']} bytes and {approx}{generation_stats['dedup_saved_tokens']} tokens.")
+                self.log_output.append("\n".join(f"  {path} = {original}" for path, original in duplicates.items()))
+            if worker.token_budget is not None:
+                dropped = generation_stats.get('budget_dropped', [])
+                self.log_output.append(f"Token budget {worker.token_budget.max_tokens}: {len(dropped)} selected files dropped to fit.")
+                if dropped: self.log_output.append("\n".join(f"  dropped: {path} ({tokens} tokens)" for path, tokens in dropped))
+            file_token_counts: Dict[str, int] = generation_stats.get('token_counts', {})
+            if 'tokenizer' not in generation_stats:
+                self.log_output.append(f"Content stats: {word_count} words, ~{token_count} tokens.")
+                QMessageBox.information(self, "Generation Complete",
+                                        f"Context file generated: {os.path.basename(output_filepath_val)}\n"
+                                        f"Words: {word_count}, Tokens (approx): {token_count}")
+                return
+            tokenizer_name = generation_stats['tokenizer']
+            largest_files = sorted(file_token_counts.items(), key=lambda kv: (-kv[1], kv[0]))
+            self.log_output.append(f"Content stats: {word_count} words, {token_count} tokens ({tokenizer_name}).")
+            self.log_output.append(f"Token counts: {generation_stats['token_cache_hits']} cached, {generation_stats['token_cache_misses']} counted.")
+            self.log_output.append("\n".join(f"  {count:>8}  {path}" for path, count in largest_files)) # One append for thousands of files
+            top_lines = "\n".join(f"{count}  {path}" for path, count in largest_files[:TOKEN_REPORT_TOP_FILES])
             QMessageBox.information(self, "Generation Complete",
                                     f"Context file generated: {os.path.basename(output_filepath_val)}\n"
-                                    f"Words: {word_count}, Tokens (approx): {token_count_approx}")
+                                    f"Words: {word_count}, Tokens ({tokenizer_name}): {token_count}\n\n"
+                                    f"Largest files:\n{top_lines}")
+        elif worker.is_cancelled():
+            self.status_output.setText("Status: Generation cancelled.")
         else:
+            self.status_output.setText("Status: Generation failed.")
             self.output_file_path_display.clear(); self._current_generated_filepath = None
             self.view_generated_file_button.setEnabled(False)
             self.log_output.append("Generation failed or no content.")
@@ -1050,52 +2063,21 @@ class ProjectContextGenerator(QMainWindow):
             self.output_file_path_display.clear(); self._current_generated_filepath = None
             self.view_generated_file_button.setEnabled(False); return
         try:
-            MAX_PREVIEW_SIZE = 2 * 1024 * 1024 # 2MB
-            file_size = os.path.getsize(file_path_to_view)
-            
-            with open(file_path_to_view, 'r', encoding='utf-8', errors='replace') as f: 
-                content = f.read(MAX_PREVIEW_SIZE)
-            
-            if file_size > MAX_PREVIEW_SIZE: 
-                content += f"\n\n--- File truncated for viewing ({MAX_PREVIEW_SIZE//1024//1024}MB limit, total size: {file_size // 1024}KB) ---"
-            
-            if '\0' in content: # Check for NUL bytes after reading
-               content = f"Note: This file appears to be binary or contains NUL bytes and might not display correctly.\nShowing partial content up to {MAX_PREVIEW_SIZE//1024//1024}MB.\n\n" + content.replace('\0', '[NUL]')
-
-
-            dialog = ViewFileDialog(file_path_to_view, content, self); dialog.exec()
+            part_paths = self._generated_part_paths if file_path_to_view in self._generated_part_paths else None
+            dialog = ViewFileDialog(file_path_to_view, self, part_paths, decompress=True); dialog.exec()
         except Exception as e:
             QMessageBox.critical(self, "View File Error", f"Could not read/display file: {type(e).__name__}: {e}")
             self.log_output.append(f"Error viewing file '{file_path_to_view}': {type(e).__name__}: {e}")
 
     def handle_tree_double_click(self, index: QModelIndex):
-        item = self.tree_model.itemFromIndex(index);
-        if not item: return
-        item_data = item.data(Qt.ItemDataRole.UserRole);
-        if not item_data: return
-        is_dir = item_data.get('IsDir', False); item_path_rel = item_data.get('Path')
+        item_index = self._item_index(index)
+        if item_index is None: return
+        is_dir = self._all_items_data.is_dir(item_index); item_path_rel = self._all_items_data.paths[item_index]
         if not is_dir:
              if self._project_path and item_path_rel is not None:
                 full_file_path = os.path.join(self._project_path, item_path_rel)
                 if os.path.isfile(full_file_path):
-                    try:
-                        MAX_PREVIEW_SIZE = 2 * 1024 * 1024 # 2MB
-                        file_size = os.path.getsize(full_file_path)
-                        
-                        with open(full_file_path, 'r', encoding='utf-8', errors='replace') as f: 
-                            content = f.read(MAX_PREVIEW_SIZE)
-                        
-                        if file_size > MAX_PREVIEW_SIZE: 
-                            content += f"\n\n--- File truncated for viewing ({MAX_PREVIEW_SIZE//1024//1024}MB limit, total size: {file_size // 1024}KB) ---"
-                        
-                        if '\0' in content: # Check for NUL bytes after reading
-                           content = f"Note: This file appears to be binary or contains NUL bytes and might not display correctly.\nShowing partial content up to {MAX_PREVIEW_SIZE//1024//1024}MB.\n\n" + content.replace('\0', '[NUL]')
-
-
-                        dialog = ViewFileDialog(full_file_path, content, self); dialog.exec()
-                    except UnicodeDecodeError:
-                         QMessageBox.warning(self, "View File Error", f"Could not decode file '{os.path.basename(full_file_path)}' with UTF-8. It might be a binary file or use a different encoding.")
-                         self.log_output.append(f"Error double-clicking file '{full_file_path}': UnicodeDecodeError")
+                    try: dialog = ViewFileDialog(full_file_path, self); dialog.exec()
                     except Exception as e:
                         QMessageBox.critical(self, "View File Error", f"Could not read file: {type(e).__name__}: {e}")
                         self.log_output.append(f"Error double-clicking file '{full_file_path}': {type(e).__name__}: {e}")
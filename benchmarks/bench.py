@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+import tempfile
+from typing import List, Tuple, Dict, Any, Optional, Callable
+
+# Benchmarks for scanning, exclusion matching, tree loading, selection and generation over a synthetic tree (see
+# synthetic_repo.py). Every case runs in its own process, so its peak RSS is its own, and results go to a JSON file
+# that `compare` lines up against another run, e.g. one taken on the previous commit.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, REPO_ROOT]
+from synthetic_repo import RepoSpec, PRESETS, ensure_repo
+
+DEFAULT_REPOS_DIR = os.path.join(tempfile.gettempdir(), "context_compiler_bench") # Generated trees, one per spec fingerprint; kept out of the source tree
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RESULTS_VERSION = 1 # Bump when the result file layout changes
+CASES = ('scan', 'is_excluded', 'tree_load', 'selection', 'generate')
+SELECTION_TOGGLES = 10_000 # Single-file check changes timed by the selection case
+TREE_LOAD_TIMEOUT_S = 900
+BENCH_SETTINGS_ORGANIZATION = "ContextCompilerBenchmark" # QSettings of the tree_load case, apart from the user's own
+
+def _peak_rss_mb() -> Optional[float]:
+    try: import resource
+    except ImportError: return None # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) # Bytes on macOS, KB elsewhere
+
+def _per_second(count: int, seconds: float) -> float: return round(count / max(seconds, 1e-9), 1)
+
+def _load_store(repo: str, workers: int) -> Any:
+    from context_compiler import list_project_items
+    store, message = list_project_items(repo, max_workers=workers)
+    if len(store) <= 1: raise RuntimeError(message)
+    return store
+
+def _file_indexes(store: Any) -> List[int]:
+    return [index for index in range(1, len(store.paths)) if not store.is_dir(index) and not store.is_removed(index)]
+
+# --- Cases: each returns its measurements; 'wall_s' is the timed part and 'files_per_s' the items it handled per second ---
+def case_scan(repo: str, workers: int) -> Dict[str, Any]:
+    # list_project_items: parallel scandir walk plus building the ProjectItemStore
+    from context_compiler import list_project_items
+    timings: Dict[str, float] = {}
+    started = time.perf_counter(); store, _ = list_project_items(repo, max_workers=workers, timings=timings); wall = time.perf_counter() - started
+    files = len(_file_indexes(store))
+    return {'wall_s': wall, 'files_per_s': _per_second(files, wall), 'files': files, 'entries': len(store) - 1,
+            'scan_s': timings.get('scan'), 'assemble_s': timings.get('assemble')}
+
+def case_is_excluded(repo: str, workers: int) -> Dict[str, Any]:
+    # ExclusionMatcher.is_excluded over every name in the tree, excluded directories' contents included
+    from context_compiler import DEFAULT_EXCLUSION_MATCHER
+    names: List[Tuple[str, bool]] = []
+    for _, dirs, files in os.walk(repo): names.extend((name, True) for name in dirs); names.extend((name, False) for name in files)
+    is_excluded = DEFAULT_EXCLUSION_MATCHER.is_excluded
+    started = time.perf_counter(); excluded = sum(is_excluded(name, is_dir) for name, is_dir in names); wall = time.perf_counter() - started
+    return {'wall_s': wall, 'files_per_s': _per_second(len(names), wall), 'names': len(names), 'excluded': excluded}
+
+def case_tree_load(repo: str, workers: int) -> Dict[str, Any]:
+    # load_project_files in the real window (offscreen Qt) until the background scan has filled the store and the
+    # tree model, then check toggles through the model as a click would make them
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from PyQt6.QtCore import Qt, QSettings, QEventLoop
+    except ImportError: return {'skipped': "PyQt6 is not installed"}
+    import app as app_module
+    app_module.ORGANIZATION_NAME = BENCH_SETTINGS_ORGANIZATION # Keeps the synthetic tree out of the user's recent directories
+    QSettings(BENCH_SETTINGS_ORGANIZATION, app_module.APPLICATION_NAME).clear() # Default settings: no watching or content index
+    qt_app = QApplication.instance() or QApplication([])
+    window = app_module.ProjectContextGenerator()
+    try:
+        window.path_input.setText(repo)
+        started = time.perf_counter(); window.load_project_files()
+        while window._load_worker is not None:
+            if time.perf_counter() - started > TREE_LOAD_TIMEOUT_S: raise RuntimeError("Timed out waiting for the tree to load.")
+            qt_app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents, 50)
+        wall = time.perf_counter() - started
+        store = window._all_items_data; model = window.tree_model
+        root = model.index(0, 0); window.tree_view.expand(root); qt_app.processEvents()
+        started = time.perf_counter()
+        model.setData(root, Qt.CheckState.Unchecked.value, Qt.ItemDataRole.CheckStateRole)
+        model.setData(root, Qt.CheckState.Checked.value, Qt.ItemDataRole.CheckStateRole)
+        root_toggle = (time.perf_counter() - started) / 2
+        rows = [model.index(row, 0, root) for row in range(model.rowCount(root))]
+        file_rows = [index for index in rows if not store.is_dir(index.internalId())]
+        started = time.perf_counter()
+        for index in file_rows:
+            model.setData(index, Qt.CheckState.Unchecked.value, Qt.ItemDataRole.CheckStateRole)
+            model.setData(index, Qt.CheckState.Checked.value, Qt.ItemDataRole.CheckStateRole)
+        file_toggle = (time.perf_counter() - started) / max(2 * len(file_rows), 1)
+        files = len(_file_indexes(store))
+        return {'wall_s': wall, 'files_per_s': _per_second(files, wall), 'files': files, 'entries': len(store) - 1,
+                'root_toggle_s': root_toggle, 'file_toggle_ms': file_toggle * 1000 if file_rows else None}
+    finally: window.close()
+
+def case_selection(repo: str, workers: int) -> Dict[str, Any]:
+    # ProjectItemStore check changes and the counters kept above them: single files, the whole tree, and a
+    # selection saved as profile rules and applied again
+    store = _load_store(repo, workers); files = _file_indexes(store)
+    sample = random.Random(1).sample(files, min(SELECTION_TOGGLES, len(files)))
+    started = time.perf_counter()
+    for index in sample: store.set_selected(index, False)
+    for index in sample: store.set_selected(index, True)
+    toggles = time.perf_counter() - started
+    started = time.perf_counter(); store.set_subtree_selected(0, False); store.set_subtree_selected(0, True); subtree = time.perf_counter() - started
+    for index in sample: store.set_selected(index, False)
+    started = time.perf_counter(); rules = store.selection_rules(); to_rules = time.perf_counter() - started
+    started = time.perf_counter(); store.apply_selection_rules(rules); from_rules = time.perf_counter() - started
+    started = time.perf_counter(); store.set_all_selected(False); store.set_all_selected(True); all_selected = time.perf_counter() - started
+    return {'wall_s': toggles + subtree + to_rules + from_rules + all_selected, 'files_per_s': _per_second(2 * len(files), subtree),
+            'files': len(files), 'file_toggle_us': toggles / max(2 * len(sample), 1) * 1e6, 'subtree_toggle_s': subtree / 2,
+            'selection_rules_s': to_rules, 'rules': len(rules), 'apply_rules_s': from_rules, 'set_all_s': all_selected / 2}
+
+def case_generate(repo: str, workers: int) -> Dict[str, Any]:
+    # generate_text_from_selected_files for every file, without a block cache, into a temporary file
+    from context_compiler import generate_text_from_selected_files
+    store = _load_store(repo, workers); files = len(store.selected_file_paths())
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_filepath = os.path.join(out_dir, "bench.txt")
+        started = time.perf_counter()
+        path, message, _, tokens = generate_text_from_selected_files(repo, store, max_workers=workers, output_filepath=output_filepath)
+        wall = time.perf_counter() - started
+        if path is None: raise RuntimeError(message)
+        output_bytes = os.path.getsize(path)
+    return {'wall_s': wall, 'files_per_s': _per_second(files, wall), 'files': files, 'output_bytes': output_bytes,
+            'mb_per_s': round(output_bytes / (1024 * 1024) / max(wall, 1e-9), 1), 'tokens': tokens}
+
+CASE_FUNCTIONS: Dict[str, Callable[[str, int], Dict[str, Any]]] = {
+    'scan': case_scan, 'is_excluded': case_is_excluded, 'tree_load': case_tree_load, 'selection': case_selection, 'generate': case_generate,
+}
+
+# --- Running, recording and comparing ---
+def run_case_process(case: str, repo: str, workers: int) -> Dict[str, Any]:
+    # One case in a fresh interpreter; its result (or error) comes back as the last line of stdout
+    command = [sys.executable, os.path.abspath(__file__), "_case", case, repo, "--workers", str(workers)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'error': (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]}
+    return json.loads(lines[-1])
+
+def _git(*args: str) -> Optional[str]:
+    try: completed = subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True)
+    except OSError: return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+def environment_info() -> Dict[str, Any]:
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {'commit': _git("rev-parse", "HEAD"), 'dirty': bool(status) if status is not None else None,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # The fastest run's measurements, plus every run's wall time to show the spread
+    timed = [run for run in runs if 'wall_s' in run]
+    if not timed: return runs[0] if runs else {'error': "no runs"}
+    best = dict(min(timed, key=lambda run: run['wall_s']))
+    best['runs_wall_s'] = [round(run['wall_s'], 6) for run in timed]
+    best['peak_rss_mb'] = max((run['peak_rss_mb'] for run in timed if run.get('peak_rss_mb') is not None), default=None)
+    return best
+
+def format_results(results: Dict[str, Any]) -> str:
+    lines = [f"{'case':<12} {'wall s':>10} {'files/s':>12} {'peak RSS MB':>12}"]
+    for case, result in results['cases'].items():
+        if 'wall_s' not in result: lines.append(f"{case:<12} {result.get('skipped') or 'error: ' + str(result.get('error'))}"); continue
+        rss = result.get('peak_rss_mb')
+        lines.append(f"{case:<12} {result['wall_s']:>10.4f} {result['files_per_s']:>12,.0f} {rss if rss is not None else '-':>12}")
+    return "\n".join(lines)
+
+def compare_results(base: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Per case present in both: wall time and peak RSS before/after; change is new/base - 1 (negative is faster)
+    rows: List[Dict[str, Any]] = []
+    for case, new_result in new['cases'].items():
+        base_result = base['cases'].get(case, {})
+        if 'wall_s' not in base_result or 'wall_s' not in new_result: continue
+        rows.append({'case': case, 'base_wall_s': base_result['wall_s'], 'new_wall_s': new_result['wall_s'],
+                     'change': new_result['wall_s'] / max(base_result['wall_s'], 1e-9) - 1,
+                     'base_peak_rss_mb': base_result.get('peak_rss_mb'), 'new_peak_rss_mb': new_result.get('peak_rss_mb')})
+    return rows
+
+def format_comparison(base: Dict[str, Any], new: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    def label(results: Dict[str, Any]) -> str:
+        commit = (results.get('environment', {}).get('commit') or "unknown")[:10]
+        return commit + ("+dirty" if results.get('environment', {}).get('dirty') else "")
+    lines = [f"base {label(base)} -> new {label(new)}"]
+    if base.get('repo', {}).get('spec') != new.get('repo', {}).get('spec'): lines.append("Warning: the runs used different synthetic trees.")
+    lines.append(f"{'case':<12} {'base s':>10} {'new s':>10} {'change':>8} {'base MB':>9} {'new MB':>9}")
+    for row in rows:
+        lines.append(f"{row['case']:<12} {row['base_wall_s']:>10.4f} {row['new_wall_s']:>10.4f} {row['change']:>+8.1%} "
+                     f"{row['base_peak_rss_mb'] if row['base_peak_rss_mb'] is not None else '-':>9} "
+                     f"{row['new_peak_rss_mb'] if row['new_peak_rss_mb'] is not None else '-':>9}")
+    return "\n".join(lines)
+
+def _load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f: results = json.load(f)
+    if results.get('version') != RESULTS_VERSION: raise ValueError(f"'{path}' is a version {results.get('version')} result file (expected {RESULTS_VERSION}).")
+    return results
+
+def _add_spec_arguments(parser: Any):
+    parser.add_argument("--preset", choices=list(PRESETS), default="medium", help="Tree size to start from (default: medium)")
+    for key in RepoSpec.KEYS:
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=float if key in ('size_sigma', 'binary_ratio', 'excluded_ratio') else int,
+                            help=f"Override the preset's {key}")
+    parser.add_argument("--repo-dir", help=f"Where the tree is generated (default: {DEFAULT_REPOS_DIR}/<spec>)")
+
+def _spec_from_args(args: Any) -> RepoSpec:
+    return RepoSpec.from_preset(args.preset, **{key: getattr(args, key) for key in RepoSpec.KEYS})
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog="bench", description="Benchmark scanning, selection and generation on a synthetic project tree.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks and write their results to JSON.")
+    _add_spec_arguments(run_parser)
+    run_parser.add_argument("--cases", default=",".join(CASES), help=f"Comma-separated cases (default: {','.join(CASES)})")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is reported (default: 3)")
+    run_parser.add_argument("--workers", type=int, default=8, help="Scan and read threads (default: 8)")
+    run_parser.add_argument("--out", help=f"Result file (default: {os.path.relpath(DEFAULT_RESULTS_DIR, REPO_ROOT)}/<time>_<commit>.json)")
+    run_parser.add_argument("--compare", metavar="BASE_JSON", help="Compare with an earlier result file")
+    generate_parser = commands.add_parser("generate", help="Only generate the synthetic tree.")
+    _add_spec_arguments(generate_parser)
+    compare_parser = commands.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("base"); compare_parser.add_argument("new")
+    compare_parser.add_argument("--fail-above", type=float, metavar="PERCENT", help="Exit with 1 if a case got more than PERCENT slower")
+    case_parser = commands.add_parser("_case") # Internal: one case in this process
+    case_parser.add_argument("case", choices=CASES); case_parser.add_argument("repo"); case_parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "_case":
+        result = CASE_FUNCTIONS[args.case](args.repo, args.workers)
+        result['peak_rss_mb'] = _peak_rss_mb()
+        print(json.dumps(result)); return 0
+    if args.command == "compare":
+        try: base = _load_results(args.base); new = _load_results(args.new)
+        except (OSError, ValueError) as e: print(f"Error: {e}", file=sys.stderr); return 2
+        rows = compare_results(base, new); print(format_comparison(base, new, rows))
+        if args.fail_above is not None and any(row['change'] * 100 > args.fail_above for row in rows): return 1
+        return 0
+
+    try: spec = _spec_from_args(args)
+    except ValueError as e: print(f"Error: {e}", file=sys.stderr); return 2
+    repo = os.path.abspath(args.repo_dir or os.path.join(DEFAULT_REPOS_DIR, spec.fingerprint()))
+    started = time.perf_counter()
+    try: counts = ensure_repo(repo, spec)
+    except (OSError, ValueError) as e: print(f"Error: {e}", file=sys.stderr); return 2
+    print(f"Tree: {repo} ({counts['entries']:,} entries, {counts['bytes'] / (1024 * 1024):.1f} MB, ready in {time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    if args.command == "generate": return 0
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASE_FUNCTIONS]
+    if unknown: print(f"Error: Unknown case(s): {', '.join(unknown)} (expected: {', '.join(CASES)}).", file=sys.stderr); return 2
+    base = None
+    if args.compare:
+        try: base = _load_results(args.compare)
+        except (OSError, ValueError) as e: print(f"Error: {e}", file=sys.stderr); return 2
+    results: Dict[str, Any] = {'version': RESULTS_VERSION, 'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"), 'environment': environment_info(),
+                               'repo': {'spec': spec.to_dict(), 'counts': counts}, 'workers': args.workers, 'repeat': args.repeat, 'cases': {}}
+    for case in cases:
+        runs = [run_case_process(case, repo, args.workers) for _ in range(max(args.repeat, 1))]
+        results['cases'][case] = summarize_runs(runs)
+        result = results['cases'][case]
+        print(f"{case}: " + (f"{result['wall_s']:.4f}s" if 'wall_s' in result else result.get('skipped') or f"error: {result.get('error')}"), file=sys.stderr)
+
+    out = args.out or os.path.join(DEFAULT_RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{(results['environment']['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+    print(format_results(results))
+    if base is not None: print(); print(format_comparison(base, results, compare_results(base, results)))
+    print(out)
+    return 1 if any('error' in result for result in results['cases'].values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
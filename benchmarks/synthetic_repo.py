@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import math
+import random
+import shutil
+from typing import List, Tuple, Dict, Any
+
+# Synthetic project trees for the benchmarks. The same spec and seed always produce the same tree, byte for byte,
+# so timings taken on different commits (or machines) are over identical input.
+
+MARKER_NAME = ".synthetic_repo.json" # Spec of a generated tree, kept in its root (dotfiles are excluded by the scanner)
+CORPUS_BYTES = 1024 * 1024 # Text files are slices of one seeded corpus, so writing 1M files isn't bound by random text
+TEXT_EXTENSIONS: Tuple[Tuple[str, int], ...] = (('.py', 30), ('.js', 15), ('.ts', 15), ('.go', 10), ('.md', 10), ('.json', 10), ('.txt', 10))
+BINARY_EXTENSION = '.dat' # Not excluded by name, so binaries are found by sniffing like unknown files in real projects
+EXCLUDED_DIR_NAMES = ('node_modules', '__pycache__', 'build', 'dist', 'venv', '.git') # All in EXCLUDE_DIRS
+CORPUS_WORDS = (
+    "def", "class", "return", "import", "self", "value", "index", "result", "config", "request", "response", "items",
+    "for", "in", "if", "else", "None", "True", "False", "async", "await", "const", "let", "function", "export",
+    "handler", "client", "server", "cache", "token", "parse", "render", "update", "delete", "create", "user", "path",
+)
+
+PRESETS: Dict[str, Dict[str, Any]] = {
+    'small': {'depth': 3, 'fanout': 4, 'files_per_dir': 10}, # ~900 entries
+    'medium': {'depth': 5, 'fanout': 4, 'files_per_dir': 12}, # ~18k entries
+    'large': {'depth': 6, 'fanout': 5, 'files_per_dir': 12}, # ~250k entries
+    'huge': {'depth': 7, 'fanout': 5, 'files_per_dir': 10, 'max_entries': 1_000_000}, # 1M entries
+}
+
+class RepoSpec:
+    # Shape of a synthetic tree: `depth` levels of `fanout` sub-directories below the root, about `files_per_dir`
+    # files in each (varied +-50%). File sizes are log-normal around `size_median` bytes (spread `size_sigma`, capped
+    # at `size_max`); `binary_ratio` of the files are random bytes and `excluded_ratio` of the directories get a
+    # name the scanner skips (node_modules, build, ...). Generation stops at `max_entries` dirs + files.
+    KEYS = ('depth', 'fanout', 'files_per_dir', 'size_median', 'size_sigma', 'size_max', 'binary_ratio', 'excluded_ratio', 'max_entries', 'seed')
+
+    def __init__(self, depth: int = 5, fanout: int = 4, files_per_dir: int = 12, size_median: int = 2048, size_sigma: float = 1.0,
+                 size_max: int = 4 * 1024 * 1024, binary_ratio: float = 0.05, excluded_ratio: float = 0.05,
+                 max_entries: int = 1_000_000, seed: int = 1):
+        if depth < 0 or fanout < 0 or files_per_dir < 0: raise ValueError("depth, fanout and files_per_dir can't be negative.")
+        if not 0 <= binary_ratio <= 1 or not 0 <= excluded_ratio <= 1: raise ValueError("binary_ratio and excluded_ratio must be between 0 and 1.")
+        if size_median < 1 or size_max < size_median: raise ValueError("size_median must be at least 1 and at most size_max.")
+        self.depth = depth; self.fanout = fanout; self.files_per_dir = files_per_dir
+        self.size_median = size_median; self.size_sigma = max(size_sigma, 0.0); self.size_max = size_max
+        self.binary_ratio = binary_ratio; self.excluded_ratio = excluded_ratio; self.max_entries = max(max_entries, 1); self.seed = seed
+
+    @classmethod
+    def from_preset(cls, name: str, **overrides: Any) -> 'RepoSpec':
+        if name not in PRESETS: raise ValueError(f"Unknown preset '{name}' (expected one of: {', '.join(PRESETS)}).")
+        return cls(**{**PRESETS[name], **{key: value for key, value in overrides.items() if value is not None}})
+
+    def to_dict(self) -> Dict[str, Any]: return {key: getattr(self, key) for key in self.KEYS}
+
+    def fingerprint(self) -> str:
+        return "d{depth}-f{fanout}-n{files_per_dir}-m{size_median}-b{binary_ratio}-x{excluded_ratio}-e{max_entries}-s{seed}".format(**self.to_dict())
+
+def _corpus(rng: random.Random) -> bytes:
+    # Code-like lines of seeded words: compressible, tokenizable and newline-separated like real source
+    lines: List[str] = []; size = 0
+    while size < CORPUS_BYTES:
+        indent = "    " * rng.randrange(4)
+        line = indent + " ".join(rng.choice(CORPUS_WORDS) for _ in range(rng.randint(2, 12))) + "\n"
+        lines.append(line); size += len(line)
+    return "".join(lines).encode("ascii")
+
+def _file_size(rng: random.Random, spec: RepoSpec) -> int:
+    return max(1, min(spec.size_max, int(spec.size_median * math.exp(rng.gauss(0.0, spec.size_sigma)))))
+
+def generate_repo(root: str, spec: RepoSpec) -> Dict[str, Any]:
+    # Writes the tree breadth-first (so a max_entries cut trims the deepest level evenly) and returns its counts,
+    # which are also saved in the root's marker file. root must not exist or be a tree generated earlier.
+    if os.path.exists(root):
+        if not os.path.isfile(os.path.join(root, MARKER_NAME)): raise ValueError(f"'{root}' exists and is not a generated tree; not overwriting it.")
+        shutil.rmtree(root)
+    rng = random.Random(spec.seed); corpus = _corpus(rng)
+    text_extensions = [extension for extension, _ in TEXT_EXTENSIONS]; extension_weights = [weight for _, weight in TEXT_EXTENSIONS]
+    counts = {'dirs': 0, 'files': 0, 'binary_files': 0, 'excluded_dirs': 0, 'excluded_files': 0, 'bytes': 0}
+    os.makedirs(root)
+    level: List[Tuple[str, bool]] = [("", False)] # (dir_rel, inside an excluded dir) of the current depth
+    entries = 0
+    for depth in range(spec.depth + 1):
+        next_level: List[Tuple[str, bool]] = []
+        for dir_rel, excluded in level:
+            dir_abs = os.path.join(root, dir_rel) if dir_rel else root
+            for file_number in range(rng.randint(spec.files_per_dir // 2, spec.files_per_dir + spec.files_per_dir // 2)):
+                if entries >= spec.max_entries: break
+                size = _file_size(rng, spec)
+                if rng.random() < spec.binary_ratio:
+                    name = f"blob_{file_number}{BINARY_EXTENSION}"; content = b"\0" + rng.randbytes(size - 1)
+                    counts['binary_files'] += 1
+                else:
+                    name = f"module_{file_number}{rng.choices(text_extensions, extension_weights)[0]}"
+                    start = rng.randrange(CORPUS_BYTES - min(size, CORPUS_BYTES) + 1)
+                    content = corpus[start:start + size]
+                    if len(content) < size: content *= -(-size // len(content)); content = content[:size]
+                with open(os.path.join(dir_abs, name), "wb") as f: f.write(content)
+                counts['files'] += 1; counts['excluded_files'] += excluded; counts['bytes'] += size; entries += 1
+            if depth == spec.depth: continue
+            for dir_number in range(spec.fanout):
+                if entries >= spec.max_entries: break
+                child_excluded = rng.random() < spec.excluded_ratio
+                name = EXCLUDED_DIR_NAMES[dir_number % len(EXCLUDED_DIR_NAMES)] if child_excluded else f"pkg_{dir_number}"
+                if child_excluded and os.path.exists(os.path.join(dir_abs, name)): name = f"pkg_{dir_number}"; child_excluded = False
+                child_rel = f"{dir_rel}/{name}" if dir_rel else name
+                os.mkdir(os.path.join(root, child_rel))
+                counts['dirs'] += 1; counts['excluded_dirs'] += child_excluded; entries += 1
+                next_level.append((child_rel, excluded or child_excluded))
+        level = next_level
+        if not level or entries >= spec.max_entries: break
+    counts['entries'] = entries
+    with open(os.path.join(root, MARKER_NAME), "w", encoding="utf-8") as f: json.dump({'spec': spec.to_dict(), 'counts': counts}, f, indent=2)
+    return counts
+
+def ensure_repo(root: str, spec: RepoSpec) -> Dict[str, Any]:
+    # Reuses root if it was generated from the same spec, otherwise (re)generates it; returns its counts
+    try:
+        with open(os.path.join(root, MARKER_NAME), encoding="utf-8") as f: marker = json.load(f)
+        if marker.get('spec') == spec.to_dict(): return marker['counts']
+    except (OSError, ValueError): pass
+    return generate_repo(root, spec)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic project tree for the benchmarks.")
+    parser.add_argument("root", help="Directory to create (replaced if it is an earlier generated tree)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="medium")
+    for key in RepoSpec.KEYS:
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=float if key in ('size_sigma', 'binary_ratio', 'excluded_ratio') else int)
+    args = parser.parse_args()
+    try: spec = RepoSpec.from_preset(args.preset, **{key: getattr(args, key) for key in RepoSpec.KEYS})
+    except ValueError as e: print(f"Error: {e}", file=sys.stderr); sys.exit(2)
+    print(json.dumps(generate_repo(args.root, spec)))
@@ -0,0 +1,2774 @@
+# Qt-free core of the context compiler: project scanning, exclusion and .gitignore matching, file rendering, the
+# rendered-block cache and context file generation. app.py builds the GUI on top of it; this module can be imported
+# (or run with `python -m context_compiler compile <path>`) from scripts and CI without loading PyQt6, and it does not
+# create the output directory until a context file or cache is actually written.
+import sys
+import os
+import re # Added for filename sanitization
+import time
+import stat
+import hashlib
+import threading
+import bisect
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
+import fnmatch
+from typing import List, Tuple, Dict, Any, Optional, Set, Iterator, Iterable, Deque, Callable
+
+# --- Constants ---
+OUTPUT_DIR = "output" # Created on first write
+
+# Scanner constants
+SCAN_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4) # Directory reads in flight; scandir is I/O bound
+SCAN_BATCH_INTERVAL_S = 0.1 # How often a background load hands discovered entries to the tree
+SCAN_SIZE_BATCH = 512 # Files statted (or sniffed) per pool task when sizing a selection or greying out binaries
+
+# Generation constants
+MAX_FILE_SIZE_READ = 1024 * 1024 # 1MB
+SNIFF_BYTES = 8192 # Leading bytes examined to tell text from binary and pick the encoding
+BINARY_CONTROL_RATIO = 0.10 # Share of control bytes (other than whitespace, backspace and escape) that marks a binary
+LARGE_FILE_HEAD = 200 # Lines (or ~tokens) kept from the start of a file over MAX_FILE_SIZE_READ
+LARGE_FILE_TAIL = 100 # Lines (or ~tokens) kept from its end
+LARGE_FILE_EXCERPT_MAX_BYTES = 256 * 1024 # Cap per excerpt, for files with very long lines
+TRANSFORM_INDENT_WIDTH = 2 # Spaces per nesting level after the 'indent' transform
+TRANSFORM_SAVINGS_MARK = "\x00transforms " # Prefixes a worker's block with its transform savings
+GENERATION_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4) # File reads in flight while generating
+GENERATION_WINDOW_PER_WORKER = 4 # Rendered blocks buffered per worker ahead of the writer
+
+# Rendered block cache constants
+BLOCK_CACHE_DIR = os.path.join(OUTPUT_DIR, ".block_cache")
+BLOCK_CACHE_MAX_BYTES = 256 * 1024 * 1024 # 256MB of rendered text
+BLOCK_CACHE_VERSION = 2 # Bump when the block format changes
+BLOCK_CACHE_WRITE_BATCH = 256
+BLOCK_CACHE_RACY_WINDOW_NS = 2 * 1_000_000_000
+TOKEN_COUNT_CACHE_MAX_ROWS = 1_000_000
+
+# Tokenizer constants
+TOKENIZERS_DIR = "tokenizers" # <name>/vocab.json + <name>/merges.txt, or <name>.tiktoken
+TOKEN_COUNT_BATCH = 64 # Blocks hashed, looked up in the cache and counted together
+TOKEN_PIECE_MEMO_MAX = 500_000 # Pre-tokenised pieces whose counts are remembered per tokenizer
+TOKEN_HEAP_MERGE_MIN_BYTES = 64 # Longer pieces are merged with a heap (O(n log n)) instead of rescanning every pair
+
+# Token budget packing constants
+PACK_RECENCY_WEIGHT = 0.5 # Value bonus for the most recently modified file (oldest gets none)
+PACK_SIZE_PENALTY = 0.0 # Value divisor per 1000 tokens of file size, on top of the space a file takes
+PACK_DP_BUCKETS = 1000 # Budget resolution of the exact optimiser
+PACK_DP_MAX_CELLS = 1_000_000 # Above candidates * buckets, only the greedy optimiser runs
+PACK_HEADER_MAX_DROPPED = 200 # Dropped files listed by name in the header
+
+# Batch compilation constants
+BATCH_MAX_JOBS = os.cpu_count() or 1 # Projects compiled at once, one process each
+BATCH_JOB_WORKERS = 4 # Scan and read threads inside each project's process
+BATCH_JOB_KEYS: Set[str] = {
+    'path', 'name', 'out', 'include', 'exclude', 'gitignore', 'format', 'compress', 'tokenizer', 'budget', 'priority',
+    'large_files', 'shard_tokens', 'shard_bytes', 'dedup', 'transforms',
+}
+
+# Content index constants
+CONTENT_INDEX_DIR = os.path.join(OUTPUT_DIR, ".content_index") # One SQLite file per project
+CONTENT_INDEX_VERSION = 1 # Bump when the trigram or file table format changes
+CONTENT_INDEX_COMPACT_RATIO = 0.25 # Share of tombstoned file ids at which the posting lists are renumbered
+CONTENT_INDEX_PROGRESS_FILES = 256 # Files indexed between progress reports
+CONTENT_INDEX_STAT_BATCH = 512 # Files statted per pool task
+
+# Viewer constants
+VIEWER_INDEX_BLOCK = 16 * 1024 # Bytes per line index entry; locating a line scans at most one block
+VIEWER_INDEX_CHUNK = 4 * 1024 * 1024 # Bytes indexed between progress reports (a multiple of VIEWER_INDEX_BLOCK)
+VIEWER_MAP_MIN_BYTES = 8 * 1024 * 1024 # Smaller files are read into memory instead of mapped
+VIEWER_MAX_LINE_BYTES = 16 * 1024 # Longer lines are cut for display
+VIEWER_TRANSCODE_CHUNK = 1024 * 1024 # Characters per write while decompressing or re-encoding to a temporary file
+
+# Directories to exclude (lowercase, set for efficient lookup)
+EXCLUDE_DIRS: Set[str] = {
+    '.git', '.idea', 'venv', '__pycache__', 'node_modules', '.vscode',
+    'target', 'build', 'dist', 'out', '.gradle', '.mvn', '.venv', '.mypy_cache', '.pytest_cache',
+    '.ruff_cache', 'env', '.env', 'bower_components', 'jspm_packages',
+    'bin', 'obj', 'packages', 'logs', 'temp', 'tmp', '.terraform', '.terragrunt-cache',
+    '.angular', '.cache', 'coverage', 'docs_build', 'site', 'local_env',
+    '.serverless', '.dynamodb', '.localstack', '.vagrant', '.kitchen', '.next', '.nuxt',
+    'vendor', # Common for PHP/Ruby
+}
+# Files to exclude (lowercase)
+EXCLUDE_FILES_EXACT: Set[str] = {
+    '.ds_store', 'thumbs.db', '.gitignore', 'pipfile.lock',
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock',
+    'npm-debug.log', 'yarn-debug.log', 'yarn.error.log', '.npmrc', '.babelrc', '.eslintrc.js', '.eslintrc.json', '.eslintrc.yaml', '.eslintrc.yml', '.eslintrc', '.prettierrc.js', '.prettierrc.json', '.prettierrc.yaml', '.prettierrc.yml', '.prettierrc',
+    'pytest.ini', 'tox.ini', 'setup.cfg', 'pyproject.toml',
+    '.editorconfig', '.gitattributes', '.gitmodules',
+    'web.config', 'app.config', '.env.local', '.env.development', '.env.production', '.env.test',
+    'nohup.out',
+}
+EXCLUDE_FILES_PATTERNS: List[str] = [
+    '*.log', '*.tmp', '*.bak', '*.swp', '*.swo', '*.cache', '*.DS_Store',
+    '*.pyc', '*.pyo', '*.exe', '*.dll', '*.o', '*.so', '*.bin',
+    '*.zip', '*.tar.gz', '*.rar', '*.7z', '*.gz', '*.bz2', '*.xz',
+    '*.dmg', '*.iso',
+    '*.class', '*.jar', '*.war', '*.ear',
+    '*.pdf', '*.doc', '*.docx', '*.xls', '*.xlsx', '*.ppt', '*.pptx',
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.svg', '*.ico',
+    '*.mp3', '*.wav', '*.ogg', '*.mp4', '*.avi', '*.mkv',
+    '*.lock',
+]
+# ProjectItemStore flag bits
+ITEM_IS_DIR = 1
+ITEM_SELECTED = 2
+ITEM_ERROR = 4
+ITEM_REMOVED = 8
+ITEM_SNIFFED = 16 # ITEM_BINARY below is known
+ITEM_BINARY = 32
+
+# Dot-directories that are still scanned
+ALLOWED_DOT_DIRS: Set[str] = {'.well-known'}
+# Per-directory ignore files honoured when .gitignore support is enabled
+IGNORE_FILE_NAMES: Tuple[str, ...] = ('.gitignore', '.ignore')
+
+
+# --- Helper Functions ---
+
+def get_file_extension(filepath: str) -> str:
+    name = os.path.basename(filepath)
+    parts = name.split('.')
+    if len(parts) > 1 and parts[-1]: return parts[-1].lower()
+    common_names_without_ext = {
+        'dockerfile', 'makefile', 'readme', 'license', '.gitattributes',
+        '.editorconfig', 'jenkinsfile', 'vagrantfile', 'gemfile', 'procfile',
+        '.gitignore', '.env'
+    }
+    name_lower = name.lower()
+    if name_lower in common_names_without_ext: return name_lower
+    if name.startswith('.') and len(parts) == 1:
+        return name_lower[1:]
+    if name.startswith('.') and len(parts) > 1 and not parts[-1]:
+         return parts[1].lower() if len(parts) > 1 else 'text'
+    return 'text'
+
+class ExclusionMatcher:
+    # The exclusion rules above compiled once: set lookups for exact names, a suffix table for '*.ext'
+    # patterns and a single combined regex for any other glob pattern (same results as fnmatch per pattern).
+    def __init__(self, exclude_dirs: Set[str] = EXCLUDE_DIRS, exclude_files_exact: Set[str] = EXCLUDE_FILES_EXACT,
+                 exclude_files_patterns: List[str] = EXCLUDE_FILES_PATTERNS):
+        self.exclude_dirs = frozenset(d.lower() for d in exclude_dirs)
+        self.exclude_files_exact = frozenset(f.lower() for f in exclude_files_exact)
+        suffixes: Set[str] = set(); other_patterns: List[str] = []
+        for pattern in exclude_files_patterns:
+            pattern = os.path.normcase(pattern) # fnmatch.fnmatch normalises case the same way
+            if pattern.startswith('*') and len(pattern) > 1 and not any(c in pattern[1:] for c in '*?['):
+                suffixes.add(pattern[1:])
+            else: other_patterns.append(fnmatch.translate(pattern))
+        self._suffixes = frozenset(suffixes)
+        self._suffix_lengths = tuple(sorted({len(suffix) for suffix in suffixes}))
+        self._pattern_match = re.compile("|".join(other_patterns)).match if other_patterns else None
+
+    def is_excluded(self, name: str, is_dir: bool) -> bool:
+        name_lower = name.lower()
+        if is_dir:
+            # Exclude dot-directories like .git, .idea, etc., but allow specific ones like .well-known
+            return name_lower in self.exclude_dirs or (name.startswith('.') and name_lower not in ALLOWED_DOT_DIRS)
+        # Exclude specific files and patterns, but allow some common dotfiles (like .env, .bashrc)
+        if name_lower in self.exclude_files_exact:
+            return True
+        # Allow .env, .<anything>rc files, and other dotfiles not in EXCLUDE_FILES_EXACT
+        if name.startswith('.') and not name_lower.startswith(".git") and \
+           name_lower != ".env" and not name_lower.endswith("rc"):
+            return True # Exclude if it's a dotfile not explicitly allowed/common
+        suffixes = self._suffixes
+        for length in self._suffix_lengths:
+            if name_lower[-length:] in suffixes: return True
+        return self._pattern_match is not None and self._pattern_match(name_lower) is not None
+
+DEFAULT_EXCLUSION_MATCHER = ExclusionMatcher()
+
+def is_excluded(name: str, is_dir: bool) -> bool:
+    return DEFAULT_EXCLUSION_MATCHER.is_excluded(name, is_dir)
+
+def _gitignore_glob_to_regex(glob: str) -> str:
+    # Translates the body of one .gitignore pattern; '/' is never matched by a wildcard except via '**'.
+    parts: List[str] = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**', i):
+                at_start = i == 0 or glob[i - 1] == '/'
+                if at_start and glob.startswith('**/', i): parts.append('(?:.*/)?'); i += 3; continue
+                if at_start and i + 2 == n: parts.append('.*'); i += 2; continue
+                i += 2; parts.append('[^/]*'); continue # Any other '**' behaves like '*'
+            parts.append('[^/]*')
+        elif c == '?': parts.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and glob[j] in '!^': j += 1
+            if j < n and glob[j] == ']': j += 1
+            while j < n and glob[j] != ']': j += 1
+            if j >= n: parts.append('\\[')
+            else:
+                body = glob[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in '!^': body = '^' + body[1:]
+                parts.append(f'[{body}]'); i = j
+        elif c == '\\' and i + 1 < n: i += 1; parts.append(re.escape(glob[i]))
+        else: parts.append(re.escape(c))
+        i += 1
+    return "".join(parts)
+
+def parse_ignore_lines(lines: List[str], base_rel: str) -> List[Tuple[str, bool, bool]]:
+    # .gitignore lines -> (regex over project-relative paths, negated, directory only), in file order.
+    rules: List[Tuple[str, bool, bool]] = []
+    base_prefix = re.escape(f"{base_rel}/") if base_rel else ""
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        if not line or line.startswith('#'): continue
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line): stripped += ' ' # "\ " keeps one trailing space
+        line = stripped
+        negated = line.startswith('!')
+        if negated: line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'): line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line: continue
+        anchored = '/' in line # A slash at the start or in the middle anchors the pattern to the ignore file's directory
+        line = line.lstrip('/')
+        regex = base_prefix + ("" if anchored else "(?:.*/)?") + _gitignore_glob_to_regex(line) + r"\Z"
+        rules.append((regex, negated, dir_only))
+    return rules
+
+class IgnoreRules:
+    # .gitignore/.ignore rules in effect inside one directory (ancestors' rules first, then its own).
+    # Each rule set compiles to one regex whose alternatives run last-rule-first, so the first hit is the
+    # rule git would apply; dir-only rules are left out of the file regex.
+    __slots__ = ('rules', '_file_match', '_dir_match')
+    _FLAGS = re.IGNORECASE if os.name == 'nt' else 0
+
+    def __init__(self, rules: Tuple[Tuple[str, bool, bool], ...] = ()):
+        self.rules = rules
+        self._file_match = self._compile([rule for rule in rules if not rule[2]])
+        self._dir_match = self._compile(list(rules))
+
+    @classmethod
+    def _compile(cls, rules: List[Tuple[str, bool, bool]]) -> Optional[Tuple[Any, Tuple[bool, ...]]]:
+        if not rules: return None
+        rules = rules[::-1]
+        pattern = re.compile("|".join(f"({regex})" for regex, _, _ in rules), cls._FLAGS)
+        return pattern.match, tuple(negated for _, negated, _ in rules)
+
+    def extended(self, new_rules: List[Tuple[str, bool, bool]]) -> 'IgnoreRules':
+        return IgnoreRules(self.rules + tuple(new_rules)) if new_rules else self
+
+    def is_ignored(self, path_rel: str, is_dir: bool) -> bool:
+        compiled = self._dir_match if is_dir else self._file_match
+        if compiled is None: return False
+        match = compiled[0](path_rel)
+        return match is not None and not compiled[1][match.lastindex - 1]
+
+class GitIgnoreMatcher:
+    # Loads .gitignore/.ignore files (plus .git/info/exclude at the root) per directory and caches the
+    # compiled IgnoreRules by project-relative directory path.
+    def __init__(self, project_path_abs: str, ignore_file_names: Tuple[str, ...] = IGNORE_FILE_NAMES):
+        self.project_path_abs = project_path_abs
+        self.ignore_file_names = ignore_file_names
+        self.loaded_files: Set[str] = set() # Ignore files read so far, e.g. for watching them
+        self._cache: Dict[str, IgnoreRules] = {}
+
+    def _read_rules(self, dir_rel: str, names: Optional[Set[str]] = None) -> List[Tuple[str, bool, bool]]:
+        dir_abs = os.path.join(self.project_path_abs, dir_rel) if dir_rel else self.project_path_abs
+        candidates = [name for name in self.ignore_file_names if names is None or name in names]
+        if not dir_rel: candidates.insert(0, os.path.join('.git', 'info', 'exclude'))
+        rules: List[Tuple[str, bool, bool]] = []
+        for name in candidates:
+            ignore_filepath = os.path.join(dir_abs, name)
+            try:
+                with open(ignore_filepath, 'r', encoding='utf-8', errors='replace') as f:
+                    rules.extend(parse_ignore_lines(f.read().splitlines(), dir_rel))
+            except OSError: continue
+            self.loaded_files.add(ignore_filepath)
+        return rules
+
+    def load(self, dir_rel: str, parent_rules: Optional[IgnoreRules], names: Optional[Set[str]] = None) -> IgnoreRules:
+        # Rules for dir_rel given its parent's rules; `names` (the directory listing) avoids probing for absent files.
+        rules = self._cache.get(dir_rel)
+        if rules is None:
+            rules = (parent_rules or IgnoreRules()).extended(self._read_rules(dir_rel, names))
+            self._cache[dir_rel] = rules
+        return rules
+
+    def invalidate(self, dir_rel: str):
+        # Forgets the rules of dir_rel and everything below it, e.g. after one of its ignore files changed
+        prefix = f"{dir_rel}/"
+        for cached_rel in [key for key in self._cache if key == dir_rel or not dir_rel or key.startswith(prefix)]:
+            self._cache.pop(cached_rel, None)
+
+    def rules_for(self, dir_rel: str) -> IgnoreRules:
+        rules = self._cache.get(dir_rel)
+        if rules is not None: return rules
+        parent_rules = self.rules_for(dir_rel.rpartition('/')[0]) if dir_rel else None
+        return self.load(dir_rel, parent_rules)
+
+class ProjectItem:
+    # View of one ProjectItemStore entry with the dict interface of the original item records
+    # ('Select', 'Type', 'Path', 'Depth', 'Name', 'IsDir' and, for error items, 'Error').
+    __slots__ = ('store', 'index')
+    KEYS = ('Select', 'Type', 'Path', 'Depth', 'Name', 'IsDir')
+
+    def __init__(self, store: 'ProjectItemStore', index: int):
+        self.store = store; self.index = index
+
+    def __getitem__(self, key: str) -> Any:
+        store = self.store; index = self.index
+        if key == 'Path': return store.paths[index]
+        if key == 'Select': return bool(store.flags[index] & ITEM_SELECTED)
+        if key == 'IsDir': return bool(store.flags[index] & ITEM_IS_DIR)
+        if key == 'Name': return store.names[index]
+        if key == 'Depth': return store.depths[index]
+        if key == 'Type': return store.item_type(index)
+        if key == 'Error' and index in store.errors: return store.errors[index]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try: return self[key]
+        except KeyError: return default
+
+    def __setitem__(self, key: str, value: Any):
+        if key != 'Select': raise KeyError(f"Only 'Select' can be changed on a project item, not '{key}'")
+        self.store.set_selected(self.index, bool(value))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS or (key == 'Error' and self.index in self.store.errors)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self.KEYS + (('Error',) if self.index in self.store.errors else ())}
+
+    def __repr__(self) -> str: return f"ProjectItem({self.to_dict()!r})"
+
+class ProjectItemStore:
+    # Scan results as parallel columns instead of one dict per entry: paths, interned names, a flags bytearray and
+    # depth/parent/child-range arrays, plus a path -> index map for O(1) lookups. A directory's children are appended
+    # as one contiguous block [child_start, child_end); children added later (watch mode) go to a small overflow
+    # list. Indexes are stable for the lifetime of the store: removed entries are only flagged. Every entry also keeps
+    # the number of files at or below it, how many of them are selected and their sizes, updated along the parent
+    # chain as entries are added, toggled or removed, so totals for any folder are read in O(1).
+    def __init__(self):
+        self.paths: List[str] = []
+        self.names: List[str] = []
+        self.flags = bytearray()
+        self.depths = array('I')
+        self.parents = array('i')
+        self.child_start = array('i')
+        self.child_end = array('i')
+        self.sizes = array('q') # File size in bytes, -1 until set_file_sizes() (0 for dirs)
+        self.file_totals = array('i') # Live files at or below each entry
+        self.selected_files = array('i')
+        self.total_bytes = array('q') # Known sizes only
+        self.selected_bytes = array('q')
+        self.extra_children: Dict[int, List[int]] = {}
+        self.errors: Dict[int, str] = {}
+        self.index_by_path: Dict[str, int] = {}
+        self._live_count = 0
+
+    def _append(self, path: str, name: str, depth: int, parent: int, item_flags: int) -> int:
+        index = len(self.paths)
+        self.paths.append(path); self.names.append(sys.intern(name)); self.flags.append(item_flags)
+        self.depths.append(depth); self.parents.append(parent)
+        self.child_start.append(0); self.child_end.append(0)
+        is_file = not item_flags & ITEM_IS_DIR
+        self.sizes.append(-1 if is_file else 0); self.file_totals.append(is_file)
+        self.selected_files.append(is_file and bool(item_flags & ITEM_SELECTED))
+        self.total_bytes.append(0); self.selected_bytes.append(0)
+        self.index_by_path[path] = index; self._live_count += 1
+        return index
+
+    def _add_counts(self, index: int, files: int, selected: int, total_bytes: int, selected_bytes: int):
+        # Adds to the counters of index and every folder above it: O(depth)
+        parents = self.parents; file_totals = self.file_totals; selected_files = self.selected_files
+        while index >= 0:
+            file_totals[index] += files; selected_files[index] += selected
+            self.total_bytes[index] += total_bytes; self.selected_bytes[index] += selected_bytes
+            index = parents[index]
+
+    def add_root(self, name: str, selected: bool = True) -> int:
+        return self._append("", name, 0, -1, ITEM_IS_DIR | (ITEM_SELECTED if selected else 0))
+
+    def add_children(self, parent: int, dir_names: List[str], file_names: List[str], selected: bool = True) -> int:
+        # Appends dirs then files under parent (names as listed on disk) and returns the index of the first one
+        first = len(self.paths)
+        if not dir_names and not file_names: return first
+        parent_path = self.paths[parent]
+        prefix = (parent_path + "/") if parent_path else ""
+        depth = parent_path.count("/") + 1 if parent_path else 1 # Same depth rule as the os.walk scanner
+        selected_flag = ITEM_SELECTED if selected else 0
+        for names, kind_flag in ((dir_names, ITEM_IS_DIR), (file_names, 0)):
+            for name in names:
+                self._append(prefix + (name.replace("\\", "/") if "\\" in name else name), name, depth, parent, kind_flag | selected_flag)
+        if self.child_start[parent] == self.child_end[parent] and parent not in self.extra_children:
+            self.child_start[parent] = first; self.child_end[parent] = len(self.paths)
+        else: self.extra_children.setdefault(parent, []).extend(range(first, len(self.paths)))
+        if file_names: self._add_counts(parent, len(file_names), len(file_names) if selected else 0, 0, 0)
+        return first
+
+    def __len__(self) -> int: return self._live_count
+
+    def __iter__(self) -> Iterator[ProjectItem]:
+        for index, item_flags in enumerate(self.flags):
+            if not item_flags & ITEM_REMOVED: yield ProjectItem(self, index)
+
+    def __getitem__(self, index: int) -> ProjectItem:
+        if not 0 <= index < len(self.paths): raise IndexError(index)
+        return ProjectItem(self, index)
+
+    def index_of(self, path: str) -> Optional[int]: return self.index_by_path.get(path)
+    def is_dir(self, index: int) -> bool: return bool(self.flags[index] & ITEM_IS_DIR)
+    def is_selected(self, index: int) -> bool: return bool(self.flags[index] & ITEM_SELECTED)
+    def is_error(self, index: int) -> bool: return bool(self.flags[index] & ITEM_ERROR)
+    def is_removed(self, index: int) -> bool: return bool(self.flags[index] & ITEM_REMOVED)
+
+    def is_sniffed(self, index: int) -> bool: return bool(self.flags[index] & ITEM_SNIFFED)
+    def is_binary(self, index: int) -> bool: return bool(self.flags[index] & ITEM_BINARY)
+
+    def mark_sniffed(self, index: int, binary: bool):
+        self.flags[index] = (self.flags[index] & ~ITEM_BINARY & 0xFF) | ITEM_SNIFFED | (ITEM_BINARY if binary else 0)
+
+    def item_type(self, index: int) -> str:
+        item_flags = self.flags[index]
+        if item_flags & ITEM_ERROR: return '⚠️ Error Dir'
+        return '📁 Dir' if item_flags & ITEM_IS_DIR else '📄 File'
+
+    def set_selected(self, index: int, value: bool):
+        # A file's change is counted in its folders; a folder's own flag only decides what new children start as
+        item_flags = self.flags[index]
+        if bool(item_flags & ITEM_SELECTED) == value: return
+        self.flags[index] = item_flags | ITEM_SELECTED if value else item_flags & ~ITEM_SELECTED & 0xFF
+        if not item_flags & (ITEM_IS_DIR | ITEM_REMOVED):
+            size = max(self.sizes[index], 0)
+            self._add_counts(index, 0, 1 if value else -1, 0, size if value else -size)
+
+    def check_state(self, index: int) -> Optional[bool]:
+        # True/False when every/no file at or below index is selected, None for a mix; folders without files
+        # have their own flag
+        total = self.file_totals[index]
+        if not total or not self.flags[index] & ITEM_IS_DIR: return bool(self.flags[index] & ITEM_SELECTED)
+        selected = self.selected_files[index]
+        return None if 0 < selected < total else selected == total
+
+    def set_file_sizes(self, sizes: Iterable[Tuple[int, int]]):
+        # Records (index, size in bytes) pairs, e.g. from a background stat, and adds the differences to the folders
+        # above, one walk per folder rather than per file
+        flags = self.flags; parents = self.parents; deltas: Dict[int, List[int]] = {}
+        for index, size in sizes:
+            if flags[index] & (ITEM_IS_DIR | ITEM_REMOVED): continue
+            delta = size - max(self.sizes[index], 0); self.sizes[index] = size
+            if not delta: continue
+            selected_delta = delta if flags[index] & ITEM_SELECTED else 0
+            self.total_bytes[index] += delta; self.selected_bytes[index] += selected_delta
+            parent_deltas = deltas.setdefault(parents[index], [0, 0])
+            parent_deltas[0] += delta; parent_deltas[1] += selected_delta
+        for parent, (total_delta, selected_delta) in deltas.items(): self._add_counts(parent, 0, 0, total_delta, selected_delta)
+
+    def unsized_files(self) -> List[int]:
+        flags = self.flags; sizes = self.sizes
+        return [index for index in range(len(flags)) if sizes[index] < 0 and not flags[index] & (ITEM_IS_DIR | ITEM_REMOVED)]
+
+    def unsniffed_files(self) -> List[int]:
+        flags = self.flags
+        return [index for index in range(len(flags)) if not flags[index] & (ITEM_IS_DIR | ITEM_REMOVED | ITEM_SNIFFED)]
+
+    def fs_path(self, index: int) -> str:
+        # Relative path built from the on-disk names ('Path' has backslashes normalised to '/')
+        parts: List[str] = []
+        while index > 0: parts.append(self.names[index]); index = self.parents[index]
+        return "/".join(reversed(parts))
+
+    def children(self, index: int) -> List[int]:
+        children = list(range(self.child_start[index], self.child_end[index]))
+        children.extend(self.extra_children.get(index, ()))
+        flags = self.flags
+        return [child for child in children if not flags[child] & ITEM_REMOVED]
+
+    def has_children(self, index: int) -> bool:
+        flags = self.flags
+        for child in range(self.child_start[index], self.child_end[index]):
+            if not flags[child] & ITEM_REMOVED: return True
+        return any(not flags[child] & ITEM_REMOVED for child in self.extra_children.get(index, ()))
+
+    def iter_subtree(self, index: int) -> Iterator[int]:
+        # index and all of its live descendants, parents before children
+        stack = [index]
+        while stack:
+            current = stack.pop(); yield current
+            stack.extend(self.children(current))
+
+    def set_subtree_selected(self, index: int, value: bool):
+        # Every entry below index ends up all or nothing, so its counters are set directly; only the difference
+        # at index goes up the parent chain
+        flags = self.flags; file_totals = self.file_totals; selected_files = self.selected_files
+        total_bytes = self.total_bytes; selected_bytes = self.selected_bytes
+        selected_before = selected_files[index]; bytes_before = selected_bytes[index]
+        for current in self.iter_subtree(index):
+            if flags[current] & ITEM_ERROR: continue
+            if value: flags[current] |= ITEM_SELECTED; selected_files[current] = file_totals[current]; selected_bytes[current] = total_bytes[current]
+            else: flags[current] &= ~ITEM_SELECTED & 0xFF; selected_files[current] = 0; selected_bytes[current] = 0
+        if self.parents[index] >= 0:
+            self._add_counts(self.parents[index], 0, selected_files[index] - selected_before, 0, selected_bytes[index] - bytes_before)
+
+    def set_all_selected(self, value: bool):
+        flags = self.flags
+        for index in range(len(flags)):
+            if flags[index] & ITEM_ERROR: continue
+            if value: flags[index] |= ITEM_SELECTED
+            else: flags[index] &= ~ITEM_SELECTED & 0xFF
+        self.selected_files = array('i', self.file_totals) if value else array('i', [0]) * len(flags)
+        self.selected_bytes = array('q', self.total_bytes) if value else array('q', [0]) * len(flags)
+
+    def _recount_selected(self):
+        # Rebuilds the selected counters from the flags, bottom-up (children come after their parents)
+        flags = self.flags; parents = self.parents; sizes = self.sizes; count = len(flags)
+        selected_files = array('i', [0]) * count; selected_bytes = array('q', [0]) * count
+        for index in range(count - 1, -1, -1):
+            item_flags = flags[index]
+            if item_flags & ITEM_REMOVED: continue
+            if item_flags & ITEM_SELECTED and not item_flags & ITEM_IS_DIR: selected_files[index] = 1; selected_bytes[index] = max(sizes[index], 0)
+            if index: selected_files[parents[index]] += selected_files[index]; selected_bytes[parents[index]] += selected_bytes[index]
+        self.selected_files = selected_files; self.selected_bytes = selected_bytes
+
+    def selection_rules(self) -> List[str]:
+        # The check states as prefix rules: '+path' checks and '-path' unchecks that entry and everything below it,
+        # the longest matching rule wins, and a bare '+' or '-' is the root. A folder whose files are all checked or
+        # all unchecked takes one rule; a mixed one takes its majority and is refined below, so files added to it
+        # later follow most of their siblings. Folders without files keep their own check state.
+        flags = self.flags; totals = self.file_totals; checked = self.selected_files
+        rules: List[str] = []; stack: List[Tuple[int, Optional[bool]]] = [(0, None)] if self.paths else []
+        while stack:
+            index, inherited = stack.pop(); total = totals[index]
+            state = checked[index] * 2 >= total if total else bool(flags[index] & ITEM_SELECTED)
+            if state != inherited: rules.append(("+" if state else "-") + self.paths[index])
+            if 0 < checked[index] < total: stack.extend((child, state) for child in reversed(self.children(index)))
+        return rules
+
+    def apply_selection_rules(self, rules: Iterable[str]) -> int:
+        # Sets every check state from selection_rules() output in one pass, parents before children (entries no rule
+        # covers are unchecked); returns the number of checked files. Rules for paths that are gone are ignored.
+        selected_by_path: Dict[str, bool] = {}
+        for rule in rules:
+            if rule[:1] not in ("+", "-"): raise ValueError(f"Selection rule '{rule}' must start with '+' or '-'.")
+            selected_by_path[rule[1:]] = rule[0] == "+"
+        flags = self.flags; parents = self.parents; paths = self.paths; checked_files = 0
+        for index in range(len(paths)):
+            item_flags = flags[index]
+            if item_flags & (ITEM_REMOVED | ITEM_ERROR): continue
+            selected = selected_by_path.get(paths[index])
+            if selected is None: selected = bool(index and flags[parents[index]] & ITEM_SELECTED)
+            flags[index] = item_flags | ITEM_SELECTED if selected else item_flags & ~ITEM_SELECTED & 0xFF
+            if selected and not item_flags & ITEM_IS_DIR: checked_files += 1
+        self._recount_selected()
+        return checked_files
+
+    def selected_file_paths(self) -> List[str]:
+        flags = self.flags; paths = self.paths
+        wanted = ITEM_SELECTED
+        mask = ITEM_SELECTED | ITEM_IS_DIR | ITEM_ERROR | ITEM_REMOVED
+        return sorted(paths[index] for index in range(len(flags)) if flags[index] & mask == wanted)
+
+    def remove_subtree(self, index: int) -> List[int]:
+        removed = list(self.iter_subtree(index))
+        if self.parents[index] >= 0:
+            self._add_counts(self.parents[index], -self.file_totals[index], -self.selected_files[index], -self.total_bytes[index], -self.selected_bytes[index])
+        for current in removed:
+            self.flags[current] |= ITEM_REMOVED; self._live_count -= 1
+            if self.index_by_path.get(self.paths[current]) == current: del self.index_by_path[self.paths[current]]
+        return removed
+
+    def rename(self, index: int, new_name: str) -> List[int]:
+        # Renames an entry in place; descendants keep their indexes and get their paths rewritten
+        old_path = self.paths[index]
+        parent_path = old_path.rpartition('/')[0]
+        new_path = (parent_path + "/" if parent_path else "") + (new_name.replace("\\", "/") if "\\" in new_name else new_name)
+        self.names[index] = sys.intern(new_name)
+        affected = list(self.iter_subtree(index))
+        for current in affected:
+            path = self.paths[current]
+            if self.index_by_path.get(path) == current: del self.index_by_path[path]
+        for current in affected:
+            self.paths[current] = new_path + self.paths[current][len(old_path):]
+            self.index_by_path[self.paths[current]] = current
+        return affected
+
+def scan_directory(dir_abs: str, dir_rel: str, matcher: ExclusionMatcher, gitignore: Optional[GitIgnoreMatcher] = None,
+                    parent_rules: Optional[IgnoreRules] = None) -> Tuple[Tuple[List[str], List[str], List[str]], Optional[IgnoreRules]]:
+    # One directory read: returns ((sorted valid dirs, valid dirs to descend in listing order, sorted valid files), ignore rules
+    # in effect here). Mirrors os.walk: unreadable dirs yield nothing, is_dir() errors count as files, symlinked dirs are
+    # listed but not entered.
+    dirs: List[str] = []; descend: List[str] = []; files: List[str] = []
+    excluded = matcher.is_excluded; has_ignore_file = False
+    try:
+        with os.scandir(dir_abs) as it:
+            for entry in it:
+                name = entry.name
+                try: entry_is_dir = entry.is_dir()
+                except OSError: entry_is_dir = False
+                if entry_is_dir:
+                    if excluded(name, True): continue
+                    dirs.append(name)
+                    try: entry_is_link = entry.is_symlink()
+                    except OSError: entry_is_link = False
+                    if not entry_is_link: descend.append(name)
+                else:
+                    if gitignore is not None and name in gitignore.ignore_file_names: has_ignore_file = True
+                    if not excluded(name, False): files.append(name)
+    except OSError:
+        return ([], [], []), parent_rules
+    rules = parent_rules
+    if gitignore is not None:
+        rules = gitignore.load(dir_rel, parent_rules, set(gitignore.ignore_file_names) if has_ignore_file else set())
+        if rules.rules:
+            prefix = f"{dir_rel}/" if dir_rel else ""; ignored = rules.is_ignored
+            dirs = [d for d in dirs if not ignored(prefix + d, True)]
+            descend = [d for d in descend if not ignored(prefix + d, True)]
+            files = [f for f in files if not ignored(prefix + f, False)]
+    dirs.sort(); files.sort()
+    return (dirs, descend, files), rules
+
+def iter_directory_listings(project_path_abs: str, start_rel: str = "", max_workers: int = SCAN_MAX_WORKERS,
+                            matcher: Optional[ExclusionMatcher] = None, gitignore: Optional[GitIgnoreMatcher] = None,
+                            cancel_event: Optional[threading.Event] = None) -> Iterator[Tuple[str, Tuple[List[str], List[str], List[str]]]]:
+    # Reads start_rel and everything below it on a thread pool (scandir releases the GIL), yielding
+    # (dir_rel, (dirs, descend, files)) as each directory completes; a directory always comes before its children.
+    # Setting cancel_event stops the walk: queued reads are dropped and nothing more is yielded.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    matcher = matcher or DEFAULT_EXCLUSION_MATCHER
+    start_rules = gitignore.rules_for(start_rel.rpartition('/')[0]) if gitignore is not None and start_rel else None
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        start_abs = os.path.join(project_path_abs, start_rel) if start_rel else project_path_abs
+        pending = {executor.submit(scan_directory, start_abs, start_rel, matcher, gitignore, start_rules): start_rel}
+        while pending:
+            if cancel_event is not None and cancel_event.is_set(): return
+            done, _ = wait(pending, timeout=SCAN_BATCH_INTERVAL_S if cancel_event is not None else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_rel = pending.pop(future)
+                listing, rules = future.result()
+                for dir_name in listing[1]:
+                    child_rel = f"{dir_rel}/{dir_name}" if dir_rel else dir_name
+                    future_child = executor.submit(scan_directory, os.path.join(project_path_abs, child_rel), child_rel, matcher, gitignore, rules)
+                    pending[future_child] = child_rel
+                yield dir_rel, listing
+    finally: executor.shutdown(wait=True, cancel_futures=True)
+
+def scan_project_tree(project_path_abs: str, store: ProjectItemStore, start_index: int = 0, max_workers: int = SCAN_MAX_WORKERS,
+                      timings: Optional[Dict[str, float]] = None, matcher: Optional[ExclusionMatcher] = None,
+                      gitignore: Optional[GitIgnoreMatcher] = None) -> int:
+    # Reads the descendants of the store entry start_index (the root by default) in parallel, then appends them to
+    # the store in os.walk(topdown=True) order so the item order matches the serial walker exactly. Returns how many
+    # entries were added.
+    t_start = time.perf_counter()
+    start_rel = store.fs_path(start_index)
+    listings: Dict[str, Tuple[List[str], List[str], List[str]]] = dict(
+        iter_directory_listings(project_path_abs, start_rel, max_workers, matcher, gitignore))
+    t_scanned = time.perf_counter()
+
+    count_before = len(store.paths)
+    selected = store.is_selected(start_index)
+    stack: List[Tuple[str, int]] = [(start_rel, start_index)]
+    while stack:
+        dir_rel, dir_index = stack.pop()
+        dirs, descend, files = listings.get(dir_rel, ([], [], []))
+        first = store.add_children(dir_index, dirs, files, selected)
+        if descend:
+            prefix = f"{dir_rel}/" if dir_rel else ""
+            index_by_name = {dir_name: first + offset for offset, dir_name in enumerate(dirs)}
+            stack.extend((prefix + dir_name, index_by_name[dir_name]) for dir_name in reversed(descend))
+    t_assembled = time.perf_counter()
+
+    if timings is not None:
+        timings['scan'] = t_scanned - t_start
+        timings['assemble'] = t_assembled - t_scanned
+        timings['directories'] = float(len(listings))
+    return len(store.paths) - count_before
+
+def _iter_file_batches(project_path_abs: str, relative_filepaths: List[str], read_file: Callable[[str], Any], max_workers: int,
+                       cancel_event: Optional[threading.Event]) -> Iterator[List[Any]]:
+    # Runs read_file(full path) over the files on a thread pool and yields the results in input order,
+    # SCAN_SIZE_BATCH at a time. Setting cancel_event stops it between batches.
+    from concurrent.futures import ThreadPoolExecutor
+    def read_batch(paths: List[str]) -> List[Any]: # Batched: one task per file costs more than a stat
+        return [read_file(os.path.join(project_path_abs, path)) for path in paths]
+    batches = [relative_filepaths[start:start + SCAN_SIZE_BATCH] for start in range(0, len(relative_filepaths), SCAN_SIZE_BATCH)]
+    if not batches: return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = [executor.submit(read_batch, batch) for batch in batches]
+        try:
+            for future in futures:
+                if cancel_event is not None and cancel_event.is_set(): return
+                yield future.result()
+        finally:
+            for future in futures: future.cancel()
+
+def _file_size(full_filepath: str) -> int:
+    try: return os.stat(full_filepath).st_size
+    except (OSError, ValueError): return 0
+
+def iter_file_sizes(project_path_abs: str, relative_filepaths: List[str], max_workers: int = SCAN_MAX_WORKERS,
+                    cancel_event: Optional[threading.Event] = None) -> Iterator[List[int]]:
+    # Yields the files' sizes in input order, SCAN_SIZE_BATCH at a time (0 for files that can't be statted)
+    return _iter_file_batches(project_path_abs, relative_filepaths, _file_size, max_workers, cancel_event)
+
+def _is_binary_file(full_filepath: str) -> bool: return sniff_file(full_filepath)[0] is None
+
+def iter_file_sniffs(project_path_abs: str, relative_filepaths: List[str], max_workers: int = SCAN_MAX_WORKERS,
+                     cancel_event: Optional[threading.Event] = None) -> Iterator[List[bool]]:
+    # Sniffs the files (their first SNIFF_BYTES) and yields whether each is binary, in input order, SCAN_SIZE_BATCH
+    # at a time; what the tree greys out after a scan
+    return _iter_file_batches(project_path_abs, relative_filepaths, _is_binary_file, max_workers, cancel_event)
+
+def list_project_items(project_path: str, max_workers: int = SCAN_MAX_WORKERS, timings: Optional[Dict[str, float]] = None,
+                       matcher: Optional[ExclusionMatcher] = None, respect_gitignore: bool = False,
+                       gitignore: Optional[GitIgnoreMatcher] = None) -> Tuple[ProjectItemStore, str]:
+    # Returns a ProjectItemStore; iterating it yields dict-like ProjectItem records in the original order.
+    items = ProjectItemStore()
+    if not project_path or not os.path.isdir(project_path):
+        return items, "Error: Project path is invalid or not a directory."
+
+    t_start = time.perf_counter()
+    project_path_abs = os.path.abspath(project_path)
+    items.add_root(os.path.basename(project_path_abs) or project_path_abs)
+    try:
+        if gitignore is None and respect_gitignore: gitignore = GitIgnoreMatcher(project_path_abs)
+        scan_project_tree(project_path_abs, items, 0, max_workers, timings, matcher, gitignore)
+    except Exception as e:
+        return items, f"An unexpected error occurred while scanning: {type(e).__name__}: {e}"
+    finally:
+        if timings is not None: timings['total'] = time.perf_counter() - t_start
+
+    return items, scan_summary_message(project_path_abs, len(items) - 1)
+
+def scan_summary_message(project_path_abs: str, item_count: int) -> str:
+    if item_count <= 0:
+         try: has_any_entries = any(True for _ in os.scandir(project_path_abs))
+         except Exception: has_any_entries = False
+         if has_any_entries:
+              return "No displayable files or sub-directories found (all might be excluded or filtered)."
+         else:
+              return "Project directory appears to be empty or inaccessible."
+    return f"Found {item_count} items (excluding root). Scan complete."
+
+def _translate_newlines(text: str) -> str:
+    # Same result as reading in text mode with universal newlines
+    return text.replace('\r\n', '\n').replace('\r', '\n') if '\r' in text else text
+
+# --- Sniffing ---
+# File signatures of common binary formats, checked before anything else
+BINARY_SIGNATURES: Tuple[Tuple[bytes, str], ...] = (
+    (b'\x89PNG\r\n\x1a\n', "PNG image"), (b'\xff\xd8\xff', "JPEG image"), (b'GIF87a', "GIF image"), (b'GIF89a', "GIF image"),
+    (b'%PDF-', "PDF document"), (b'PK\x03\x04', "ZIP archive"), (b'\x1f\x8b', "gzip archive"), (b'\xfd7zXZ\x00', "xz archive"),
+    (b'7z\xbc\xaf\x27\x1c', "7z archive"), (b'\x28\xb5\x2f\xfd', "zstd archive"), (b'\x7fELF', "ELF executable"),
+    (b'\xca\xfe\xba\xbe', "Java class or Mach-O binary"), (b'\xcf\xfa\xed\xfe', "Mach-O binary"), (b'\x00asm', "WebAssembly module"),
+    (b'SQLite format 3\x00', "SQLite database"), (b'OggS', "Ogg media"), (b'ID3', "MP3 audio"), (b'wOFF', "WOFF font"), (b'wOF2', "WOFF2 font"),
+)
+# Byte order marks, longest first (the UTF-32 LE mark starts with the UTF-16 LE one)
+TEXT_BOMS: Tuple[Tuple[bytes, str], ...] = (
+    (b'\xff\xfe\x00\x00', 'utf-32'), (b'\x00\x00\xfe\xff', 'utf-32'), (b'\xef\xbb\xbf', 'utf-8-sig'),
+    (b'\xff\xfe', 'utf-16'), (b'\xfe\xff', 'utf-16'),
+)
+# Bytes that don't count towards the control ratio: printable ASCII, all high bytes, \t \n \f \r, backspace, escape
+_NON_CONTROL_BYTES = bytes([8, 9, 10, 12, 13, 27]) + bytes(range(32, 127)) + bytes(range(128, 256))
+
+def sniff_bytes(head: bytes) -> Tuple[Optional[str], str]:
+    # Classifies a file from its first SNIFF_BYTES bytes: (encoding, '') for text, (None, reason) for binary. The
+    # encoding is a BOM's, else 'utf-8' when the head is valid UTF-8 (a character cut off at the end is fine),
+    # else 'latin-1'.
+    for bom, encoding in TEXT_BOMS:
+        if head.startswith(bom): return encoding, ""
+    for signature, kind in BINARY_SIGNATURES:
+        if head.startswith(signature): return None, f"{kind} signature"
+    if b'\0' in head: return None, "contained NUL bytes"
+    if head and len(head.translate(None, _NON_CONTROL_BYTES)) > len(head) * BINARY_CONTROL_RATIO: return None, "mostly control characters"
+    if head.isascii(): return 'utf-8', ""
+    try: head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if not (e.reason == 'unexpected end of data' and e.start >= len(head) - 3): return 'latin-1', ""
+    return 'utf-8', ""
+
+def sniff_file(full_filepath: str) -> Tuple[Optional[str], str]:
+    # sniff_bytes() on a file's head; unreadable files count as text (generation reports the read error)
+    try:
+        with open(full_filepath, 'rb') as f: return sniff_bytes(f.read(SNIFF_BYTES))
+    except OSError: return 'utf-8', ""
+
+# --- File records ---
+class FileRecord:
+    # One file as read for the context, independent of the output format. kind is 'text', 'excerpt' (head and tail
+    # of a large file), 'empty', 'skipped', 'error' or 'duplicate' (same bytes as the earlier file duplicate_of);
+    # content is the decoded text (None unless text/excerpt) and message the note or error shown instead of, or for
+    # excerpts before, the content.
+    __slots__ = ('path', 'kind', 'content', 'language', 'encoding', 'message', 'duplicate_of')
+
+    def __init__(self, path: str, kind: str, content: Optional[str] = None, language: str = "", encoding: str = "", message: str = "",
+                 duplicate_of: str = ""):
+        self.path = path; self.kind = kind; self.content = content
+        self.language = language # File extension hint, e.g. 'py'
+        self.encoding = encoding # '' for UTF-8, else e.g. 'Latin-1' or 'UTF-16'
+        self.message = message
+        self.duplicate_of = duplicate_of
+
+def _binary_record(relative_filepath: str, reason: str) -> FileRecord:
+    return FileRecord(relative_filepath, "skipped", message=f"Skipped potential binary file ({reason}).")
+
+def _large_file_skipped_record(relative_filepath: str) -> FileRecord:
+    return FileRecord(relative_filepath, "skipped", message=f"Skipped file larger than {MAX_FILE_SIZE_READ // 1024}KB.")
+
+def _read_error_record(relative_filepath: str, e: Exception) -> FileRecord:
+    return FileRecord(relative_filepath, "error", message=f"Error reading file content: {type(e).__name__}: {e}")
+
+def _unexpected_error_record(relative_filepath: str, e: Exception) -> FileRecord:
+    return FileRecord(relative_filepath, "error", message=f"Unexpected error processing file: {type(e).__name__}: {e}")
+
+def _encoding_label(encoding: str) -> str:
+    if encoding == 'latin-1': return "Latin-1"
+    return encoding.upper() if encoding.startswith('utf-16') or encoding.startswith('utf-32') else ""
+
+def file_record_from_bytes(relative_filepath: str, raw: bytes, sniffed: Optional[Tuple[Optional[str], str]] = None) -> FileRecord:
+    # Decodes the contents of a non-empty file that is within MAX_FILE_SIZE_READ. The text is decoded once, with the
+    # encoding sniffed from its head; only UTF-8 that turns invalid past the head falls back to latin-1.
+    encoding, reason = sniffed or sniff_bytes(raw[:SNIFF_BYTES])
+    if encoding is None: return _binary_record(relative_filepath, reason)
+    try: file_content = raw.decode(encoding)
+    except UnicodeDecodeError:
+        if encoding != 'utf-8': return _binary_record(relative_filepath, f"invalid {encoding.upper()}")
+        encoding = 'latin-1'; file_content = raw.decode(encoding)
+    file_content = _translate_newlines(file_content)
+    if '\0' in file_content: return _binary_record(relative_filepath, "contained NUL bytes")
+    return FileRecord(relative_filepath, "text", file_content.strip(), get_file_extension(relative_filepath), _encoding_label(encoding))
+
+class LargeFilePolicy:
+    # How files over MAX_FILE_SIZE_READ are rendered: mode 'skip' (the default, as before excerpts existed) leaves a
+    # note, 'excerpt' memory-maps the file and keeps its first `head` and last `tail` lines (unit 'lines') or about
+    # that many tokens (unit 'tokens', at ~4 bytes a token), with the middle elided. Picklable, for process pool workers.
+    def __init__(self, mode: str = "skip", head: int = LARGE_FILE_HEAD, tail: int = LARGE_FILE_TAIL, unit: str = "lines"):
+        if mode not in ("skip", "excerpt"): raise ValueError(f"Unknown large file mode '{mode}' (expected 'skip' or 'excerpt').")
+        if unit not in ("lines", "tokens"): raise ValueError(f"Unknown excerpt unit '{unit}' (expected 'lines' or 'tokens').")
+        self.mode = mode; self.head = max(head, 0); self.tail = max(tail, 0); self.unit = unit
+
+    def describe(self) -> str:
+        return "skip" if self.mode == "skip" else f"first {self.head} and last {self.tail} {self.unit}"
+
+DEFAULT_LARGE_FILE_POLICY = LargeFilePolicy()
+
+def _format_size(size: int) -> str:
+    return f"{size / (1024 ** 3):.1f} GB" if size >= 1024 ** 3 else f"{size / (1024 ** 2):.1f} MB"
+
+def _excerpt_end(mm: Any, count: int, unit: str) -> int:
+    # End offset of the first `count` lines (or ~tokens), cut after a newline where possible
+    limit = min(len(mm), LARGE_FILE_EXCERPT_MAX_BYTES if unit == "lines" else min(count * 4, LARGE_FILE_EXCERPT_MAX_BYTES))
+    if unit == "tokens":
+        cut = mm.rfind(b'\n', 0, limit) + 1
+        return cut if cut > limit // 2 else limit
+    position = 0
+    for _ in range(count):
+        newline = mm.find(b'\n', position, limit)
+        if newline < 0: return limit
+        position = newline + 1
+    return position
+
+def _excerpt_start(mm: Any, count: int, unit: str) -> int:
+    # Start offset of the last `count` lines (or ~tokens); a final newline doesn't start an extra empty line
+    size = len(mm)
+    floor = max(0, size - (LARGE_FILE_EXCERPT_MAX_BYTES if unit == "lines" else min(count * 4, LARGE_FILE_EXCERPT_MAX_BYTES)))
+    end = size - 1 if mm[size - 1:size] == b'\n' else size
+    if unit == "tokens":
+        cut = mm.find(b'\n', floor, end) + 1
+        return cut if 0 < cut <= floor + (size - floor) // 2 else floor
+    position = end
+    for _ in range(count):
+        newline = mm.rfind(b'\n', floor, position)
+        if newline < 0: return floor
+        position = newline
+    return position + 1 if count else size
+
+def read_large_file_excerpt(relative_filepath: str, full_filepath: str, policy: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY) -> FileRecord:
+    # Head and tail of a file over MAX_FILE_SIZE_READ, read through mmap so only those pages are touched: a multi-GB
+    # file costs about as much as a small one. The line count is estimated from the excerpts' average line length.
+    import mmap
+    with open(full_filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        encoding, reason = sniff_bytes(mm[:SNIFF_BYTES])
+        if encoding is None: return _binary_record(relative_filepath, reason)
+        if encoding not in ('utf-8', 'utf-8-sig', 'latin-1'): return _large_file_skipped_record(relative_filepath) # Newline search needs an ASCII-compatible encoding
+        head_end = _excerpt_end(mm, policy.head, policy.unit) if policy.head else 0
+        tail_start = max(_excerpt_start(mm, policy.tail, policy.unit), head_end)
+        head = mm[:head_end]; tail = mm[tail_start:]
+    elided_bytes = tail_start - head_end
+    head_newlines = head.count(b'\n'); tail_newlines = tail.count(b'\n')
+    elided_lines = round(elided_bytes * (head_newlines + tail_newlines) / max(len(head) + len(tail), 1))
+    total_lines = head_newlines + elided_lines + tail_newlines + (0 if tail.endswith(b'\n') or not tail else 1)
+    head_lines = head_newlines + (1 if head and not head.endswith(b'\n') else 0) # Counting a cut-off line
+    tail_lines = tail_newlines + (1 if tail and not tail.endswith(b'\n') else 0)
+    decode = lambda raw, codec: _translate_newlines(raw.decode(codec, errors='replace')) # Cuts may split a character
+    head_text = decode(head, encoding).strip()
+    tail_text = decode(tail, 'utf-8' if encoding == 'utf-8-sig' else encoding).strip()
+    shown = f"first {head_lines} and last {tail_lines} lines" if policy.unit == "lines" else f"first ~{len(head) // 4} and last ~{len(tail) // 4} tokens"
+    marker = "\n"
+    if elided_lines: marker = f"\n[... ~{elided_lines:,} lines ({_format_size(elided_bytes)}) omitted ...]\n"
+    elif elided_bytes: marker = f"\n[... {_format_size(elided_bytes)} omitted ...]\n"
+    return FileRecord(relative_filepath, "excerpt", f"{head_text}{marker}{tail_text}", get_file_extension(relative_filepath),
+                      _encoding_label(encoding), f"Large file ({_format_size(size)}, ~{total_lines:,} lines); showing the {shown}.")
+
+# --- Content transforms ---
+# Lossy, token-reducing rewrites of a text file's contents, chosen per extension by a TransformPolicy and run on the
+# read workers. Each takes (text, extension) and returns the new text.
+def _comment_syntax(line_prefixes: Tuple[str, ...], block_delimiters: Tuple[Tuple[str, str], ...], quotes: str,
+                    spaced_prefixes: Tuple[str, ...] = (), regex_literals: bool = False, stylesheet: bool = False) -> Any:
+    # One regex alternating string literals (kept) with comments (removed); whichever starts first wins, so comment
+    # markers inside strings are left alone. Line prefixes in spaced_prefixes only start a comment at the start of a
+    # line or after whitespace, and '#' never as '#{' (interpolation), so '$#' and "#{x}" survive. regex_literals keeps
+    # JavaScript /regex/ literals (a '/' after an operator or opening bracket) intact; stylesheet keeps unquoted
+    # url(...) tokens, so 'url(http://...)' isn't cut at the '//'.
+    alternatives = []
+    if stylesheet: alternatives.append(r"(?P<url>\burl\((?:\\.|[^)\\\n])*\))")
+    if regex_literals: alternatives.append(r"(?P<regex>[(,=:\[!&|?{};]\s*/(?![/*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*)")
+    for quote in quotes:
+        q = re.escape(quote)
+        alternatives.append(f"(?P<s{len(alternatives)}>{q}(?:\\\\.|[^\\\\{q}])*{q})" if quote == "`" else f"(?P<s{len(alternatives)}>{q}(?:\\\\.|[^\\\\{q}\\n])*{q})")
+    comments = [f"{re.escape(start)}.*?{re.escape(end)}" for start, end in block_delimiters]
+    for prefix in line_prefixes:
+        if prefix == "#" and prefix in spaced_prefixes: comments.append("(?:^|(?<=\\s))#(?!\\{)[^\\n]*")
+        elif prefix in spaced_prefixes: comments.append(f"(?:^|(?<=\\s)){re.escape(prefix)}[^\\n]*")
+        else: comments.append(f"{re.escape(prefix)}[^\\n]*")
+    return re.compile("|".join(alternatives + ([f"(?P<comment>{'|'.join(comments)})"] if comments else [])), re.DOTALL | re.MULTILINE)
+
+_C_COMMENTS = (("//",), (("/*", "*/"),), "\"'`")
+_HASH_COMMENTS = (("#",), (), "\"'")
+COMMENT_SYNTAX_BY_EXTENSION: Dict[str, Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...], str]] = {
+    **{ext: _C_COMMENTS for ext in ('js', 'jsx', 'mjs', 'cjs', 'ts', 'tsx', 'go', 'c', 'h', 'cc', 'cpp', 'cxx', 'hpp', 'hh', 'cs',
+                                    'java', 'kt', 'kts', 'scala', 'swift', 'rs', 'dart', 'groovy', 'gradle', 'proto', 'sol', 'zig')},
+    **{ext: _HASH_COMMENTS for ext in ('sh', 'bash', 'zsh', 'fish', 'rb', 'pl', 'pm', 'r', 'yaml', 'yml', 'toml', 'tf', 'hcl',
+                                       'ps1', 'cmake', 'dockerfile', 'makefile', 'nix', 'ex', 'exs', 'jl', 'coffee')},
+    'php': (("//", "#"), (("/*", "*/"),), "\"'"),
+    'css': ((), (("/*", "*/"),), "\"'"), 'scss': _C_COMMENTS, 'less': _C_COMMENTS,
+    'sql': (("--",), (("/*", "*/"),), "'\""),
+    'lua': (("--",), (("--[[", "]]"),), "\"'"), 'hs': (("--",), (("{-", "-}"),), "\""),
+    **{ext: ((), (("<!--", "-->"),), "") for ext in ('html', 'htm', 'xml', 'svg', 'vue', 'xhtml', 'md')},
+}
+_REGEX_LITERAL_EXTENSIONS: Set[str] = {'js', 'jsx', 'mjs', 'cjs', 'ts', 'tsx'}
+_STYLESHEET_EXTENSIONS: Set[str] = {'css', 'scss', 'less'} # '//' only after whitespace, and url(...) kept whole
+_COMMENT_PATTERNS: Dict[str, Any] = {}
+_COMMENT_MARK = "\x00" # Left where a comment was, so lines that held only comments can be dropped afterwards
+_LICENSE_WORDS = re.compile(r"\b(?:copyright|licen[cs]e[ds]?|spdx-license-identifier)\b", re.IGNORECASE)
+
+def _comment_pattern(extension: str) -> Any:
+    pattern = _COMMENT_PATTERNS.get(extension)
+    if pattern is None and extension in COMMENT_SYNTAX_BY_EXTENSION:
+        line_prefixes, block_delimiters, quotes = COMMENT_SYNTAX_BY_EXTENSION[extension]
+        stylesheet = extension in _STYLESHEET_EXTENSIONS
+        pattern = _COMMENT_PATTERNS[extension] = _comment_syntax(line_prefixes, block_delimiters, quotes, ("#", "//") if stylesheet else ("#",),
+                                                                 extension in _REGEX_LITERAL_EXTENSIONS, stylesheet)
+    return pattern
+
+def _drop_marked_lines(text: str) -> str:
+    # Removes comment marks, dropping the lines that held nothing but comments
+    lines = []
+    for line in text.split("\n"):
+        if _COMMENT_MARK not in line: lines.append(line); continue
+        line = line.replace(_COMMENT_MARK, "").rstrip()
+        if line.strip(): lines.append(line)
+    return "\n".join(lines)
+
+def _strip_python_comments(text: str) -> str:
+    # Python comments found with the tokenizer, so '#' in strings is never touched; docstrings are kept.
+    # Unparseable files are returned unchanged.
+    import io, tokenize
+    try: tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+    except (tokenize.TokenError, SyntaxError): return text
+    lines = text.split("\n")
+    for token in tokens:
+        if token.type != tokenize.COMMENT or (token.start[0] == 1 and token.string.startswith("#!")): continue
+        row, col = token.start
+        lines[row - 1] = lines[row - 1][:col] + _COMMENT_MARK
+    return _drop_marked_lines("\n".join(lines))
+
+def strip_comments(text: str, extension: str) -> str:
+    if extension in ('py', 'pyw', 'pyi'): return _strip_python_comments(text)
+    pattern = _comment_pattern(extension)
+    if pattern is None: return text
+    shebang = text.startswith("#!")
+    def replace(match: Any) -> str:
+        if match.lastgroup != "comment" or (shebang and match.start() == 0): return match.group(0)
+        return _COMMENT_MARK + "\n" * match.group(0).count("\n") # Newlines kept so the lines after stay lines
+    return _drop_marked_lines(pattern.sub(replace, text))
+
+def strip_license_header(text: str, extension: str) -> str:
+    # Drops a leading comment block (after any shebang) that mentions a copyright or licence; the same header
+    # repeated in every file is pure overhead once the project's LICENSE file is included.
+    syntax = COMMENT_SYNTAX_BY_EXTENSION.get(extension, (("#",), (), "") if extension in ('py', 'pyw', 'pyi') else None)
+    if syntax is None: return text
+    line_prefixes, block_delimiters, _ = syntax
+    start = text.index("\n") + 1 if text.startswith("#!") and "\n" in text else 0
+    body = text[start:].lstrip("\n"); header_end = -1
+    for open_mark, close_mark in block_delimiters:
+        if body.startswith(open_mark):
+            close = body.find(close_mark, len(open_mark))
+            if close >= 0: header_end = close + len(close_mark)
+            break
+    if header_end < 0 and line_prefixes:
+        lines = body.split("\n"); count = 0
+        while count < len(lines) and lines[count].lstrip().startswith(line_prefixes): count += 1
+        if count: header_end = len("\n".join(lines[:count]))
+    if header_end < 0 or not _LICENSE_WORDS.search(body[:header_end]): return text
+    return (text[:start] + body[header_end:].lstrip("\n")).strip("\n")
+
+def collapse_blank_lines(text: str, extension: str) -> str:
+    # Trailing whitespace removed and runs of blank lines collapsed to one
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in text.split("\n")))
+
+def normalise_indentation(text: str, extension: str) -> str:
+    # Re-indents with TRANSFORM_INDENT_WIDTH spaces per level, the level unit being the file's smallest indent (tabs
+    # count as 4). When some indent isn't a whole number of units (aligned continuation lines), every distinct indent
+    # gets the next level up instead. Either way a deeper line stays deeper and equal ones stay equal, so Python and
+    # YAML blocks keep their structure; tab-significant files are left alone.
+    if extension in ('makefile', 'mk', 'go', 'tsv'): return text
+    lines = text.split("\n")
+    indents = [len(line) - len(line.lstrip(" \t")) for line in lines]
+    widths = [len(line[:indent].expandtabs(4)) for line, indent in zip(lines, indents)]
+    used = sorted({width for width, line in zip(widths, lines) if width and line.strip()})
+    if not used or used[0] <= TRANSFORM_INDENT_WIDTH: return text
+    unit = used[0]
+    if all(width % unit == 0 for width in used): new_width = {width: width // unit * TRANSFORM_INDENT_WIDTH for width in used}
+    else: new_width = {width: level * TRANSFORM_INDENT_WIDTH for level, width in enumerate(used, 1)}
+    new_width[0] = 0
+    return "\n".join(" " * new_width[width] + line[indent:] if line.strip() else line for line, indent, width in zip(lines, indents, widths))
+
+TRANSFORMS: Dict[str, Callable[[str, str], str]] = {
+    "license": strip_license_header, "comments": strip_comments, "indent": normalise_indentation, "blank_lines": collapse_blank_lines,
+} # Always applied in this order
+
+class TransformPolicy:
+    # Which TRANSFORMS run on which files: rules map an extension (as from get_file_extension) to transform names,
+    # '*' covering the other extensions. Picklable, for process pool workers.
+    def __init__(self, rules: Optional[Dict[str, Iterable[str]]] = None):
+        self.rules: Dict[str, Tuple[str, ...]] = {}
+        for extension, names in (rules or {}).items():
+            names = set(names); unknown = sorted(names - set(TRANSFORMS))
+            if unknown: raise ValueError(f"Unknown transform '{unknown[0]}' (expected one of: {', '.join(TRANSFORMS)}).")
+            self.rules[extension.lower().lstrip('.')] = tuple(name for name in TRANSFORMS if name in names)
+
+    def for_extension(self, extension: str) -> Tuple[str, ...]:
+        return self.rules.get(extension, self.rules.get('*', ()))
+
+    def cache_variant(self, relative_filepath: str) -> str:
+        names = self.for_extension(get_file_extension(relative_filepath))
+        return "|tx:" + ",".join(names) if names else ""
+
+def parse_transform_rule(spec: str) -> Tuple[List[str], List[str]]:
+    # 'py,js=comments,blank_lines' -> (['py', 'js'], ['comments', 'blank_lines'])
+    extensions, separator, names = spec.partition("=")
+    extensions_list = [ext.strip() for ext in extensions.split(",") if ext.strip()]
+    names_list = [name.strip() for name in names.split(",") if name.strip()]
+    if not separator or not extensions_list or not names_list:
+        raise ValueError(f"Invalid transform rule '{spec}': expected EXT[,EXT...]=TRANSFORM[,TRANSFORM...].")
+    unknown = [name for name in names_list if name not in TRANSFORMS]
+    if unknown: raise ValueError(f"Unknown transform '{unknown[0]}' in '{spec}' (expected one of: {', '.join(TRANSFORMS)}).")
+    return extensions_list, names_list
+
+def apply_transforms(record: FileRecord, transforms: TransformPolicy) -> List[Tuple[str, int, int]]:
+    # Rewrites a text record's content in place; returns (transform, chars before, chars after) for each one run
+    if record.kind != "text" or not record.content: return []
+    savings = []; text = record.content
+    for name in transforms.for_extension(record.language):
+        before = len(text); text = TRANSFORMS[name](text, record.language).strip()
+        savings.append((name, before, len(text)))
+    record.content = text
+    return savings
+
+def transform_policy_from_rules(specs: Iterable[str]) -> Optional[TransformPolicy]:
+    # TransformPolicy from parse_transform_rule specs; later rules for an extension add to earlier ones. None if empty.
+    rules: Dict[str, List[str]] = {}
+    for spec in specs:
+        extensions, names = parse_transform_rule(spec)
+        for extension in extensions: rules.setdefault(extension, []).extend(names)
+    return TransformPolicy(rules) if rules else None
+
+def format_transform_savings(savings: Dict[str, List[int]]) -> List[str]:
+    # One line per transform, in the order they run, with before/after sizes as ~tokens (chars / 4)
+    lines = []
+    for name in TRANSFORMS:
+        if name not in savings: continue
+        before, after, files = savings[name]
+        share = (before - after) * 100 / before if before else 0.0
+        lines.append(f"{name}: ~{before // 4} -> ~{after // 4} tokens (~{(before - after) // 4} saved, {share:.1f}%, {files} files changed)")
+    return lines
+
+def _encode_transform_savings(block: str, savings: List[Tuple[str, int, int]]) -> str:
+    # Workers (thread, process or cache) pass a block's transform savings to the parent as a TRANSFORM_SAVINGS_MARK
+    # line in front of the block; no output format starts a block with it
+    if not savings: return block
+    return TRANSFORM_SAVINGS_MARK + ";".join(f"{name}:{before}:{after}" for name, before, after in savings) + "\n" + block
+
+def _decode_transform_savings(encoded: str, totals: Optional[Dict[str, List[int]]]) -> str:
+    # Strips the savings line, adding it to totals {transform: [chars before, chars after, files changed]}
+    if not encoded.startswith(TRANSFORM_SAVINGS_MARK): return encoded
+    line, _, block = encoded.partition("\n")
+    if totals is not None:
+        for entry in line[len(TRANSFORM_SAVINGS_MARK):].split(";"):
+            name, before, after = entry.split(":")
+            total = totals.setdefault(name, [0, 0, 0])
+            total[0] += int(before); total[1] += int(after); total[2] += int(before) != int(after)
+    return block
+
+# --- Output formats ---
+# A format turns FileRecords into blocks and writes the header and footer around them; reading, decoding, caching
+# and excerpting are shared by all of them. Formats are stateless and picklable, for process pool workers.
+class OutputFormat(ABC):
+    name = ""
+    extension = ""
+    separator = "" # Written between blocks
+    cache_variant = "" # Added to block cache keys; '' keeps the text format's keys from before formats existed
+
+    @abstractmethod
+    def header(self, project_name: str, generated_at: datetime, file_count: int, notes: List[str]) -> str: ...
+    @abstractmethod
+    def block(self, record: FileRecord) -> str: ...
+    @abstractmethod
+    def footer(self, project_name: str) -> str: ...
+
+class TextFormat(OutputFormat):
+    # '--- File: ... ---' delimiters around fenced code blocks
+    name = "text"; extension = ".txt"; separator = "\n"
+
+    def header(self, project_name: str, generated_at: datetime, file_count: int, notes: List[str]) -> str:
+        header = f"--- START OF PROJECT CONTEXT FOR: {project_name} ---\n"
+        header += f"Generated: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        header += f"Number of files included: {file_count}\n"
+        header += "".join(f"{note}\n" for note in notes)
+        header += "---\n\n"
+        return header
+
+    def block(self, record: FileRecord) -> str:
+        path = record.path
+        if record.kind == "duplicate": return f"--- File: {path} --- (identical to {record.duplicate_of})\n"
+        label = f" ({record.encoding} encoding)" if record.encoding else ""
+        message = record.message
+        if message: message = f"({message})\n" if record.kind == "empty" else f"Note: {message}\n" if record.kind in ("skipped", "excerpt") else f"{message}\n"
+        body = ""
+        if record.content is not None:
+            language = "" if record.encoding == "Latin-1" else record.language
+            body = f"```{language}\n{record.content}\n```\n"
+        return f"--- File: {path}{label} ---\n{message}{body}--- END OF FILE: {path} ---\n"
+
+    def footer(self, project_name: str) -> str: return f"\n--- END OF PROJECT CONTEXT FOR: {project_name} ---"
+
+def _xml_escape(text: str, attribute: bool = False) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;").replace("\n", "&#10;") if attribute else text
+
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+class XmlFormat(OutputFormat):
+    # <project> document with one <file> element per file; contents are CDATA, so they stay readable
+    name = "xml"; extension = ".xml"; separator = ""; cache_variant = "|xml"
+
+    def header(self, project_name: str, generated_at: datetime, file_count: int, notes: List[str]) -> str:
+        header = '<?xml version="1.0" encoding="UTF-8"?>\n'
+        header += f'<project name="{_xml_escape(project_name, True)}" generated="{generated_at.isoformat(timespec="seconds")}" files="{file_count}">\n'
+        return header + "".join(f"<note>{_xml_escape(note.strip())}</note>\n" for note in notes)
+
+    def block(self, record: FileRecord) -> str:
+        attributes = f'path="{_xml_escape(record.path, True)}" kind="{record.kind}"'
+        if record.language: attributes += f' language="{_xml_escape(record.language, True)}"'
+        if record.encoding: attributes += f' encoding="{record.encoding}"'
+        if record.message: attributes += f' note="{_xml_escape(record.message, True)}"'
+        if record.duplicate_of: attributes += f' identical-to="{_xml_escape(record.duplicate_of, True)}"'
+        if record.content is None: return f"<file {attributes}/>\n"
+        content = _XML_INVALID_CHARS.sub("\ufffd", record.content).replace("]]>", "]]]]><![CDATA[>")
+        return f"<file {attributes}><![CDATA[\n{content}\n]]></file>\n"
+
+    def footer(self, project_name: str) -> str: return "</project>\n"
+
+class JsonlFormat(OutputFormat):
+    # One JSON object per line: a 'project' record, then one 'file' record per file
+    name = "jsonl"; extension = ".jsonl"; separator = ""; cache_variant = "|jsonl"
+
+    def header(self, project_name: str, generated_at: datetime, file_count: int, notes: List[str]) -> str:
+        import json
+        record: Dict[str, Any] = {"type": "project", "name": project_name, "generated": generated_at.isoformat(timespec="seconds"), "files": file_count}
+        if notes: record["notes"] = [note.strip() for note in notes]
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def block(self, record: FileRecord) -> str:
+        import json
+        fields: Dict[str, Any] = {"type": "file", "path": record.path, "kind": record.kind}
+        if record.language: fields["language"] = record.language
+        if record.encoding: fields["encoding"] = record.encoding
+        if record.message: fields["note"] = record.message
+        if record.duplicate_of: fields["identical_to"] = record.duplicate_of
+        if record.content is not None: fields["content"] = record.content
+        return json.dumps(fields, ensure_ascii=False) + "\n"
+
+    def footer(self, project_name: str) -> str: return ""
+
+class MinimalFormat(OutputFormat):
+    # '==> path <==' lines and raw contents: no fences or end markers, for the fewest tokens
+    name = "minimal"; extension = ".txt"; separator = "\n"; cache_variant = "|minimal"
+
+    def header(self, project_name: str, generated_at: datetime, file_count: int, notes: List[str]) -> str:
+        header = f"# {project_name}: {file_count} files, {generated_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        return header + "".join(f"# {note.strip()}\n" for note in notes) + "\n"
+
+    def block(self, record: FileRecord) -> str:
+        if record.kind == "duplicate": return f"==> {record.path} <== (identical to {record.duplicate_of})\n"
+        label = f" ({record.encoding})" if record.encoding else ""
+        block = f"==> {record.path}{label} <==\n"
+        if record.message: block += f"[{record.message}]\n"
+        if record.content is not None: block += f"{record.content}\n"
+        return block
+
+    def footer(self, project_name: str) -> str: return ""
+
+OUTPUT_FORMATS: Dict[str, OutputFormat] = {output_format.name: output_format for output_format in (TextFormat(), XmlFormat(), JsonlFormat(), MinimalFormat())}
+DEFAULT_OUTPUT_FORMAT = OUTPUT_FORMATS["text"]
+
+def render_block_from_bytes(relative_filepath: str, raw: bytes, sniffed: Optional[Tuple[Optional[str], str]] = None,
+                            output_format: OutputFormat = DEFAULT_OUTPUT_FORMAT, transforms: Optional[TransformPolicy] = None) -> str:
+    # With transforms the block comes back with its savings encoded (see _encode_transform_savings)
+    record = file_record_from_bytes(relative_filepath, raw, sniffed)
+    if transforms is None: return output_format.block(record)
+    savings = apply_transforms(record, transforms)
+    return _encode_transform_savings(output_format.block(record), savings)
+
+def _record_for_stat(relative_filepath: str, file_stat: Optional[os.stat_result],
+                     large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY) -> Optional[FileRecord]:
+    # Records decided by stat alone (missing, empty, too large to excerpt); None means the contents must be read.
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+        return FileRecord(relative_filepath, "error", message="Error: Path not found or is not a file.")
+    if file_stat.st_size == 0: return FileRecord(relative_filepath, "empty", message="File is empty")
+    if file_stat.st_size > MAX_FILE_SIZE_READ and large_files.mode == "skip": return _large_file_skipped_record(relative_filepath)
+    return None
+
+def _stat_or_none(full_filepath: str) -> Optional[os.stat_result]:
+    try: return os.stat(full_filepath)
+    except (OSError, ValueError): return None
+
+def read_file_record(project_path: str, relative_filepath: str, large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY) -> FileRecord:
+    # Reads one selected file into a FileRecord; never raises
+    full_filepath = os.path.join(project_path, relative_filepath)
+    try:
+        file_stat = _stat_or_none(full_filepath)
+        record = _record_for_stat(relative_filepath, file_stat, large_files)
+        if record is not None: return record
+        if file_stat.st_size > MAX_FILE_SIZE_READ:
+            try: return read_large_file_excerpt(relative_filepath, full_filepath, large_files)
+            except Exception as e: return _read_error_record(relative_filepath, e)
+        try:
+            with open(full_filepath, 'rb') as f:
+                head = f.read(SNIFF_BYTES); sniffed = sniff_bytes(head)
+                if sniffed[0] is None: return _binary_record(relative_filepath, sniffed[1]) # Rejected without a full read
+                raw = head + f.read() if len(head) == SNIFF_BYTES else head
+        except Exception as e:
+            return _read_error_record(relative_filepath, e)
+        return file_record_from_bytes(relative_filepath, raw, sniffed)
+    except Exception as e:
+        return _unexpected_error_record(relative_filepath, e)
+
+def render_file_block(project_path: str, relative_filepath: str, large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY,
+                      output_format: OutputFormat = DEFAULT_OUTPUT_FORMAT, transforms: Optional[TransformPolicy] = None) -> str:
+    # Reads one selected file and formats its block. Module-level and self-contained so it can run on thread or
+    # process pool workers.
+    record = read_file_record(project_path, relative_filepath, large_files)
+    if transforms is None: return output_format.block(record)
+    savings = apply_transforms(record, transforms)
+    return _encode_transform_savings(output_format.block(record), savings)
+
+class RenderedBlockCache:
+    # Persistent cache of rendered file blocks in a SQLite file under the output area. An entry is found by file
+    # identity (absolute path, size, mtime_ns, inode) or, when that misses, by (relative path, content hash), so a
+    # touched-but-unchanged file costs a read and a hash but no decode/format. Least recently used entries are evicted
+    # once the stored blocks exceed max_bytes. Writes are batched; entries not written yet are still found. Safe to
+    # share between the generation worker threads.
+    def __init__(self, cache_dir: str = BLOCK_CACHE_DIR, max_bytes: int = BLOCK_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0; self.misses = 0
+        self._conn: Any = None
+        self._lock = threading.Lock()
+        self._pending_puts: Dict[str, Tuple[str, str, str, int, float]] = {} # stat_key -> row, until written
+        self._pending_by_content: Dict[str, str] = {} # content_key -> block of the pending rows
+        self._pending_touches: List[Tuple[float, str]] = []
+        self._pending_token_counts: List[Tuple[str, str, int, float]] = []
+
+    def _connection(self) -> Any:
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.cache_dir, "blocks.sqlite3"), check_same_thread=False)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS blocks (stat_key TEXT PRIMARY KEY, content_key TEXT NOT NULL, "
+                "block TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS blocks_by_content ON blocks(content_key);"
+                "CREATE INDEX IF NOT EXISTS blocks_by_last_used ON blocks(last_used);"
+                "CREATE TABLE IF NOT EXISTS token_counts (tokenizer TEXT NOT NULL, digest TEXT NOT NULL, "
+                "count INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (tokenizer, digest));")
+        return self._conn
+
+    @staticmethod
+    def stat_key(variant: str, full_filepath: str, file_stat: os.stat_result) -> str:
+        return f"{BLOCK_CACHE_VERSION}|{variant}|{os.path.abspath(full_filepath)}|{file_stat.st_size}|{file_stat.st_mtime_ns}|{file_stat.st_ino}"
+
+    @staticmethod
+    def content_key(variant: str, relative_filepath: str, digest: str) -> str:
+        return f"{BLOCK_CACHE_VERSION}|{variant}|{relative_filepath}|{digest}"
+
+    def get(self, stat_key: str) -> Optional[str]:
+        with self._lock:
+            pending = self._pending_puts.get(stat_key)
+            if pending is not None: self.hits += 1; return pending[2]
+            row = self._connection().execute("SELECT block FROM blocks WHERE stat_key = ?", (stat_key,)).fetchone()
+            if row is None: return None
+            self.hits += 1; self._pending_touches.append((time.time(), stat_key))
+            return row[0]
+
+    def get_by_content(self, content_key: str, new_stat_key: Optional[str]) -> Optional[str]:
+        # Content-hash fallback; on a hit the entry is re-keyed to the file's current identity.
+        with self._lock:
+            block = self._pending_by_content.get(content_key)
+            if block is None:
+                row = self._connection().execute("SELECT block FROM blocks WHERE content_key = ? LIMIT 1", (content_key,)).fetchone()
+                if row is None: return None
+                block = row[0]
+            self.hits += 1
+            if new_stat_key is not None: self._add_pending_locked(new_stat_key, content_key, block)
+            return block
+
+    def put(self, stat_key: Optional[str], content_key: str, block: str):
+        with self._lock:
+            self.misses += 1
+            # Without a trustworthy stat key the entry is still reachable by content
+            self._add_pending_locked(stat_key or f"content:{content_key}", content_key, block)
+            if len(self._pending_puts) >= BLOCK_CACHE_WRITE_BATCH: self._flush_locked()
+
+    def _add_pending_locked(self, stat_key: str, content_key: str, block: str):
+        self._pending_puts[stat_key] = (stat_key, content_key, block, len(block), time.time()); self._pending_by_content[content_key] = block
+
+    def get_token_counts(self, tokenizer_id: str, digests: List[str]) -> Dict[str, int]:
+        # Token counts by content digest; found rows are refreshed so they survive row-count pruning
+        found: Dict[str, int] = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(digests), 500): # Stay under SQLite's bound-parameter limit
+                chunk = digests[start:start + 500]
+                query = f"SELECT digest, count FROM token_counts WHERE tokenizer = ? AND digest IN ({','.join('?' * len(chunk))})"
+                found.update(conn.execute(query, (tokenizer_id, *chunk)).fetchall())
+            now = time.time()
+            self._pending_token_counts.extend((tokenizer_id, digest, count, now) for digest, count in found.items())
+        return found
+
+    def put_token_counts(self, tokenizer_id: str, counts: Iterable[Tuple[str, int]]):
+        with self._lock:
+            now = time.time()
+            self._pending_token_counts.extend((tokenizer_id, digest, count, now) for digest, count in counts)
+            if len(self._pending_token_counts) >= BLOCK_CACHE_WRITE_BATCH: self._flush_locked()
+
+    def _flush_locked(self):
+        conn = self._connection()
+        if self._pending_token_counts:
+            conn.executemany("INSERT OR REPLACE INTO token_counts VALUES (?, ?, ?, ?)", self._pending_token_counts)
+            self._pending_token_counts = []
+        if self._pending_puts:
+            conn.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)", self._pending_puts.values())
+            self._pending_puts = {}; self._pending_by_content = {}
+        if self._pending_touches:
+            conn.executemany("UPDATE blocks SET last_used = ? WHERE stat_key = ?", self._pending_touches); self._pending_touches = []
+        conn.commit()
+
+    def flush(self):
+        # Writes pending entries and evicts least recently used blocks beyond max_bytes
+        with self._lock:
+            if self._conn is None and not self._pending_puts and not self._pending_touches and not self._pending_token_counts: return
+            self._flush_locked()
+            conn = self._connection()
+            rows = conn.execute("SELECT COUNT(*) FROM token_counts").fetchone()[0]
+            if rows > TOKEN_COUNT_CACHE_MAX_ROWS:
+                conn.execute("DELETE FROM token_counts WHERE rowid IN (SELECT rowid FROM token_counts ORDER BY last_used LIMIT ?)",
+                             (rows - TOKEN_COUNT_CACHE_MAX_ROWS,)); conn.commit()
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blocks").fetchone()[0]
+            if total <= self.max_bytes: return
+            evict: List[Tuple[str]] = []
+            for stat_key, size in conn.execute("SELECT stat_key, size FROM blocks ORDER BY last_used"):
+                if total <= self.max_bytes: break
+                evict.append((stat_key,)); total -= size
+            conn.executemany("DELETE FROM blocks WHERE stat_key = ?", evict); conn.commit()
+
+    def reset_counters(self):
+        with self._lock: self.hits = 0; self.misses = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None: self._conn.close(); self._conn = None
+
+def render_file_block_cached(cache: RenderedBlockCache, project_path: str, relative_filepath: str, variant: str = "",
+                             render_from_bytes: Optional[Callable[[str, bytes], str]] = None,
+                             large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY,
+                             output_format: OutputFormat = DEFAULT_OUTPUT_FORMAT,
+                             transforms: Optional[TransformPolicy] = None) -> str:
+    # render_file_block() through the cache: a stat-key hit costs one stat; a miss reads the file once, tries the
+    # content-hash key, and renders only when both miss. Large-file excerpts only touch a few pages and aren't cached.
+    # Transformed blocks are cached with their encoded savings, so a hit still reports them.
+    full_filepath = os.path.join(project_path, relative_filepath)
+    variant += output_format.cache_variant + (transforms.cache_variant(relative_filepath) if transforms is not None else "")
+    try:
+        file_stat = _stat_or_none(full_filepath)
+        record = _record_for_stat(relative_filepath, file_stat, large_files)
+        if record is not None: return output_format.block(record)
+        if file_stat.st_size > MAX_FILE_SIZE_READ:
+            try: return output_format.block(read_large_file_excerpt(relative_filepath, full_filepath, large_files))
+            except Exception as e: return output_format.block(_read_error_record(relative_filepath, e))
+        # Files modified within the last couple of seconds could change again within the mtime granularity
+        racy = file_stat.st_mtime_ns >= time.time_ns() - BLOCK_CACHE_RACY_WINDOW_NS
+        stat_key = None if racy else cache.stat_key(variant, full_filepath, file_stat)
+        if stat_key is not None:
+            block = cache.get(stat_key)
+            if block is not None: return block
+        try:
+            with open(full_filepath, 'rb') as f:
+                head = f.read(SNIFF_BYTES); sniffed = sniff_bytes(head)
+                # A binary's block depends only on its head, so that is all that is read and hashed
+                raw = head + f.read() if sniffed[0] is not None and len(head) == SNIFF_BYTES else head
+        except Exception as e:
+            return output_format.block(_read_error_record(relative_filepath, e))
+        if sniffed[0] is None:
+            block = output_format.block(_binary_record(relative_filepath, sniffed[1]))
+            cache.put(stat_key, cache.content_key(variant, relative_filepath, "head:" + hashlib.sha256(raw).hexdigest()), block)
+            return block
+        content_key = cache.content_key(variant, relative_filepath, hashlib.sha256(raw).hexdigest())
+        block = cache.get_by_content(content_key, stat_key)
+        if block is not None: return block
+        block = render_from_bytes(relative_filepath, raw) if render_from_bytes is not None else render_block_from_bytes(relative_filepath, raw, sniffed, output_format, transforms)
+        cache.put(stat_key, content_key, block)
+        return block
+    except Exception as e:
+        return output_format.block(_unexpected_error_record(relative_filepath, e))
+
+def iter_rendered_blocks(project_path: str, relative_filepaths: List[str], max_workers: int = GENERATION_MAX_WORKERS,
+                         use_processes: bool = False, cache: Optional[RenderedBlockCache] = None, cache_variant: str = "",
+                         large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY,
+                         output_format: OutputFormat = DEFAULT_OUTPUT_FORMAT, transforms: Optional[TransformPolicy] = None,
+                         transform_savings: Optional[Dict[str, List[int]]] = None) -> Iterator[str]:
+    # Yields rendered blocks in input order. Reads run on a bounded pool with at most GENERATION_WINDOW_PER_WORKER
+    # blocks per worker in flight, so memory stays bounded for any selection size. With use_processes the decoding
+    # and formatting move to a process pool; cache lookups always stay in this process. transform_savings collects
+    # the savings of the transforms (see _decode_transform_savings).
+    if max_workers <= 1 or len(relative_filepaths) <= 1:
+        for relative_filepath in relative_filepaths:
+            if cache is not None: block = render_file_block_cached(cache, project_path, relative_filepath, cache_variant, None, large_files, output_format, transforms)
+            else: block = render_file_block(project_path, relative_filepath, large_files, output_format, transforms)
+            yield _decode_transform_savings(block, transform_savings) if transforms is not None else block
+        return
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    from collections import deque
+    process_executor = ProcessPoolExecutor(max_workers=max_workers) if use_processes else None
+    if cache is None:
+        executor: Any = process_executor or ThreadPoolExecutor(max_workers=max_workers)
+        submit = lambda path: executor.submit(render_file_block, project_path, path, large_files, output_format, transforms)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        render_from_bytes: Optional[Callable[[str, bytes], str]] = None
+        if process_executor is not None:
+            render_from_bytes = lambda path, raw: process_executor.submit(render_block_from_bytes, path, raw, None, output_format, transforms).result()
+        submit = lambda path: executor.submit(render_file_block_cached, cache, project_path, path, cache_variant, render_from_bytes, large_files, output_format, transforms)
+    window = max_workers * GENERATION_WINDOW_PER_WORKER
+    pending: Deque[Any] = deque()
+    result = (lambda future: _decode_transform_savings(future.result(), transform_savings)) if transforms is not None else (lambda future: future.result())
+    try:
+        for relative_filepath in relative_filepaths:
+            pending.append(submit(relative_filepath))
+            if len(pending) >= window: yield result(pending.popleft())
+        while pending: yield result(pending.popleft())
+    finally:
+        for future in pending: future.cancel()
+        executor.shutdown(wait=True)
+        if process_executor is not None and process_executor is not executor: process_executor.shutdown(wait=True)
+
+class TextStats:
+    # Word/character counts accumulated piece by piece; equal to len(text.split()) / len(text) over the concatenation.
+    __slots__ = ('words', 'chars', '_in_word')
+
+    def __init__(self):
+        self.words = 0; self.chars = 0; self._in_word = False
+
+    def feed(self, text: str):
+        if not text: return
+        self.chars += len(text)
+        words = len(text.split())
+        if words and self._in_word and not text[0].isspace(): words -= 1 # Word continues across the boundary
+        self.words += words
+        self._in_word = not text[-1].isspace()
+
+    @property
+    def approx_tokens(self) -> int:
+        return int(self.chars / 4) # General LLM token approximation
+
+def build_output_filename(project_name: str, custom_filename_base: Optional[str] = None, extension: str = ".txt") -> str:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if custom_filename_base and custom_filename_base.strip():
+        # Sanitize filename: replace non-alphanumeric, non-space, non-underscore, non-hyphen with nothing, then replace spaces with underscores.
+        sanitized_base = re.sub(r'[^\w\s-]', '', custom_filename_base).strip().replace(" ", "_")
+        if not sanitized_base: # Fallback if sanitized base is empty
+            sanitized_base = "project_context"
+        return f"{sanitized_base}_{timestamp}{extension}"
+    # Default filename based on project name, sanitize spaces
+    default_base = re.sub(r'[^\w\s-]', '', project_name).strip().replace(" ", "_")
+    if not default_base: default_base = "project_context"
+    return f"{default_base}_{timestamp}{extension}"
+
+# Streaming compressions: name -> file suffix
+COMPRESSIONS: Dict[str, str] = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+
+def open_output_text(filepath: str, compression: Optional[str] = None) -> Any:
+    # Text-mode writer, compressing as it goes. zstd needs Python 3.14's compression.zstd or the 'zstandard' package.
+    if not compression: return open(filepath, 'w', encoding='utf-8')
+    if compression == "gzip":
+        import gzip
+        return gzip.open(filepath, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == "xz":
+        import lzma
+        return lzma.open(filepath, 'wt', encoding='utf-8')
+    if compression == "zstd":
+        try: from compression import zstd # type: ignore # Python 3.14+
+        except ImportError:
+            try: import zstandard # type: ignore # Optional dependency
+            except ImportError: raise ValueError("zstd compression needs Python 3.14+ or the 'zstandard' package.") from None
+            import io
+            return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(filepath, 'wb'), closefd=True), encoding='utf-8')
+        return zstd.open(filepath, 'wt', encoding='utf-8')
+    raise ValueError(f"Unknown compression '{compression}' (expected one of: {', '.join(COMPRESSIONS)}).")
+
+def open_context_text(filepath: str) -> Any:
+    # Text-mode reader for a generated context file, decompressing by file suffix
+    if filepath.endswith(".gz"):
+        import gzip
+        return gzip.open(filepath, 'rt', encoding='utf-8', errors='replace')
+    if filepath.endswith(".xz"):
+        import lzma
+        return lzma.open(filepath, 'rt', encoding='utf-8', errors='replace')
+    if filepath.endswith(".zst"):
+        try: from compression import zstd # type: ignore # Python 3.14+
+        except ImportError:
+            import io, zstandard # type: ignore # Optional dependency
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), closefd=True), encoding='utf-8', errors='replace')
+        return zstd.open(filepath, 'rt', encoding='utf-8', errors='replace')
+    return open(filepath, 'r', encoding='utf-8', errors='replace')
+
+def write_context_streaming(output_filepath: str, header: str, blocks: Iterable[str], footer: str,
+                            separator: str = "\n", compression: Optional[str] = None) -> TextStats:
+    # Writes each block as soon as it is rendered, so peak memory is one read window rather than the whole context.
+    # Goes through a '.part' file that is renamed on success and removed on any failure or interruption. The stats
+    # are of the uncompressed text.
+    stats = TextStats()
+    partial_filepath = output_filepath + ".part"
+    try:
+        with open_output_text(partial_filepath, compression) as f:
+            f.write(header); stats.feed(header)
+            pending_separator = ""
+            for block in blocks:
+                piece = pending_separator + block; pending_separator = separator
+                f.write(piece); stats.feed(piece)
+            f.write(footer); stats.feed(footer)
+        os.replace(partial_filepath, output_filepath)
+    except BaseException:
+        try: os.remove(partial_filepath)
+        except OSError: pass
+        raise
+    return stats
+
+class ShardLimit:
+    # Upper bound on each part of a sharded output: max_tokens (counted like the reported token figure) and/or
+    # max_bytes (UTF-8, before compression). 0 leaves that measure unbounded.
+    def __init__(self, max_tokens: int = 0, max_bytes: int = 0):
+        if max_tokens <= 0 and max_bytes <= 0: raise ValueError("A shard limit needs a positive token or byte count.")
+        self.max_tokens = max(max_tokens, 0); self.max_bytes = max(max_bytes, 0)
+
+    def exceeded(self, tokens: int, size: int) -> bool:
+        return bool(self.max_tokens and tokens > self.max_tokens) or bool(self.max_bytes and size > self.max_bytes)
+
+    def describe(self) -> str:
+        return " / ".join(text for text in (f"{self.max_tokens} tokens" if self.max_tokens else "",
+                                            f"{self.max_bytes} bytes" if self.max_bytes else "") if text)
+
+def shard_filepath(output_filepath: str, part: int, extension: str = "") -> str:
+    # 'name.txt' -> 'name_part01.txt'. extension is the whole suffix kept after the part number (e.g. '.jsonl.gz');
+    # without it, or if the path does not end with it, the last suffix is used.
+    if not extension or not output_filepath.endswith(extension): extension = os.path.splitext(output_filepath)[1]
+    return f"{output_filepath[:len(output_filepath) - len(extension)]}_part{part:02d}{extension}"
+
+def write_context_sharded(output_filepath: str, make_header: Callable[[int, int], str], blocks: Iterable[str], footer: str,
+                          separator: str, compression: Optional[str], limit: ShardLimit,
+                          count_text: Callable[[str], int], count_block: Callable[[int, str], int],
+                          extension: str = "") -> Tuple[List[Tuple[str, int, int]], TextStats]:
+    # Streams blocks into name_part01, name_part02, ... in one pass. Each part opens with make_header(part number,
+    # index of its first file, 1-based) and ends with the footer; a new part starts before any block that would
+    # take the current one over the limit, so a block is never split and only a block too big on its own exceeds
+    # it. count_block(index, block) gives a block's tokens. All parts go through '.part' files that are renamed
+    # together on success and removed together on failure. Returns [(path, files, tokens)] per part and the
+    # uncompressed text stats over all parts.
+    stats = TextStats(); parts: List[Tuple[str, int, int]] = []; partial_filepaths: List[str] = []
+    footer_tokens = count_text(footer); footer_bytes = len(footer.encode('utf-8'))
+    separator_tokens = count_text(separator); separator_bytes = len(separator.encode('utf-8'))
+    f: Any = None; part_files = part_tokens = part_bytes = 0
+    try:
+        for index, block in enumerate(blocks):
+            tokens = count_block(index, block); size = len(block.encode('utf-8'))
+            if f is not None and limit.exceeded(part_tokens + separator_tokens + tokens + footer_tokens,
+                                                part_bytes + separator_bytes + size + footer_bytes):
+                f.write(footer); stats.feed(footer); f.close(); f = None
+                parts.append((shard_filepath(output_filepath, len(parts) + 1, extension), part_files, part_tokens + footer_tokens))
+            if f is None:
+                header = make_header(len(parts) + 1, index + 1)
+                partial_filepaths.append(shard_filepath(output_filepath, len(parts) + 1, extension) + ".part")
+                f = open_output_text(partial_filepaths[-1], compression)
+                f.write(header); stats.feed(header)
+                part_files = 0; part_tokens = count_text(header); part_bytes = len(header.encode('utf-8'))
+            elif separator:
+                f.write(separator); stats.feed(separator); part_tokens += separator_tokens; part_bytes += separator_bytes
+            f.write(block); stats.feed(block)
+            part_files += 1; part_tokens += tokens; part_bytes += size
+        if f is not None:
+            f.write(footer); stats.feed(footer); f.close(); f = None
+            parts.append((shard_filepath(output_filepath, len(parts) + 1, extension), part_files, part_tokens + footer_tokens))
+        for partial_filepath, (part_filepath, _, _) in zip(partial_filepaths, parts): os.replace(partial_filepath, part_filepath)
+    except BaseException:
+        if f is not None:
+            try: f.close()
+            except Exception: pass
+        for partial_filepath in partial_filepaths:
+            try: os.remove(partial_filepath)
+            except OSError: pass
+        raise
+    return parts, stats
+
+# --- Tokenizers ---
+# Pre-tokenisation patterns of the GPT-2 and cl100k encodings. They need the third-party `regex` module for \p{..}
+# classes; without it a stdlib `re` equivalent is used that matches exactly for ASCII and differs only for a few
+# non-ASCII letters and numbers.
+GPT2_SPLIT_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+GPT2_SPLIT_PATTERN_RE = r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+"""
+CL100K_SPLIT_PATTERN = r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+CL100K_SPLIT_PATTERN_RE = r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|(?:[^\r\n\w]|_)?[^\W\d_]+|\d{1,3}| ?(?:[^\s\w]|_)+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+
+def _compile_split_pattern(pattern: str, fallback: str) -> Any:
+    try:
+        import regex # Optional dependency
+        return regex.compile(pattern)
+    except ImportError:
+        return re.compile(fallback)
+
+def _gpt2_byte_decoder() -> Dict[str, int]:
+    # Inverse of GPT-2's bytes_to_unicode(): printable bytes map to themselves, the rest to code points from 256 up
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    decoder = {chr(b): b for b in printable}; extra = 0
+    for b in range(256):
+        if b not in printable: decoder[chr(256 + extra)] = b; extra += 1
+    return decoder
+
+class BPETokenizer:
+    # Byte-level BPE over mergeable ranks (byte string -> rank), as used by GPT-2 and tiktoken encodings. Only counts
+    # are needed here, so pieces are merged without building token ids, and the count of each distinct pre-tokenised
+    # piece is memoised (source code repeats the same identifiers and punctuation runs constantly).
+    def __init__(self, name: str, ranks: Dict[bytes, int], split_pattern: Any, fingerprint: str, vocab_size: int = 0):
+        self.name = name; self.ranks = ranks; self.split_pattern = split_pattern
+        self.fingerprint = fingerprint # Identifies the exact vocabulary in cache keys
+        self.vocab_size = vocab_size or len(ranks)
+        self._piece_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_vocab_merges(cls, name: str, vocab_path: str, merges_path: str) -> 'BPETokenizer':
+        # Hugging Face / GPT-2 style files. Merge ranks follow the order of merges.txt, after the 256 single bytes.
+        import json
+        byte_decoder = _gpt2_byte_decoder()
+        digest = hashlib.sha256()
+        with open(vocab_path, 'rb') as f: vocab_raw = f.read()
+        with open(merges_path, 'rb') as f: merges_raw = f.read()
+        digest.update(vocab_raw); digest.update(merges_raw)
+        vocab = json.loads(vocab_raw.decode('utf-8'))
+        ranks: Dict[bytes, int] = {bytes([b]): b for b in range(256)}
+        rank = 256
+        for line in merges_raw.decode('utf-8').splitlines():
+            if not line or line.startswith('#version'): continue
+            first, _, second = line.partition(' ')
+            merged = bytes(byte_decoder[ch] for ch in first + second)
+            if merged not in ranks: ranks[merged] = rank
+            rank += 1
+        return cls(name, ranks, _compile_split_pattern(GPT2_SPLIT_PATTERN, GPT2_SPLIT_PATTERN_RE), digest.hexdigest()[:16], len(vocab))
+
+    @classmethod
+    def from_tiktoken_file(cls, name: str, path: str) -> 'BPETokenizer':
+        # tiktoken's format: one '<base64 token> <rank>' per line. Split with the cl100k pattern.
+        import base64
+        with open(path, 'rb') as f: raw = f.read()
+        ranks = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in raw.splitlines() if line)}
+        return cls(name, ranks, _compile_split_pattern(CL100K_SPLIT_PATTERN, CL100K_SPLIT_PATTERN_RE), hashlib.sha256(raw).hexdigest()[:16])
+
+    def _count_piece(self, piece: bytes) -> int:
+        ranks = self.ranks
+        if piece in ranks: return 1
+        if len(piece) >= TOKEN_HEAP_MERGE_MIN_BYTES: return self._count_long_piece(piece)
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank = -1; best_index = -1
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank < 0 or rank < best_rank): best_rank = rank; best_index = i
+            if best_index < 0: break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+        return len(parts)
+
+    def _count_long_piece(self, piece: bytes) -> int:
+        # Same merges as _count_piece (lowest rank first, leftmost on ties) for long pieces such as separator or
+        # whitespace runs: parts are a linked list of byte offsets (end_of[start], prev_of[start]) and candidate pairs
+        # sit in a heap of (rank, left start, right start, right end). A pair is stale once either part has changed.
+        import heapq
+        ranks = self.ranks; size = len(piece)
+        end_of = list(range(1, size + 1)); prev_of = list(range(-1, size - 1))
+        heap = [(rank, i, i + 1, i + 2) for i, rank in ((i, ranks.get(piece[i:i + 2])) for i in range(size - 1)) if rank is not None]
+        heapq.heapify(heap); parts = size
+        while heap:
+            _, left, right, right_end = heapq.heappop(heap)
+            if end_of[left] != right or end_of[right] != right_end: continue
+            end_of[left] = right_end; end_of[right] = -1; parts -= 1
+            before = prev_of[left]
+            if before >= 0:
+                rank = ranks.get(piece[before:right_end])
+                if rank is not None: heapq.heappush(heap, (rank, before, left, right_end))
+            if right_end < size:
+                prev_of[right_end] = left; after_end = end_of[right_end]
+                rank = ranks.get(piece[left:after_end])
+                if rank is not None: heapq.heappush(heap, (rank, left, right_end, after_end))
+        return parts
+
+    def count(self, text: str) -> int:
+        piece_counts = self._piece_counts; total = 0
+        for piece in self.split_pattern.findall(text):
+            count = piece_counts.get(piece)
+            if count is None:
+                count = self._count_piece(piece.encode('utf-8'))
+                with self._lock:
+                    if len(piece_counts) >= TOKEN_PIECE_MEMO_MAX: piece_counts.clear()
+                    piece_counts[piece] = count
+            total += count
+        return total
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        # count() for a batch: pieces the memo doesn't know are merged once for the whole batch, however many texts
+        # share them, and the memo is updated under one lock at the end
+        findall = self.split_pattern.findall; piece_counts = self._piece_counts
+        new_counts: Dict[str, int] = {}; totals: List[int] = []
+        for text in texts:
+            total = 0
+            for piece in findall(text):
+                count = new_counts.get(piece)
+                if count is None: count = piece_counts.get(piece)
+                if count is None: count = new_counts[piece] = self._count_piece(piece.encode('utf-8'))
+                total += count
+            totals.append(total)
+        if new_counts:
+            with self._lock:
+                if len(piece_counts) + len(new_counts) > TOKEN_PIECE_MEMO_MAX: piece_counts.clear()
+                piece_counts.update(new_counts)
+        return totals
+
+_LOADED_TOKENIZERS: Dict[Tuple[str, int], BPETokenizer] = {}
+
+def available_tokenizers(tokenizers_dir: str = TOKENIZERS_DIR) -> Dict[str, str]:
+    # name -> path of every tokenizer found in tokenizers_dir (a directory with vocab.json and merges.txt, or a
+    # .tiktoken file)
+    found: Dict[str, str] = {}
+    try: entries = sorted(os.scandir(tokenizers_dir), key=lambda e: e.name)
+    except OSError: return found
+    for entry in entries:
+        if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "vocab.json")) and os.path.isfile(os.path.join(entry.path, "merges.txt")):
+            found[entry.name] = entry.path
+        elif entry.is_file() and entry.name.endswith(".tiktoken"):
+            found[entry.name[:-len(".tiktoken")]] = entry.path
+    return found
+
+def load_tokenizer(path_or_name: str, tokenizers_dir: str = TOKENIZERS_DIR) -> BPETokenizer:
+    # Loads (once per file version) a tokenizer from a path or from a name in tokenizers_dir. Raises ValueError if
+    # nothing usable is found.
+    path = path_or_name if os.path.exists(path_or_name) else available_tokenizers(tokenizers_dir).get(path_or_name, "")
+    if not path: raise ValueError(f"Tokenizer '{path_or_name}' not found (looked in '{tokenizers_dir}').")
+    is_dir = os.path.isdir(path)
+    key = (os.path.abspath(path), os.stat(os.path.join(path, "merges.txt") if is_dir else path).st_mtime_ns)
+    tokenizer = _LOADED_TOKENIZERS.get(key)
+    if tokenizer is not None: return tokenizer
+    name = os.path.basename(os.path.normpath(path))
+    if is_dir: tokenizer = BPETokenizer.from_vocab_merges(name, os.path.join(path, "vocab.json"), os.path.join(path, "merges.txt"))
+    elif path.endswith(".tiktoken"): tokenizer = BPETokenizer.from_tiktoken_file(name[:-len(".tiktoken")], path)
+    else: raise ValueError(f"Unsupported tokenizer file '{path}': expected a directory with vocab.json/merges.txt or a .tiktoken file.")
+    _LOADED_TOKENIZERS[key] = tokenizer
+    return tokenizer
+
+class TokenCounter:
+    # Counts tokens of rendered blocks in batches. Counts are keyed by a hash of the block text, so with a block
+    # cache an unchanged file is never encoded twice, across runs too.
+    def __init__(self, tokenizer: BPETokenizer, cache: Optional[RenderedBlockCache] = None):
+        self.tokenizer = tokenizer; self.cache = cache
+        self.cache_key = f"{tokenizer.name}|{tokenizer.fingerprint}"
+        self.hits = 0; self.misses = 0
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        digests = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+        known = self.cache.get_token_counts(self.cache_key, digests) if self.cache is not None else {}
+        missing: Dict[str, str] = {} # Digest -> text, once per distinct text the cache doesn't have
+        for text, digest in zip(texts, digests):
+            if digest not in known: missing.setdefault(digest, text)
+        new_counts = dict(zip(missing, self.tokenizer.count_many(list(missing.values()))))
+        self.misses += len(missing); self.hits += len(texts) - len(missing)
+        if new_counts and self.cache is not None: self.cache.put_token_counts(self.cache_key, new_counts.items())
+        return [known[digest] if digest in known else new_counts[digest] for digest in digests]
+
+    def count(self, text: str) -> int: return self.tokenizer.count(text)
+
+def _count_block_tokens(blocks: Iterator[str], relative_filepaths: List[str], counter: TokenCounter,
+                        counts: Dict[str, int]) -> Iterator[str]:
+    # Passes blocks through unchanged, recording each file's token count; blocks are counted TOKEN_COUNT_BATCH at a
+    # time so cache lookups and writes are batched too.
+    paths = iter(relative_filepaths); batch: List[str] = []
+    try:
+        for block in blocks:
+            batch.append(block)
+            if len(batch) < TOKEN_COUNT_BATCH: continue
+            for count in counter.count_many(batch): counts[next(paths)] = count
+            yield from batch; batch = []
+        if batch:
+            for count in counter.count_many(batch): counts[next(paths)] = count
+            yield from batch
+    finally:
+        close = getattr(blocks, 'close', None)
+        if close is not None: close()
+
+class GenerationCancelled(Exception):
+    pass
+
+def _track_generation(blocks: Iterator[str], total: int, progress: Optional[Callable[[int, int, int], None]],
+                      cancel_event: Optional[threading.Event]) -> Iterator[str]:
+    # Reports (files_done, files_total, chars_done) after each block and raises GenerationCancelled between blocks
+    # once cancel_event is set, which makes the writer drop its '.part' file.
+    done = 0; chars = 0
+    try:
+        for block in blocks:
+            if cancel_event is not None and cancel_event.is_set(): raise GenerationCancelled()
+            yield block
+            done += 1; chars += len(block)
+            if progress is not None: progress(done, total, chars)
+    finally:
+        close = getattr(blocks, 'close', None)
+        if close is not None: close() # Stops the read pool right away instead of at garbage collection
+
+def format_generation_progress(files_done: int, files_total: int, chars_done: int, elapsed: float) -> str:
+    rate = chars_done / max(elapsed, 1e-6) / (1024 * 1024)
+    remaining = elapsed / files_done * (files_total - files_done) if files_done else 0.0
+    return (f"Progress: {files_done}/{files_total} files ({files_done * 100 // max(files_total, 1)}%), "
+            f"{rate:.1f} MB/s, ~{remaining:.0f}s remaining")
+
+def _finish_token_counts(counter: TokenCounter, file_token_counts: Dict[str, int], header: str, footer: str,
+                         separator: str, stats: Optional[Dict[str, Any]]) -> int:
+    # Total of the independently counted pieces. BPE can merge the newlines where two pieces meet, so tokenising
+    # the finished file in one go may give up to one token per file fewer.
+    total = sum(file_token_counts.values()) + counter.count(header) + counter.count(footer) + max(len(file_token_counts) - 1, 0) * counter.count(separator)
+    if stats is not None:
+        stats['tokenizer'] = counter.tokenizer.name; stats['token_counts'] = file_token_counts; stats['token_total'] = total
+        stats['token_cache_hits'] = counter.hits; stats['token_cache_misses'] = counter.misses
+    if counter.cache is not None:
+        try: counter.cache.flush()
+        except Exception as e: print(f"Warning: Could not update token count cache: {type(e).__name__}: {e}")
+    return total
+
+def _finish_block_cache(cache: Optional[RenderedBlockCache], stats: Optional[Dict[str, Any]]):
+    if cache is None: return
+    try: cache.flush()
+    except Exception as e: print(f"Warning: Could not update block cache: {type(e).__name__}: {e}")
+    if stats is not None: stats['cache_hits'] = cache.hits; stats['cache_misses'] = cache.misses
+
+# --- Token budget packing ---
+def path_matches_glob(path: str, pattern: str) -> bool:
+    # fnmatch against the relative path and the bare file name
+    return fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(path.rpartition('/')[2], pattern)
+
+def parse_priority(spec: str) -> Tuple[str, float]:
+    # 'GLOB=WEIGHT' -> (glob, weight); raises ValueError
+    pattern, sep, weight = spec.rpartition('=')
+    if not sep or not pattern.strip(): raise ValueError(f"Invalid priority '{spec}': expected GLOB=WEIGHT.")
+    try: return pattern.strip(), float(weight)
+    except ValueError: raise ValueError(f"Invalid priority weight in '{spec}'.") from None
+
+class TokenBudget:
+    # Budget mode: the selected files are packed into max_tokens. A file's value is the weight of the first matching
+    # priority glob (1.0 if none match, <= 0 leaves it out), raised by up to recency_weight for recently modified
+    # files and divided by (1 + size_penalty * tokens / 1000).
+    def __init__(self, max_tokens: int, priorities: Optional[List[Tuple[str, float]]] = None,
+                 recency_weight: float = PACK_RECENCY_WEIGHT, size_penalty: float = PACK_SIZE_PENALTY):
+        self.max_tokens = max_tokens; self.priorities = priorities or []
+        self.recency_weight = recency_weight; self.size_penalty = size_penalty
+
+    def file_value(self, path: str, tokens: int, recency: float) -> float:
+        weight = next((w for pattern, w in self.priorities if path_matches_glob(path, pattern)), 1.0)
+        if weight <= 0: return 0.0
+        return weight * (1.0 + self.recency_weight * recency) / (1.0 + self.size_penalty * tokens / 1000)
+
+def pack_to_budget(weights: List[int], values: List[float], capacity: int) -> List[int]:
+    # 0/1 knapsack: indexes (ascending) of a subset with total weight <= capacity and high total value. Greedy by
+    # value density is O(n log n) and close to optimal when files are small next to the budget; for fewer
+    # candidates an exact DP over the budget in PACK_DP_BUCKETS steps (weights rounded up, so it never overshoots)
+    # also runs, and the better of the two wins.
+    candidates = [i for i in range(len(weights)) if values[i] > 0 and weights[i] <= capacity]
+    if sum(weights[i] for i in candidates) <= capacity: return candidates
+    if not candidates: return []
+    total_value = lambda chosen: sum(values[i] for i in chosen)
+
+    greedy: List[int] = []; room = capacity
+    for i in sorted(candidates, key=lambda i: values[i] / max(weights[i], 1), reverse=True):
+        if weights[i] <= room: greedy.append(i); room -= weights[i]
+    best_single = max(candidates, key=lambda i: values[i])
+    best = greedy if total_value(greedy) >= values[best_single] else [best_single]
+
+    buckets = min(capacity, PACK_DP_BUCKETS)
+    if len(candidates) * buckets <= PACK_DP_MAX_CELLS:
+        scale = -(-capacity // buckets); cap = capacity // scale
+        table = [0.0] * (cap + 1); taken: List[Tuple[int, int, bytes]] = []
+        for i in candidates:
+            w = -(-weights[i] // scale); v = values[i]
+            if w > cap: continue
+            with_item = [prev + v for prev in table[:cap + 1 - w]]
+            improves = [a > b for a, b in zip(with_item, table[w:])]
+            table[w:] = [a if keep else b for a, b, keep in zip(with_item, table[w:], improves)]
+            taken.append((i, w, bytes(w) + bytes(improves)))
+        exact: List[int] = []; c = cap
+        for i, w, improves in reversed(taken):
+            if improves[c]: exact.append(i); c -= w
+        if total_value(exact) > total_value(best): best = exact
+    return sorted(best)
+
+def _budget_notes(budget: TokenBudget, selected_count: int, dropped: List[Tuple[str, int]]) -> List[str]:
+    # Header lines describing the budget and the dropped files
+    notes = [f"Token budget: {budget.max_tokens} tokens ({len(dropped)} of {selected_count} selected files dropped to fit)"]
+    if not dropped: return notes
+    notes.append("Dropped files:"); notes.extend(f"  - {path} ({tokens} tokens)" for path, tokens in dropped[:PACK_HEADER_MAX_DROPPED])
+    if len(dropped) > PACK_HEADER_MAX_DROPPED: notes.append(f"  ... and {len(dropped) - PACK_HEADER_MAX_DROPPED} more")
+    return notes
+
+def _measure_blocks(project_path: str, relative_filepaths: List[str], token_counter: Optional[TokenCounter],
+                    max_workers: int, use_processes: bool, cache: Optional[RenderedBlockCache],
+                    cancel_event: Optional[threading.Event], large_files: LargeFilePolicy, output_format: OutputFormat,
+                    transforms: Optional[TransformPolicy] = None) -> List[int]:
+    # Token cost of each file's block, from the tokenizer (cached by content) or as chars/4 rounded up. With a
+    # block cache this pass makes the later write a cache hit for every chosen file.
+    blocks = iter_rendered_blocks(project_path, relative_filepaths, max_workers, use_processes, cache, "", large_files, output_format, transforms)
+    if cancel_event is not None: blocks = _track_generation(blocks, len(relative_filepaths), None, cancel_event)
+    costs: List[int] = []; batch: List[str] = []
+    count_batch = token_counter.count_many if token_counter is not None else lambda texts: [-(-len(text) // 4) for text in texts]
+    try:
+        for block in blocks:
+            batch.append(block)
+            if len(batch) >= TOKEN_COUNT_BATCH: costs.extend(count_batch(batch)); batch = []
+        if batch: costs.extend(count_batch(batch))
+    finally: blocks.close()
+    return costs
+
+def _fit_token_budget(project_path: str, relative_filepaths: List[str], budget: TokenBudget, project_name: str,
+                      generated_at: datetime, footer: str, token_counter: Optional[TokenCounter], max_workers: int,
+                      use_processes: bool, cache: Optional[RenderedBlockCache], cancel_event: Optional[threading.Event],
+                      large_files: LargeFilePolicy, output_format: OutputFormat,
+                      duplicates: Optional[Dict[str, str]] = None,
+                      transforms: Optional[TransformPolicy] = None) -> Tuple[List[str], Dict[str, int], List[Tuple[str, int]], List[str]]:
+    # Chooses the files to emit: (chosen paths, their token counts, dropped (path, tokens), header budget notes).
+    # The header lists the dropped files, so its size depends on the choice; the budget left for files shrinks by
+    # any overshoot until header, files, separators and footer fit together. duplicates (see find_duplicate_files)
+    # are priced as references, and each first copy is packed together with its duplicates so none is orphaned.
+    duplicates = duplicates or {}
+    unique_filepaths = [path for path in relative_filepaths if path not in duplicates]
+    count = token_counter.count if token_counter is not None else lambda text: -(-len(text) // 4)
+    cost_of = dict(zip(unique_filepaths, _measure_blocks(project_path, unique_filepaths, token_counter, max_workers, use_processes,
+                                                         cache, cancel_event, large_files, output_format, transforms)))
+    for path, original in duplicates.items(): cost_of[path] = count(output_format.block(FileRecord(path, "duplicate", duplicate_of=original)))
+    costs = [cost_of[path] for path in relative_filepaths]
+    separator = count(output_format.separator)
+    mtimes: List[float] = []
+    for relative_filepath in relative_filepaths:
+        try: mtimes.append(os.stat(os.path.join(project_path, relative_filepath)).st_mtime)
+        except OSError: mtimes.append(0.0)
+    oldest = min(mtimes); span = max(mtimes) - oldest
+    values = [budget.file_value(path, cost, (mtime - oldest) / span if span else 1.0)
+              for path, cost, mtime in zip(relative_filepaths, costs, mtimes)]
+    weights = [cost + separator for cost in costs] # The one separator too many is given back in the capacity
+    groups: List[List[int]] = []; group_of: Dict[str, int] = {} # A file and its duplicates go in or out together
+    for i, path in enumerate(relative_filepaths):
+        if path in duplicates: groups[group_of[duplicates[path]]].append(i)
+        else: group_of[path] = len(groups); groups.append([i])
+    group_weights = [sum(weights[i] for i in group) for group in groups]
+    group_values = [sum(values[i] for i in group) if values[group[0]] > 0 else 0.0 for group in groups]
+
+    overshoot = 0; no_drops = _budget_notes(budget, len(relative_filepaths), [])
+    while True:
+        capacity = budget.max_tokens - overshoot - count(output_format.header(project_name, generated_at, len(relative_filepaths), no_drops)) - count(footer) + separator
+        chosen = {i for g in pack_to_budget(group_weights, group_values, capacity) for i in groups[g]} if capacity > 0 else set()
+        dropped = [(path, costs[i]) for i, path in enumerate(relative_filepaths) if i not in chosen]
+        notes = _budget_notes(budget, len(relative_filepaths), dropped)
+        file_costs = {relative_filepaths[i]: costs[i] for i in sorted(chosen)}
+        total = (sum(file_costs.values()) + max(len(file_costs) - 1, 0) * separator
+                 + count(output_format.header(project_name, generated_at, len(file_costs), notes)) + count(footer))
+        if total <= budget.max_tokens or not chosen: return list(file_costs), file_costs, dropped, notes
+        overshoot += total - budget.max_tokens
+
+# --- Deduplication ---
+def _file_size_and_digest(filepath: str, digest: bool) -> Tuple[int, str]:
+    # (size, sha256 hex or '') of a file; size -1 if it cannot be read
+    try:
+        if not digest: return os.stat(filepath).st_size, ""
+        with open(filepath, 'rb') as f: data = f.read()
+        return len(data), hashlib.sha256(data).hexdigest()
+    except OSError: return -1, ""
+
+def find_duplicate_files(project_path: str, relative_filepaths: List[str], max_workers: int = GENERATION_MAX_WORKERS) -> Dict[str, str]:
+    # Maps every file whose bytes equal those of an earlier file in relative_filepaths to that first copy. Files are
+    # sized in parallel and only those sharing a size with another non-empty file of at most MAX_FILE_SIZE_READ are
+    # read and hashed, also in parallel. Larger files are excerpted rather than copied in full, so they are left
+    # alone, as are unreadable ones.
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(relative_filepaths)))) as executor:
+        sizes = list(executor.map(lambda path: _file_size_and_digest(os.path.join(project_path, path), False)[0], relative_filepaths))
+        paths_by_size: Dict[int, List[str]] = {}
+        for path, size in zip(relative_filepaths, sizes):
+            if 0 < size <= MAX_FILE_SIZE_READ: paths_by_size.setdefault(size, []).append(path)
+        candidates = [path for paths in paths_by_size.values() if len(paths) > 1 for path in paths]
+        digests = dict(zip(candidates, executor.map(lambda path: _file_size_and_digest(os.path.join(project_path, path), True), candidates)))
+    first_copies: Dict[Tuple[int, str], str] = {}; duplicates: Dict[str, str] = {}
+    for path in relative_filepaths:
+        size_and_digest = digests.get(path)
+        if size_and_digest is None or size_and_digest[0] < 0: continue
+        original = first_copies.setdefault(size_and_digest, path)
+        if original != path: duplicates[path] = original
+    return duplicates
+
+def _with_duplicate_references(blocks: Iterator[str], relative_filepaths: List[str], duplicates: Dict[str, str],
+                               output_format: OutputFormat, saved: Dict[str, int]) -> Iterator[str]:
+    # Yields a block for every path in relative_filepaths: the next of blocks (rendered for the non-duplicates, in
+    # order) or a short reference to the first copy. saved gets the 'chars' and 'bytes' the references save
+    # compared with repeating the first copy's block.
+    originals = set(duplicates.values()); original_sizes: Dict[str, Tuple[int, int]] = {}
+    try:
+        for path in relative_filepaths:
+            original = duplicates.get(path)
+            if original is None:
+                block = next(blocks)
+                if path in originals: original_sizes[path] = (len(block), len(block.encode('utf-8')))
+            else:
+                block = output_format.block(FileRecord(path, "duplicate", duplicate_of=original))
+                chars, size = original_sizes[original]
+                saved['chars'] += chars - len(block); saved['bytes'] += size - len(block.encode('utf-8'))
+            yield block
+    finally:
+        close = getattr(blocks, 'close', None)
+        if close is not None: close()
+
+def _finish_dedup(duplicates: Dict[str, str], saved: Dict[str, int], file_token_counts: Dict[str, int],
+                  token_counter: Optional[TokenCounter], stats: Optional[Dict[str, Any]]):
+    if stats is None or not duplicates: return
+    if token_counter is not None: saved_tokens = sum(file_token_counts[original] - file_token_counts[path] for path, original in duplicates.items())
+    else: saved_tokens = saved['chars'] // 4
+    stats['duplicates'] = duplicates; stats['dedup_saved_bytes'] = saved['bytes']; stats['dedup_saved_tokens'] = saved_tokens
+
+def generate_text_from_selected_files(project_path: str, selected_items_data: Iterable[Any], custom_filename_base: Optional[str] = None,
+                                      max_workers: int = GENERATION_MAX_WORKERS, use_processes: bool = False,
+                                      streaming: bool = True, cache: Optional[RenderedBlockCache] = None,
+                                      stats: Optional[Dict[str, Any]] = None,
+                                      progress: Optional[Callable[[int, int, int], None]] = None,
+                                      cancel_event: Optional[threading.Event] = None,
+                                      output_filepath: Optional[str] = None,
+                                      token_counter: Optional[TokenCounter] = None,
+                                      token_budget: Optional[TokenBudget] = None,
+                                      large_files: LargeFilePolicy = DEFAULT_LARGE_FILE_POLICY,
+                                      output_format: OutputFormat = DEFAULT_OUTPUT_FORMAT,
+                                      compression: Optional[str] = None,
+                                      shard_limit: Optional[ShardLimit] = None,
+                                      deduplicate: bool = False,
+                                      transforms: Optional[TransformPolicy] = None) -> Tuple[Optional[str], str, int, int]:
+    # selected_items_data is a ProjectItemStore, item records ('Select'/'IsDir'/'Path'), or plain relative file paths.
+    # progress gets (files_done, files_total, chars_done) per file; setting cancel_event aborts without output.
+    # output_filepath overrides the timestamped name in OUTPUT_DIR. With a token_counter the returned token figure is
+    # a real BPE count (header, footer and separators included) and stats gets 'token_counts' per file; otherwise it
+    # is the chars/4 approximation. With a token_budget only the most valuable files that fit are written, and the
+    # header lists the dropped ones (stats gets 'budget_dropped'). large_files decides how files over
+    # MAX_FILE_SIZE_READ appear. output_format and compression (a COMPRESSIONS key) pick the file encoding; the
+    # default timestamped name gets the matching extension. With a shard_limit the output is streamed into
+    # name_part01, name_part02, ... (see write_context_sharded); the first part's path is returned and stats gets
+    # 'parts' as [(path, files, tokens)]. With deduplicate, a file with the same bytes as an earlier one is written
+    # as a reference to it, and stats gets 'duplicates' (path -> first copy), 'dedup_saved_bytes' and
+    # 'dedup_saved_tokens'. transforms rewrite text files before rendering (see TransformPolicy), and stats gets
+    # 'transform_savings' as {transform: [chars before, chars after, files changed]}.
+    if not project_path or not os.path.isdir(project_path):
+        return None, "Error: Project path is invalid.", 0, 0
+    if not selected_items_data: return None, "Error: No file data provided for generation.", 0, 0
+
+    if isinstance(selected_items_data, ProjectItemStore): relative_filepaths = selected_items_data.selected_file_paths()
+    elif isinstance(selected_items_data, list) and isinstance(selected_items_data[0], str): relative_filepaths = sorted(selected_items_data)
+    else:
+        files_to_read_items = [
+            item for item in selected_items_data
+            if item.get('Select', False) and not item.get('IsDir', True) and item.get('Type') != '⚠️ Error Dir'
+        ]
+        files_to_read_items.sort(key=lambda x: x.get('Path', ''))
+        relative_filepaths = [item['Path'] for item in files_to_read_items]
+    if not relative_filepaths: return None, "No files selected to generate context.", 0, 0
+    if cache is not None: cache.reset_counters()
+    project_name = os.path.basename(project_path); generated_at = datetime.now()
+    if compression and compression not in COMPRESSIONS: return None, f"Error: Unknown compression '{compression}'.", 0, 0
+    footer = output_format.footer(project_name)
+    budget_notes: List[str] = []; file_token_counts: Dict[str, int] = {}
+    duplicates = find_duplicate_files(project_path, relative_filepaths, max_workers) if deduplicate else {}
+    if token_budget is not None:
+        try:
+            relative_filepaths, budgeted_counts, dropped, budget_notes = _fit_token_budget(
+                project_path, relative_filepaths, token_budget, project_name, generated_at, footer, token_counter,
+                max_workers, use_processes, cache, cancel_event, large_files, output_format, duplicates, transforms)
+        except GenerationCancelled:
+            _finish_block_cache(cache, stats); return None, "Generation cancelled. No output file was written.", 0, 0
+        if stats is not None: stats['budget_dropped'] = dropped
+        if not relative_filepaths:
+            _finish_block_cache(cache, stats)
+            return None, f"Token budget of {token_budget.max_tokens} is too small for any of the selected files.", 0, 0
+        if token_counter is not None: file_token_counts = budgeted_counts # Already counted while packing
+        if duplicates: duplicates = {path: original for path, original in duplicates.items() if path in budgeted_counts}
+    unique_filepaths = [path for path in relative_filepaths if path not in duplicates] if duplicates else relative_filepaths
+    transform_savings: Dict[str, List[int]] = {}
+    if stats is not None and transforms is not None: stats['transform_savings'] = transform_savings # Filled as blocks are rendered
+    blocks = iter_rendered_blocks(project_path, unique_filepaths, max_workers, use_processes, cache, "", large_files, output_format,
+                                  transforms, transform_savings)
+    dedup_saved = {'chars': 0, 'bytes': 0}
+    if duplicates: blocks = _with_duplicate_references(blocks, relative_filepaths, duplicates, output_format, dedup_saved)
+    if token_counter is not None and not file_token_counts:
+        blocks = _count_block_tokens(blocks, relative_filepaths, token_counter, file_token_counts)
+    if progress is not None or cancel_event is not None:
+        blocks = _track_generation(blocks, len(relative_filepaths), progress, cancel_event)
+
+    # Construct the header. The file count is fixed by the selection, so streaming can write it up front.
+    header = output_format.header(project_name, generated_at, len(relative_filepaths), budget_notes)
+
+    if output_filepath is None:
+        extension = output_format.extension + (COMPRESSIONS[compression] if compression else "")
+        output_filepath = os.path.join(OUTPUT_DIR, build_output_filename(project_name, custom_filename_base, extension))
+    output_filename = os.path.basename(output_filepath)
+    try: os.makedirs(os.path.dirname(output_filepath) or ".", exist_ok=True)
+    except OSError as e: return None, f"Error creating output directory for '{output_filename}': {e}", 0, 0
+    success_msg = f"Context file generated: {output_filename} ({len(relative_filepaths)} files processed)"
+
+    if shard_limit is not None:
+        count_text = token_counter.count if token_counter is not None else lambda text: -(-len(text) // 4)
+        if token_counter is not None: count_block = lambda index, block: file_token_counts[relative_filepaths[index]]
+        else: count_block = lambda index, block: count_text(block)
+        def part_header(part: int, first_file: int) -> str:
+            part_note = f"Part {part}, starting at file {first_file} of {len(relative_filepaths)} (each part at most {shard_limit.describe()})"
+            return output_format.header(project_name, generated_at, len(relative_filepaths), [part_note] + (budget_notes if part == 1 else []))
+        extension = output_format.extension + (COMPRESSIONS[compression] if compression else "")
+        try:
+            parts, text_stats = write_context_sharded(output_filepath, part_header, blocks, footer, output_format.separator,
+                                                      compression, shard_limit, count_text, count_block, extension)
+        except GenerationCancelled:
+            return None, "Generation cancelled. No output file was written.", 0, 0
+        except Exception as e:
+            return None, f"Error saving output file '{output_filename}': {e}", 0, 0
+        finally: _finish_block_cache(cache, stats)
+        token_total = sum(tokens for _, _, tokens in parts)
+        if token_counter is not None:
+            _finish_token_counts(token_counter, file_token_counts, "", "", "", stats)
+            if stats is not None: stats['token_total'] = token_total
+        if stats is not None: stats['parts'] = parts
+        _finish_dedup(duplicates, dedup_saved, file_token_counts, token_counter, stats)
+        part_names = f"{os.path.basename(parts[0][0])}" if len(parts) == 1 else f"{os.path.basename(parts[0][0])} ... {os.path.basename(parts[-1][0])}"
+        return parts[0][0], f"Context file generated: {part_names} ({len(parts)} parts, {len(relative_filepaths)} files processed)", text_stats.words, token_total
+
+    if streaming:
+        try:
+            text_stats = write_context_streaming(output_filepath, header, blocks, footer, output_format.separator, compression)
+        except GenerationCancelled:
+            return None, "Generation cancelled. No output file was written.", 0, 0
+        except Exception as e:
+            return None, f"Error saving output file '{output_filename}': {e}", 0, 0
+        finally: _finish_block_cache(cache, stats)
+        token_total = text_stats.approx_tokens
+        if token_counter is not None:
+            token_total = _finish_token_counts(token_counter, file_token_counts, header, footer, output_format.separator, stats)
+        _finish_dedup(duplicates, dedup_saved, file_token_counts, token_counter, stats)
+        return output_filepath, success_msg, text_stats.words, token_total
+
+    try: content_parts: List[str] = list(blocks)
+    except GenerationCancelled: return None, "Generation cancelled. No output file was written.", 0, 0
+    finally: _finish_block_cache(cache, stats)
+    if not content_parts: return None, "No content generated. Files might have issues or were skipped.", 0, 0
+
+    final_text = header + output_format.separator.join(content_parts) + footer
+    word_count = len(final_text.split())
+    token_count_approx = int(len(final_text) / 4) # General LLM token approximation
+    if token_counter is not None:
+        token_count_approx = _finish_token_counts(token_counter, file_token_counts, header, footer, output_format.separator, stats)
+
+    try:
+        with open_output_text(output_filepath, compression) as f: f.write(final_text)
+        _finish_dedup(duplicates, dedup_saved, file_token_counts, token_counter, stats)
+        return output_filepath, success_msg, word_count, token_count_approx
+    except Exception as e:
+        return None, f"Error saving output file '{output_filename}': {e}", 0, 0
+
+# --- Content index ---
+def _indexable_bytes(full_filepath: str) -> Optional[bytes]:
+    # A text file's contents as UTF-8 for the content index, or None for binaries, files over MAX_FILE_SIZE_READ and
+    # unreadable files
+    try:
+        with open(full_filepath, 'rb') as f: data = f.read(MAX_FILE_SIZE_READ + 1)
+    except OSError: return None
+    if len(data) > MAX_FILE_SIZE_READ: return None
+    encoding, _ = sniff_bytes(data[:SNIFF_BYTES])
+    if encoding is None: return None
+    return data if encoding in ('utf-8', 'utf-8-sig') else data.decode(encoding, 'replace').encode('utf-8')
+
+def _trigrams(data: bytes) -> Set[Tuple[int, int, int]]:
+    # ASCII-case-folded byte trigrams, as tuples because zip builds them faster than slicing
+    data = data.lower()
+    return set(zip(data, data[1:], data[2:]))
+
+def _regex_literals(pattern: Any) -> List[str]:
+    # Literal runs that every match of a compiled str pattern contains, from its top-level concatenation (groups are
+    # looked into, alternations and repeats end a run). Under IGNORECASE, runs with non-ASCII characters are left out
+    # because the index only folds ASCII.
+    try: from re import _parser as sre_parse # type: ignore # Python 3.11+
+    except ImportError: import sre_parse # type: ignore
+    literals: List[str] = []; run: List[str] = []
+    def walk(items: Any):
+        for op, argument in items:
+            name = str(op)
+            if name == 'LITERAL': run.append(chr(argument))
+            elif name == 'SUBPATTERN': walk(argument[-1])
+            elif name != 'AT': # Anchors take no characters
+                literals.append("".join(run)); run.clear()
+    walk(sre_parse.parse(pattern.pattern, pattern.flags & ~re.UNICODE)); literals.append("".join(run))
+    return [literal for literal in literals if literal and not (pattern.flags & re.IGNORECASE and not literal.isascii())]
+
+class ContentIndex:
+    # Trigram index over a project's text files, for "every file that mentions X". Each indexed file gets an id, and
+    # each ASCII-lowercased byte trigram a posting list of the ids of the files containing it. A query intersects the
+    # lists of its trigrams (the literal runs of a regex), then reads only those candidates to confirm the match.
+    # update() re-reads files whose size or mtime changed. Changed and removed files are tombstoned (their id is
+    # dead), and the ids are renumbered once CONTENT_INDEX_COMPACT_RATIO of them are dead. The index is kept in a
+    # SQLite file per project under index_dir. Binaries and files over MAX_FILE_SIZE_READ are recorded but not
+    # indexed. update() and search() may run on different threads.
+    def __init__(self, project_path: str, index_dir: str = CONTENT_INDEX_DIR):
+        self.project_path = os.path.abspath(project_path)
+        self.index_filepath = os.path.join(index_dir, hashlib.sha1(self.project_path.encode('utf-8', 'surrogatepass')).hexdigest()[:16] + ".sqlite3")
+        self.files: List[Optional[Tuple[str, int, int, bool]]] = [] # id -> (relative path, size, mtime_ns, indexed); None = tombstone
+        self.id_by_path: Dict[str, int] = {}
+        self.postings: Dict[Tuple[int, int, int], array] = {}
+        self.tombstones = 0; self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int: return len(self.id_by_path)
+    def indexed_count(self) -> int: return sum(1 for entry in self.files if entry is not None and entry[3])
+
+    def load(self) -> bool:
+        # Reads the saved index; False (and an empty index) if there is none or it can't be used
+        if not os.path.isfile(self.index_filepath): return False
+        import sqlite3
+        try:
+            conn = sqlite3.connect(self.index_filepath)
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                if meta.get('version') != str(CONTENT_INDEX_VERSION) or meta.get('project_path') != self.project_path: return False
+                files: List[Optional[Tuple[str, int, int, bool]]] = []
+                for file_id, path, size, mtime_ns, indexed in conn.execute("SELECT id, path, size, mtime_ns, indexed FROM files ORDER BY id"):
+                    if file_id != len(files): return False
+                    files.append((path, size, mtime_ns, bool(indexed)))
+                postings: Dict[Tuple[int, int, int], array] = {}
+                for key, ids in conn.execute("SELECT trigram, ids FROM postings"):
+                    posting = array('I'); posting.frombytes(ids); postings[(key >> 16, (key >> 8) & 0xFF, key & 0xFF)] = posting
+            finally: conn.close()
+        except (sqlite3.Error, ValueError): return False
+        with self._lock:
+            self.files = files; self.id_by_path = {entry[0]: file_id for file_id, entry in enumerate(files)}
+            self.postings = postings; self.tombstones = 0; self.dirty = False
+        return True
+
+    def save(self):
+        # Writes the index (compacted, so no tombstones are stored) if it changed since load() or the last save()
+        import sqlite3
+        with self._lock:
+            if not self.dirty: return
+            if self.tombstones: self._compact_locked()
+            os.makedirs(os.path.dirname(self.index_filepath), exist_ok=True)
+            partial_filepath = self.index_filepath + ".part"
+            if os.path.exists(partial_filepath): os.remove(partial_filepath)
+            try:
+                with sqlite3.connect(partial_filepath) as conn:
+                    conn.executescript("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+                                       "CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                                       "mtime_ns INTEGER NOT NULL, indexed INTEGER NOT NULL);"
+                                       "CREATE TABLE postings (trigram INTEGER PRIMARY KEY, ids BLOB NOT NULL);")
+                    conn.executemany("INSERT INTO meta VALUES (?, ?)", (('version', str(CONTENT_INDEX_VERSION)), ('project_path', self.project_path)))
+                    conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", ((file_id, *entry) for file_id, entry in enumerate(self.files)))
+                    conn.executemany("INSERT INTO postings VALUES (?, ?)", (((a << 16) | (b << 8) | c, ids.tobytes()) for (a, b, c), ids in self.postings.items()))
+                conn.close()
+                os.replace(partial_filepath, self.index_filepath); self.dirty = False
+            except BaseException:
+                try: os.remove(partial_filepath)
+                except OSError: pass
+                raise
+
+    def _tombstone_locked(self, file_id: int):
+        path = self.files[file_id][0]; self.files[file_id] = None; self.tombstones += 1; self.dirty = True
+        if self.id_by_path.get(path) == file_id: del self.id_by_path[path]
+
+    def _compact_locked(self):
+        remap = array('i', [-1]) * len(self.files); files: List[Optional[Tuple[str, int, int, bool]]] = []
+        for file_id, entry in enumerate(self.files):
+            if entry is not None: remap[file_id] = len(files); files.append(entry)
+        postings: Dict[Tuple[int, int, int], array] = {}
+        for key, ids in self.postings.items():
+            kept = array('I', [remap[file_id] for file_id in ids if remap[file_id] >= 0])
+            if kept: postings[key] = kept
+        self.files = files; self.id_by_path = {entry[0]: file_id for file_id, entry in enumerate(files)}
+        self.postings = postings; self.tombstones = 0
+
+    def update(self, relative_filepaths: List[str], max_workers: int = GENERATION_MAX_WORKERS,
+               cancel: Optional[threading.Event] = None, progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
+        # Brings the index in line with relative_filepaths (the project's files) and returns (files re-read, files
+        # dropped). Files are statted, then the changed ones read, in parallel; progress(done, total) is called as
+        # the changed files are indexed. A cancelled update keeps what it indexed so far.
+        from concurrent.futures import ThreadPoolExecutor
+        from collections import deque
+        wanted = set(relative_filepaths); dropped = 0
+        with self._lock:
+            for path, file_id in list(self.id_by_path.items()):
+                if path not in wanted: self._tombstone_locked(file_id); dropped += 1
+        def stat_batch(paths: List[str]) -> List[Optional[os.stat_result]]: # Batched: one task per stat costs more than the stat
+            results: List[Optional[os.stat_result]] = []
+            for path in paths:
+                try: results.append(os.stat(os.path.join(self.project_path, path)))
+                except OSError: results.append(None)
+            return results
+        changed: List[Tuple[str, int, int]] = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(relative_filepaths) or 1))) as executor:
+            racy_after = time.time_ns() - BLOCK_CACHE_RACY_WINDOW_NS
+            batches = [relative_filepaths[start:start + CONTENT_INDEX_STAT_BATCH] for start in range(0, len(relative_filepaths), CONTENT_INDEX_STAT_BATCH)]
+            file_stats = (file_stat for batch in executor.map(stat_batch, batches) for file_stat in batch)
+            for path, file_stat in zip(relative_filepaths, file_stats):
+                file_id = self.id_by_path.get(path)
+                if file_stat is None:
+                    if file_id is not None:
+                        with self._lock: self._tombstone_locked(file_id); dropped += 1
+                    continue
+                # An mtime this recent can't tell a later edit in the same tick apart, so it is stored as 0 (re-read next time)
+                mtime_ns = 0 if file_stat.st_mtime_ns >= racy_after else file_stat.st_mtime_ns
+                entry = self.files[file_id] if file_id is not None else None
+                if entry is None or entry[1] != file_stat.st_size or entry[2] != file_stat.st_mtime_ns or not entry[2]:
+                    changed.append((path, file_stat.st_size, mtime_ns))
+            def read(change: Tuple[str, int, int]) -> Optional[bytes]: return _indexable_bytes(os.path.join(self.project_path, change[0]))
+            window: Deque[Tuple[Tuple[str, int, int], Any]] = deque(); done = 0; pending = iter(changed)
+            while True: # A window of reads in flight, so memory holds a few files rather than every changed one
+                for change in pending:
+                    window.append((change, executor.submit(read, change)))
+                    if len(window) >= max_workers * GENERATION_WINDOW_PER_WORKER: break
+                if not window: break
+                (path, size, mtime_ns), future = window.popleft()
+                if cancel is not None and cancel.is_set():
+                    for _, future in window: future.cancel()
+                    break
+                data = future.result(); trigrams = _trigrams(data) if data else ()
+                with self._lock:
+                    file_id = self.id_by_path.get(path)
+                    if file_id is not None: self._tombstone_locked(file_id)
+                    file_id = len(self.files); self.files.append((path, size, mtime_ns, data is not None))
+                    self.id_by_path[path] = file_id; self.dirty = True
+                    postings = self.postings
+                    for trigram in trigrams:
+                        ids = postings.get(trigram)
+                        if ids is None: postings[trigram] = ids = array('I')
+                        ids.append(file_id)
+                done += 1
+                if progress and (done % CONTENT_INDEX_PROGRESS_FILES == 0 or done == len(changed)): progress(done, len(changed))
+        with self._lock:
+            if self.tombstones > len(self.files) * CONTENT_INDEX_COMPACT_RATIO: self._compact_locked()
+        return len(changed), dropped
+
+    def candidates(self, literals: Iterable[str]) -> List[str]:
+        # Paths of the indexed files that contain every trigram of every literal (all indexed files if none has one)
+        trigrams: Set[Tuple[int, int, int]] = set()
+        for literal in literals: trigrams |= _trigrams(literal.encode('utf-8'))
+        with self._lock:
+            files = self.files
+            if not trigrams: return [entry[0] for entry in files if entry is not None and entry[3]]
+            posting_lists = []
+            for trigram in trigrams:
+                ids = self.postings.get(trigram)
+                if ids is None: return []
+                posting_lists.append(ids)
+            posting_lists.sort(key=len)
+            found = set(posting_lists[0])
+            for ids in posting_lists[1:]:
+                found.intersection_update(ids)
+                if not found: return []
+            return [entry[0] for entry in (files[file_id] for file_id in sorted(found)) if entry is not None]
+
+    def search(self, query: str, regex: bool = False, match_case: bool = False, max_workers: int = GENERATION_MAX_WORKERS,
+               cancel: Optional[threading.Event] = None) -> List[str]:
+        # Relative paths of the indexed files that contain query (a substring, or a Python regex if regex is set),
+        # checked against their current contents. Case-insensitive substring search folds ASCII letters only; an
+        # invalid regex raises re.error.
+        if not query: return []
+        if regex:
+            pattern = re.compile(query, 0 if match_case else re.IGNORECASE)
+            candidates = self.candidates(_regex_literals(pattern))
+            def matches(data: bytes) -> bool: return pattern.search(data.decode('utf-8', 'replace')) is not None
+        else:
+            needle = query.encode('utf-8'); candidates = self.candidates([query])
+            if match_case:
+                def matches(data: bytes) -> bool: return needle in data
+            else:
+                needle = needle.lower()
+                def matches(data: bytes) -> bool: return needle in data.lower()
+        def check(path: str) -> bool:
+            if cancel is not None and cancel.is_set(): return False
+            data = _indexable_bytes(os.path.join(self.project_path, path))
+            return data is not None and matches(data)
+        if not candidates: return []
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidates)))) as executor:
+            return [path for path, found in zip(candidates, executor.map(check, candidates)) if found]
+
+# --- Paged viewing ---
+class LineIndexedFile:
+    # Random access by line to a text file of any size, for the viewer. open() maps the file (one under
+    # VIEWER_MAP_MIN_BYTES is read into memory instead, so a project file edited on disk can't fault the mapping) and
+    # build_index() records the number of newlines before every VIEWER_INDEX_BLOCK bytes: a line is then found with
+    # one lookup and a scan of at most one block. Both are meant for a background thread; lines and matches are
+    # available up to indexed_bytes while the index is built. With decompress, .gz/.xz/.zst outputs are decompressed,
+    # and UTF-16/32 files re-encoded, to a temporary UTF-8 file first. find() scans the raw bytes, nothing is decoded.
+    def __init__(self, path: str, decompress: bool = False):
+        self.path = path; self.decompress = decompress
+        self.data: Any = b""; self.size = 0
+        self.encoding = 'utf-8'; self.binary = False # binary: the sniffer's verdict; NULs are shown as U+2400
+        self.indexed_bytes = 0; self.complete = False
+        self._block_newlines = array('Q', [0]) # Newlines before each indexed block, plus one past the last
+        self._mapping: Any = None; self._temp_path = ""
+
+    def open(self, cancel: Optional[threading.Event] = None):
+        # Raises OSError (or ValueError for a zstd output without a zstd module) if the file can't be read
+        source = self.path
+        if self.decompress and os.path.splitext(self.path)[1] in COMPRESSIONS.values():
+            with open_context_text(self.path) as reader: source = self._transcode(reader, cancel)
+        else:
+            encoding, reason = sniff_file(self.path)
+            if encoding in ('utf-16', 'utf-32'):
+                with open(self.path, 'r', encoding=encoding, errors='replace') as reader: source = self._transcode(reader, cancel)
+            else: self.encoding = 'latin-1' if encoding == 'latin-1' else 'utf-8'; self.binary = encoding is None
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < VIEWER_MAP_MIN_BYTES: self.data = f.read()
+            else:
+                import mmap
+                self._mapping = self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data)
+
+    def _transcode(self, reader: Any, cancel: Optional[threading.Event]) -> str:
+        import tempfile
+        fd, self._temp_path = tempfile.mkstemp(prefix="context_view_", suffix=".txt")
+        with open(fd, 'w', encoding='utf-8', newline='') as out:
+            while not (cancel is not None and cancel.is_set()):
+                chunk = reader.read(VIEWER_TRANSCODE_CHUNK)
+                if not chunk: break
+                out.write(chunk)
+        return self._temp_path
+
+    def build_index(self, cancel: Optional[threading.Event] = None, progress: Optional[Callable[[int, int], None]] = None):
+        # progress(indexed_bytes, size) after every VIEWER_INDEX_CHUNK bytes
+        data = self.data; block_newlines = self._block_newlines; newlines = block_newlines[-1]
+        for chunk_start in range(self.indexed_bytes, self.size, VIEWER_INDEX_CHUNK):
+            if cancel is not None and cancel.is_set(): return
+            chunk = data[chunk_start:chunk_start + VIEWER_INDEX_CHUNK]
+            for block_start in range(0, len(chunk), VIEWER_INDEX_BLOCK):
+                newlines += chunk.count(b"\n", block_start, block_start + VIEWER_INDEX_BLOCK); block_newlines.append(newlines)
+            self.indexed_bytes = chunk_start + len(chunk)
+            if progress: progress(self.indexed_bytes, self.size)
+        self.complete = True
+
+    def line_count(self) -> int:
+        # Lines indexed so far; once complete, a last line without a newline counts too
+        lines = self._block_newlines[-1]
+        if self.complete and self.size and self.data[self.size - 1:self.size] != b"\n": lines += 1
+        return lines
+
+    def line_start(self, line: int) -> int:
+        if line <= 0: return 0
+        block = bisect.bisect_left(self._block_newlines, line) - 1
+        position = block * VIEWER_INDEX_BLOCK; data = self.data
+        for _ in range(line - self._block_newlines[block]): position = data.find(b"\n", position) + 1
+        return position
+
+    def line_of_offset(self, offset: int) -> int:
+        # The line containing byte offset, which must be below indexed_bytes
+        block = offset // VIEWER_INDEX_BLOCK
+        return self._block_newlines[block] + self.data[block * VIEWER_INDEX_BLOCK:offset].count(b"\n")
+
+    def decode(self, start: int, end: int) -> str:
+        text = self.data[start:end].decode(self.encoding, 'replace')
+        if start == 0 and text.startswith('\ufeff'): text = text[1:]
+        return text.replace('\0', '\u2400') if self.binary else text
+
+    def lines(self, first: int, count: int) -> List[str]:
+        # Up to count decoded lines from line first, without their line breaks and cut at VIEWER_MAX_LINE_BYTES
+        count = min(count, self.line_count() - first)
+        if count <= 0: return []
+        data = self.data; position = self.line_start(first); result: List[str] = []
+        for _ in range(count):
+            end = data.find(b"\n", position)
+            if end < 0: end = self.size
+            result.append(self.decode(position, min(end, position + VIEWER_MAX_LINE_BYTES)).rstrip('\r')); position = end + 1
+        return result
+
+    def find(self, needle: bytes, start: int, end: int, ignore_case: bool = False, backwards: bool = False) -> int:
+        # Offset of the first (or last) occurrence of needle that starts in [start, end), or -1. ignore_case folds
+        # ASCII letters only and works on a lowered copy of the range, so callers search large files a chunk at a time.
+        if not needle: return -1
+        stop = min(end + len(needle) - 1, self.size)
+        if not ignore_case or needle.lower() == needle.upper():
+            return self.data.rfind(needle, start, stop) if backwards else self.data.find(needle, start, stop)
+        haystack = self.data[start:stop].lower(); needle = needle.lower()
+        offset = haystack.rfind(needle) if backwards else haystack.find(needle)
+        return start + offset if offset >= 0 else -1
+
+    def close(self):
+        # Call once no other thread uses the file
+        if self._mapping is not None: self._mapping.close(); self._mapping = None
+        self.data = b""; self.size = 0
+        if self._temp_path:
+            try: os.remove(self._temp_path)
+            except OSError: pass
+            self._temp_path = ""
+
+# --- Batch compilation ---
+def load_batch_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    # Reads a JSON manifest: a list of projects, or {"defaults": {...}, "projects": [...]} where defaults fill in keys
+    # a project leaves out. A project is a path string or an object with 'path' and optional BATCH_JOB_KEYS. Paths
+    # are relative to the manifest. 'name' (default: the directory name) names the output file, so it must be
+    # unique. Raises ValueError for a malformed manifest and OSError if it cannot be read.
+    import json
+    with open(manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+    defaults: Any = {}; projects: Any = manifest
+    if isinstance(manifest, dict): defaults = manifest.get('defaults', {}); projects = manifest.get('projects')
+    if not isinstance(projects, list) or not isinstance(defaults, dict):
+        raise ValueError(f"Manifest '{manifest_path}' must be a list of projects or an object with a 'projects' list.")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs: List[Dict[str, Any]] = []; names: Set[str] = set()
+    for number, project in enumerate(projects, 1):
+        if isinstance(project, str): project = {'path': project}
+        if not isinstance(project, dict) or not project.get('path'): raise ValueError(f"Project {number} in '{manifest_path}' has no 'path'.")
+        job = {**defaults, **project}
+        unknown = sorted(set(job) - BATCH_JOB_KEYS)
+        if unknown: raise ValueError(f"Project {number} in '{manifest_path}' has unknown keys: {', '.join(unknown)}.")
+        job['path'] = os.path.normpath(os.path.join(base_dir, os.path.expanduser(job['path'])))
+        if job.get('out'): job['out'] = os.path.join(base_dir, os.path.expanduser(job['out']))
+        job['name'] = str(job.get('name') or os.path.basename(job['path']))
+        for key in ('include', 'exclude', 'priority', 'transforms'):
+            if isinstance(job.get(key), str): job[key] = [job[key]]
+        if job.get('format', DEFAULT_OUTPUT_FORMAT.name) not in OUTPUT_FORMATS: raise ValueError(f"Project '{job['name']}': unknown format '{job['format']}'.")
+        if job.get('compress') and job['compress'] not in COMPRESSIONS: raise ValueError(f"Project '{job['name']}': unknown compression '{job['compress']}'.")
+        if job['name'] in names: raise ValueError(f"Project name '{job['name']}' is used twice in '{manifest_path}'; set distinct 'name' values.")
+        names.add(job['name']); jobs.append(job)
+    return jobs
+
+def compile_project(job: Dict[str, Any], output_dir: str = OUTPUT_DIR, cache_dir: Optional[str] = None,
+                    max_workers: int = BATCH_JOB_WORKERS) -> Dict[str, Any]:
+    # Scans and generates one manifest project (see load_batch_manifest). Module level so a process pool can run it,
+    # and it never raises: a failure is reported in 'error'. Returns name, path, outputs (one path per part),
+    # files, bytes (on disk), tokens, seconds and error. With cache_dir each project gets its own block cache in
+    # cache_dir/<name>, so parallel jobs never share a SQLite file.
+    t_start = time.perf_counter()
+    result: Dict[str, Any] = {'name': job['name'], 'path': job['path'], 'outputs': [], 'files': 0, 'bytes': 0, 'tokens': 0, 'seconds': 0.0, 'error': ''}
+    cache: Optional[RenderedBlockCache] = None
+    try:
+        items, msg = list_project_items(job['path'], max_workers, respect_gitignore=job.get('gitignore', True))
+        relative_filepaths = select_paths(items, job.get('include'), job.get('exclude')) if len(items) > 1 else []
+        if len(items) <= 1: result['error'] = msg
+        elif not relative_filepaths: result['error'] = "No files matched the include/exclude patterns."
+        else:
+            output_format = OUTPUT_FORMATS[job.get('format', DEFAULT_OUTPUT_FORMAT.name)]; compression = job.get('compress') or None
+            output_filepath = job.get('out') or os.path.join(output_dir, job['name'] + output_format.extension + (COMPRESSIONS[compression] if compression else ""))
+            tokenizer = load_tokenizer(job['tokenizer']) if job.get('tokenizer') else None
+            token_budget = TokenBudget(int(job['budget']), [parse_priority(spec) for spec in job.get('priority', [])]) if job.get('budget') else None
+            transforms = transform_policy_from_rules(job.get('transforms', []))
+            shard_limit = ShardLimit(int(job.get('shard_tokens', 0)), int(job.get('shard_bytes', 0))) if job.get('shard_tokens') or job.get('shard_bytes') else None
+            if cache_dir: cache = RenderedBlockCache(os.path.join(cache_dir, job['name']))
+            stats: Dict[str, Any] = {}
+            output_filepath, msg, _, token_count = generate_text_from_selected_files(
+                job['path'], relative_filepaths, max_workers=max_workers, cache=cache, stats=stats, output_filepath=output_filepath,
+                token_counter=TokenCounter(tokenizer, cache) if tokenizer is not None else None, token_budget=token_budget,
+                large_files=LargeFilePolicy(job.get('large_files', "skip")), output_format=output_format,
+                compression=compression, shard_limit=shard_limit, deduplicate=bool(job.get('dedup')), transforms=transforms)
+            if output_filepath is None: result['error'] = msg
+            else:
+                result['outputs'] = [path for path, _, _ in stats['parts']] if 'parts' in stats else [output_filepath]
+                result['files'] = len(relative_filepaths) - len(stats.get('budget_dropped', [])); result['tokens'] = token_count
+                result['bytes'] = sum(os.path.getsize(path) for path in result['outputs'])
+    except Exception as e: result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if cache is not None: cache.close()
+        result['seconds'] = time.perf_counter() - t_start
+    return result
+
+def run_batch(jobs: List[Dict[str, Any]], max_jobs: int = BATCH_MAX_JOBS, output_dir: str = OUTPUT_DIR,
+              cache_dir: Optional[str] = None, max_workers: int = BATCH_JOB_WORKERS,
+              progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    # Runs compile_project for every job, up to max_jobs at a time in separate processes, so the batch takes about
+    # as long as its slowest project. progress gets each result as it finishes; the returned list is in job order.
+    if max_jobs <= 1 or len(jobs) <= 1:
+        results = []
+        for job in jobs:
+            results.append(compile_project(job, output_dir, cache_dir, max_workers))
+            if progress is not None: progress(results[-1])
+        return results
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    results_by_name: Dict[str, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=min(max_jobs, len(jobs))) as executor:
+        futures = {executor.submit(compile_project, job, output_dir, cache_dir, max_workers): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try: result = future.result()
+            except Exception as e: # The worker process died (killed, out of memory)
+                result = {'name': job['name'], 'path': job['path'], 'outputs': [], 'files': 0, 'bytes': 0, 'tokens': 0, 'seconds': 0.0,
+                          'error': f"Worker process failed: {type(e).__name__}: {e}"}
+            results_by_name[job['name']] = result
+            if progress is not None: progress(result)
+    return [results_by_name[job['name']] for job in jobs]
+
+def format_batch_summary(results: List[Dict[str, Any]], wall_seconds: float) -> str:
+    # Fixed-width table of the batch results, one row per project, with totals
+    name_width = max([len("Project")] + [len(result['name']) for result in results])
+    lines = [f"{'Project':<{name_width}}  {'Files':>7}  {'Bytes':>13}  {'Tokens':>11}  {'Time':>8}  Output"]
+    for result in results:
+        outcome = f"FAILED: {result['error']}" if result['error'] else result['outputs'][0] + (f" (+{len(result['outputs']) - 1} parts)" if len(result['outputs']) > 1 else "")
+        lines.append(f"{result['name']:<{name_width}}  {result['files']:>7}  {result['bytes']:>13,}  {result['tokens']:>11,}  {result['seconds']:>7.2f}s  {outcome}")
+    failed = sum(1 for result in results if result['error'])
+    lines.append(f"{len(results)} projects ({failed} failed): {sum(r['files'] for r in results)} files, {sum(r['bytes'] for r in results):,} bytes, "
+                 f"{sum(r['tokens'] for r in results):,} tokens in {wall_seconds:.2f}s wall ({sum(r['seconds'] for r in results):.2f}s summed).")
+    return "\n".join(lines)
+
+def _batch_main(args: Any) -> int:
+    try: jobs = load_batch_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest: {e}", file=sys.stderr); return 1
+    if not jobs:
+        print("The manifest lists no projects.", file=sys.stderr); return 1
+    t_start = time.perf_counter(); done = [0]
+    def report(result: Dict[str, Any]):
+        done[0] += 1
+        status = f"FAILED: {result['error']}" if result['error'] else f"{result['files']} files, {result['tokens']} tokens"
+        print(f"[{done[0]}/{len(jobs)}] {result['name']}: {status} ({result['seconds']:.2f}s)", file=sys.stderr)
+    results = run_batch(jobs, args.jobs, args.out_dir, args.cache_dir, args.workers, report)
+    print(format_batch_summary(results, time.perf_counter() - t_start))
+    return 1 if any(result['error'] for result in results) else 0
+
+# --- Command line ---
+def select_paths(store: ProjectItemStore, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None) -> List[str]:
+    # Scanned file paths matching any include glob (all files when there are none) and no exclude glob. Globs are
+    # fnmatch patterns tried against both the relative path and the file name, so '*.py' and 'src/*.py' both work.
+    def matches(path: str, patterns: List[str]) -> bool: return any(path_matches_glob(path, pattern) for pattern in patterns)
+    return [path for path in store.selected_file_paths()
+            if (not include or matches(path, include)) and not (exclude and matches(path, exclude))]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog="context_compiler", description="Build LLM context files without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="Scan a project and write its context file.")
+    compile_parser.add_argument("path", help="Project directory")
+    compile_parser.add_argument("--include", action="append", default=[], metavar="GLOB", help="Only include matching files (repeatable)")
+    compile_parser.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="Leave out matching files (repeatable)")
+    compile_parser.add_argument("--out", help=f"Output file (default: timestamped file in {OUTPUT_DIR}/)")
+    compile_parser.add_argument("--name", help="Output filename base when --out is not given")
+    compile_parser.add_argument("--no-gitignore", action="store_true", help="Don't honour .gitignore/.ignore files")
+    compile_parser.add_argument("--workers", type=int, default=GENERATION_MAX_WORKERS, help="Concurrent file reads")
+    compile_parser.add_argument("--cache-dir", help="Reuse rendered blocks from a persistent cache in this directory")
+    compile_parser.add_argument("--timings", action="store_true", help="Print scan and generation timings to stderr")
+    compile_parser.add_argument("--tokenizer", metavar="PATH_OR_NAME",
+                                help=f"Count tokens with a local BPE tokenizer (a name from {TOKENIZERS_DIR}/, a vocab.json+merges.txt directory or a .tiktoken file)")
+    compile_parser.add_argument("--file-tokens", action="store_true", help="With --tokenizer, list each file's token count on stderr")
+    compile_parser.add_argument("--budget", type=int, metavar="TOKENS", help="Pack the most valuable files that fit in this many tokens")
+    compile_parser.add_argument("--priority", action="append", default=[], metavar="GLOB=WEIGHT",
+                                help="Budget mode value of matching files (first match wins, default 1, 0 leaves them out; repeatable)")
+    compile_parser.add_argument("--recency-weight", type=float, default=PACK_RECENCY_WEIGHT, help="Budget mode bonus for recently modified files")
+    compile_parser.add_argument("--size-penalty", type=float, default=PACK_SIZE_PENALTY, help="Budget mode value penalty per 1000 tokens of file size")
+    compile_parser.add_argument("--large-files", choices=("excerpt", "skip"), default="skip",
+                                help=f"Files over {MAX_FILE_SIZE_READ // 1024}KB: keep their head and tail, or leave a note")
+    compile_parser.add_argument("--excerpt-head", type=int, default=LARGE_FILE_HEAD, metavar="N", help="Lines (or tokens) kept from the start of a large file")
+    compile_parser.add_argument("--excerpt-tail", type=int, default=LARGE_FILE_TAIL, metavar="N", help="Lines (or tokens) kept from the end of a large file")
+    compile_parser.add_argument("--excerpt-unit", choices=("lines", "tokens"), default="lines", help="Unit of --excerpt-head/--excerpt-tail")
+    compile_parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default=DEFAULT_OUTPUT_FORMAT.name, help="Output format")
+    compile_parser.add_argument("--compress", choices=list(COMPRESSIONS), help="Compress the output while writing it")
+    compile_parser.add_argument("--shard-tokens", type=int, default=0, metavar="TOKENS", help="Split the output into name_partNN files of at most this many tokens")
+    compile_parser.add_argument("--shard-bytes", type=int, default=0, metavar="BYTES", help="Split the output into name_partNN files of at most this many bytes")
+    compile_parser.add_argument("--transform", action="append", default=[], metavar="EXTS=TRANSFORMS",
+                                help=f"Rewrite matching files before rendering, e.g. 'py,js=comments,blank_lines' or '*=blank_lines' (repeatable; transforms: {', '.join(TRANSFORMS)})")
+    compile_parser.add_argument("--dedup", action="store_true", help="Write files identical to an earlier one as a reference to it")
+    batch_parser = commands.add_parser("batch", help="Compile every project in a JSON manifest, several at once.")
+    batch_parser.add_argument("manifest", help="JSON manifest of projects (see load_batch_manifest)")
+    batch_parser.add_argument("--jobs", type=int, default=BATCH_MAX_JOBS, help="Projects compiled at once, one process each")
+    batch_parser.add_argument("--workers", type=int, default=BATCH_JOB_WORKERS, help="Scan and read threads per project")
+    batch_parser.add_argument("--out-dir", default=OUTPUT_DIR, help="Directory for outputs of projects without 'out'")
+    batch_parser.add_argument("--cache-dir", help="Keep a block cache per project under this directory")
+    args = parser.parse_args(argv)
+    if args.command == "batch": return _batch_main(args)
+
+    t_start = time.perf_counter()
+    items, msg = list_project_items(args.path, respect_gitignore=not args.no_gitignore)
+    if len(items) <= 1:
+        print(msg, file=sys.stderr); return 1
+    relative_filepaths = select_paths(items, args.include, args.exclude)
+    if not relative_filepaths:
+        print("No files matched the include/exclude patterns.", file=sys.stderr); return 1
+    t_scanned = time.perf_counter()
+    try: tokenizer = load_tokenizer(args.tokenizer) if args.tokenizer else None
+    except (OSError, ValueError) as e:
+        print(f"Error loading tokenizer: {e}", file=sys.stderr); return 1
+    try:
+        token_budget = TokenBudget(args.budget, [parse_priority(spec) for spec in args.priority], args.recency_weight,
+                                   args.size_penalty) if args.budget else None
+        shard_limit = ShardLimit(args.shard_tokens, args.shard_bytes) if args.shard_tokens or args.shard_bytes else None
+        transforms = transform_policy_from_rules(args.transform)
+    except ValueError as e:
+        print(e, file=sys.stderr); return 1
+    cache = RenderedBlockCache(args.cache_dir) if args.cache_dir else None
+    stats: Dict[str, Any] = {}
+    try:
+        output_filepath, msg, word_count, token_count = generate_text_from_selected_files(
+            os.path.abspath(args.path), relative_filepaths, args.name, max_workers=args.workers, cache=cache, stats=stats,
+            output_filepath=args.out, token_counter=TokenCounter(tokenizer, cache) if tokenizer is not None else None,
+            token_budget=token_budget,
+            large_files=LargeFilePolicy(args.large_files, args.excerpt_head, args.excerpt_tail, args.excerpt_unit),
+            output_format=OUTPUT_FORMATS[args.format], compression=args.compress, shard_limit=shard_limit, deduplicate=args.dedup,
+            transforms=transforms)
+    finally:
+        if cache is not None: cache.close()
+    print(msg, file=sys.stderr)
+    if output_filepath is None: return 1
+    if stats.get('transform_savings'):
+        print("Transforms:\n" + "\n".join(f"  {line}" for line in format_transform_savings(stats['transform_savings'])), file=sys.stderr)
+    if stats.get('duplicates'):
+        print(f"Deduplicated: {len(stats['duplicates'])} files identical to earlier ones, saving {stats['dedup_saved_bytes']} bytes "
+              f"and {'' if tokenizer is not None else '~'}{stats['dedup_saved_tokens']} tokens.", file=sys.stderr)
+    if token_budget is not None: print(f"Token budget: {len(stats['budget_dropped'])} of {len(relative_filepaths)} files dropped to fit {token_budget.max_tokens} tokens.", file=sys.stderr)
+    if tokenizer is None: print(f"Content stats: {word_count} words, ~{token_count} tokens.", file=sys.stderr)
+    else:
+        print(f"Content stats: {word_count} words, {token_count} tokens ({tokenizer.name}).", file=sys.stderr)
+        if args.file_tokens:
+            for path, count in sorted(stats['token_counts'].items(), key=lambda kv: (-kv[1], kv[0])): print(f"{count:>10}  {path}", file=sys.stderr)
+    if args.timings:
+        t_done = time.perf_counter()
+        print(f"Timings: scan {t_scanned - t_start:.3f}s, generate {t_done - t_scanned:.3f}s.", file=sys.stderr)
+    if shard_limit is not None:
+        for path, file_count, tokens in stats['parts']: print(f"{os.path.basename(path)}: {file_count} files, {tokens} tokens", file=sys.stderr)
+    for path in ([path for path, _, _ in stats['parts']] if shard_limit is not None else [output_filepath]): print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context_compiler import ContentIndex
+
+def _write(path, text: str):
+    with open(path, "w", encoding="utf-8") as f: f.write(text)
+
+def test_search_checks_current_contents_for_every_query_length(tmp_path):
+    project = tmp_path / "project"; project.mkdir()
+    _write(project / "a.py", "def foo_bar(): pass\n"); _write(project / "b.py", "x = 1\n")
+    index = ContentIndex(str(project), str(tmp_path / "index")); index.update(["a.py", "b.py"])
+    assert index.search("foo") == ["a.py"] and index.search("FOO_B") == ["a.py"]
+    _write(project / "a.py", "def baz(): pass\n") # Edited after the last update()
+    for query in ("fo", "foo", "foo_", "FOO"): assert index.search(query) == []
+    assert index.search("fo+", regex=True) == []
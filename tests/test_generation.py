@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import random
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context_compiler import (
+    MAX_FILE_SIZE_READ, PACK_DP_BUCKETS, LargeFilePolicy, RenderedBlockCache, ShardLimit, TokenBudget, XmlFormat, find_duplicate_files, generate_text_from_selected_files,
+    pack_to_budget, render_file_block_cached,
+)
+
+def _write(path, text: str, age_s: float = 100.0):
+    # Files older than the cache's racy window, so their stat keys are trusted
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: f.write(text)
+    mtime = time.time() - age_s; os.utime(path, (mtime, mtime))
+
+def _read(path) -> str:
+    with open(path, encoding="utf-8") as f: return f.read()
+
+# --- block cache ---
+def test_block_cache_hits_until_the_file_changes(tmp_path):
+    project = tmp_path / "project"; _write(str(project / "a.py"), "x = 1\n")
+    cache = RenderedBlockCache(str(tmp_path / "cache"))
+    first = render_file_block_cached(cache, str(project), "a.py")
+    assert "x = 1" in first and (cache.hits, cache.misses) == (0, 1)
+    assert render_file_block_cached(cache, str(project), "a.py") == first and (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    cache = RenderedBlockCache(str(tmp_path / "cache")) # Persisted across instances
+    assert render_file_block_cached(cache, str(project), "a.py") == first and (cache.hits, cache.misses) == (1, 0)
+    _write(str(project / "a.py"), "x = 22\n", age_s=50)
+    changed = render_file_block_cached(cache, str(project), "a.py")
+    assert "x = 22" in changed and (cache.hits, cache.misses) == (1, 1)
+    _write(str(project / "a.py"), "x = 22\n", age_s=20) # Touched, same bytes: found by content hash
+    assert render_file_block_cached(cache, str(project), "a.py") == changed and (cache.hits, cache.misses) == (2, 1)
+    assert render_file_block_cached(cache, str(project), "a.py") == changed and (cache.hits, cache.misses) == (3, 1)
+    xml = render_file_block_cached(cache, str(project), "a.py", output_format=XmlFormat()) # Formats don't share keys
+    assert xml != changed and "<file" in xml and cache.misses == 2
+    cache.close()
+
+def test_block_cache_does_not_trust_stat_keys_of_just_written_files(tmp_path):
+    project = tmp_path / "project"; _write(str(project / "a.py"), "x = 1\n", age_s=0)
+    cache = RenderedBlockCache(str(tmp_path / "cache"))
+    render_file_block_cached(cache, str(project), "a.py")
+    with open(project / "a.py", "w", encoding="utf-8") as f: f.write("x = 2\n") # Same size, maybe the same mtime
+    assert "x = 2" in render_file_block_cached(cache, str(project), "a.py")
+    cache.close()
+
+def test_block_cache_finds_blocks_it_has_not_written_yet(tmp_path):
+    # Budget mode renders every file to measure it; the write that follows must hit the same (unflushed) entries
+    project = tmp_path / "project"; names = [f"f{i}.py" for i in range(5)]
+    for i, name in enumerate(names): _write(str(project / name), "x = 1\n" * (i + 1))
+    cache = RenderedBlockCache(str(tmp_path / "cache")); stats = {}
+    generate_text_from_selected_files(str(project), names, output_filepath=str(tmp_path / "out.txt"), cache=cache, stats=stats,
+                                      token_budget=TokenBudget(10_000))
+    assert (stats['cache_hits'], stats['cache_misses']) == (5, 5)
+    cache.close()
+
+# --- budget packing ---
+def _best_value(weights, values, capacity) -> float:
+    best = 0.0
+    for size in range(len(weights) + 1):
+        for subset in itertools.combinations(range(len(weights)), size):
+            if sum(weights[i] for i in subset) <= capacity: best = max(best, sum(values[i] for i in subset))
+    return best
+
+def test_pack_to_budget_is_optimal_on_small_instances():
+    rng = random.Random(5)
+    for _ in range(200):
+        count = rng.randint(1, 10); capacity = rng.randint(1, PACK_DP_BUCKETS) # The DP is exact at this resolution
+        weights = [rng.randint(1, capacity + 50) for _ in range(count)]; values = [rng.choice([0.0, rng.uniform(0.1, 10)]) for _ in range(count)]
+        chosen = pack_to_budget(weights, values, capacity)
+        assert chosen == sorted(set(chosen)) and sum(weights[i] for i in chosen) <= capacity
+        assert abs(sum(values[i] for i in chosen) - _best_value(weights, values, capacity)) < 1e-9
+
+def test_pack_to_budget_beats_greedy_by_density():
+    # Greedy takes the densest item (weight 6) and then nothing fits; the exact pass takes both weight-5 items
+    assert pack_to_budget([6, 5, 5], [7.0, 5.5, 5.5], 10) == [1, 2]
+
+def test_generation_respects_the_token_budget(tmp_path):
+    project = tmp_path / "project"
+    for name, lines in (("big.py", 400), ("a.py", 20), ("b.py", 20), ("c.md", 20)): _write(str(project / name), "value = 1\n" * lines)
+    stats = {}
+    path, _, _, tokens = generate_text_from_selected_files(str(project), ["a.py", "b.py", "big.py", "c.md"], output_filepath=str(tmp_path / "out.txt"),
+                                                           stats=stats, token_budget=TokenBudget(600, [("*.md", 0)]))
+    text = _read(path)
+    assert tokens <= 600 and "--- File: a.py ---" in text and "--- File: b.py ---" in text
+    assert {dropped for dropped, _ in stats['budget_dropped']} == {"big.py", "c.md"} and "  - big.py (" in text
+
+# --- sharding ---
+def test_shards_never_split_a_file(tmp_path):
+    project = tmp_path / "project"; rng = random.Random(2); names = [f"f{i:02d}.py" for i in range(30)]
+    for name in names: _write(str(project / name), "".join(f"# {name} line {line}\n" for line in range(rng.randint(1, 60))))
+    stats = {}; limit = ShardLimit(max_bytes=3000)
+    first, message, _, _ = generate_text_from_selected_files(str(project), names, output_filepath=str(tmp_path / "out.txt"), stats=stats, shard_limit=limit)
+    parts = stats['parts']
+    assert first == parts[0][0] and len(parts) > 2 and f"({len(parts)} parts, 30 files processed)" in message
+    assert sum(files for _, files, _ in parts) == 30 and not os.path.exists(tmp_path / "out.txt")
+    seen = []
+    for path, files, _ in parts:
+        text = _read(path); size = len(text.encode("utf-8"))
+        starts = [name for name in names if f"--- File: {name} ---" in text]
+        assert len(starts) == files and starts == [name for name in names if f"--- END OF FILE: {name} ---" in text]
+        for name in starts: assert text.count(f"# {name} line ") == _read(project / name).count("\n") # Whole file in this part
+        assert size <= limit.max_bytes or files == 1
+        assert text.startswith("--- START OF PROJECT CONTEXT FOR: project ---") and text.endswith("--- END OF PROJECT CONTEXT FOR: project ---")
+        seen.extend(starts)
+    assert seen == names
+
+# --- deduplication ---
+def test_duplicates_are_written_as_references_to_the_first_copy(tmp_path):
+    project = tmp_path / "project"; body = "def shared():\n    return 42\n"
+    for name in ("a/util.py", "b/util.py", "c/util_copy.py"): _write(str(project / name), body)
+    _write(str(project / "d.py"), "def other():\n    return 42\n") # Same size, different bytes
+    _write(str(project / "e.py"), ""); _write(str(project / "f.py"), "") # Empty files aren't deduplicated
+    files = ["a/util.py", "b/util.py", "c/util_copy.py", "d.py", "e.py", "f.py"]
+    assert find_duplicate_files(str(project), files) == {"b/util.py": "a/util.py", "c/util_copy.py": "a/util.py"}
+    stats = {}
+    path, _, _, _ = generate_text_from_selected_files(str(project), files, output_filepath=str(tmp_path / "out.txt"), stats=stats, deduplicate=True)
+    text = _read(path)
+    assert text.count("return 42") == 2 and "def other" in text
+    assert "--- File: b/util.py --- (identical to a/util.py)\n" in text and "--- File: c/util_copy.py --- (identical to a/util.py)\n" in text
+    assert stats['duplicates'] == {"b/util.py": "a/util.py", "c/util_copy.py": "a/util.py"} and stats['dedup_saved_bytes'] > 0
+
+# --- large files ---
+def test_large_files_are_skipped_unless_excerpts_are_asked_for(tmp_path):
+    project = tmp_path / "project"; _write(str(project / "big.log"), "line\n" * (MAX_FILE_SIZE_READ // 5 + 10))
+    path, _, _, _ = generate_text_from_selected_files(str(project), ["big.log"], output_filepath=str(tmp_path / "out.txt"))
+    assert f"--- File: big.log ---\nNote: Skipped file larger than {MAX_FILE_SIZE_READ // 1024}KB.\n--- END OF FILE: big.log ---\n" in _read(path)
+    path, _, _, _ = generate_text_from_selected_files(str(project), ["big.log"], output_filepath=str(tmp_path / "excerpt.txt"),
+                                                      large_files=LargeFilePolicy("excerpt", 3, 2))
+    assert _read(path).count("line\n") == 5
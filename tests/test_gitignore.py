@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+
+from context_compiler import ExclusionMatcher, GitIgnoreMatcher, IgnoreRules, list_project_items, parse_ignore_lines
+
+NO_EXCLUSIONS = ExclusionMatcher(set(), set(), []) # Only .gitignore decides (dot-directories are still skipped)
+
+def _rules(*lines: str, base_rel: str = "") -> IgnoreRules: return IgnoreRules(tuple(parse_ignore_lines(list(lines), base_rel)))
+
+def _write(path, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: f.write(text)
+
+# --- rule compiler ---
+def test_unanchored_patterns_match_at_any_depth():
+    rules = _rules("*.log", "build")
+    assert rules.is_ignored("a.log", False) and rules.is_ignored("src/deep/a.log", False)
+    assert rules.is_ignored("build", True) and rules.is_ignored("src/build", True) and rules.is_ignored("src/build", False)
+    assert not rules.is_ignored("a.log.txt", False) and not rules.is_ignored("builds", True)
+
+def test_slashes_anchor_to_the_ignore_files_directory():
+    rules = _rules("/todo.txt", "doc/*.md")
+    assert rules.is_ignored("todo.txt", False) and not rules.is_ignored("src/todo.txt", False)
+    assert rules.is_ignored("doc/a.md", False) and not rules.is_ignored("doc/sub/a.md", False) and not rules.is_ignored("x/doc/a.md", False)
+    nested = _rules("/gen", "*.tmp", base_rel="pkg")
+    assert nested.is_ignored("pkg/gen", True) and not nested.is_ignored("gen", True) and not nested.is_ignored("pkg/sub/gen", True)
+    assert nested.is_ignored("pkg/sub/a.tmp", False) and not nested.is_ignored("a.tmp", False)
+
+def test_trailing_slash_matches_directories_only():
+    rules = _rules("out/")
+    assert rules.is_ignored("out", True) and rules.is_ignored("a/out", True) and not rules.is_ignored("out", False)
+
+def test_double_star():
+    rules = _rules("**/logs", "a/**/b", "lib/**", "x**y")
+    assert rules.is_ignored("logs", True) and rules.is_ignored("deep/er/logs", True)
+    assert rules.is_ignored("a/b", True) and rules.is_ignored("a/x/y/b", True) and not rules.is_ignored("c/a/b", True)
+    assert rules.is_ignored("lib/m.js", False) and rules.is_ignored("lib/x/m.js", False) and not rules.is_ignored("lib", True)
+    assert rules.is_ignored("xaby", False) and not rules.is_ignored("xa/by", False) # Not next to a slash: like '*'
+
+def test_negation_reincludes_and_the_last_matching_rule_wins():
+    rules = _rules("*.log", "!keep.log", "keep.log.*", "!important/*.log")
+    assert rules.is_ignored("a.log", False) and not rules.is_ignored("keep.log", False) and not rules.is_ignored("sub/keep.log", False)
+    assert not rules.is_ignored("important/x.log", False)
+    assert _rules("!a.txt", "*.txt").is_ignored("a.txt", False)
+
+def test_comments_escapes_classes_and_trailing_spaces():
+    rules = _rules("# comment", "\\#hash", "\\!bang", "file?.c", "[ab].txt", "[!0-9]x", "space\\ ", "trail   ")
+    assert rules.is_ignored("#hash", False) and rules.is_ignored("!bang", False) and not rules.is_ignored("# comment", False)
+    assert rules.is_ignored("file1.c", False) and not rules.is_ignored("file10.c", False)
+    assert rules.is_ignored("a.txt", False) and not rules.is_ignored("c.txt", False)
+    assert rules.is_ignored("ax", False) and not rules.is_ignored("1x", False)
+    assert rules.is_ignored("space ", False) and rules.is_ignored("trail", False) and not rules.is_ignored("trail ", False)
+
+# --- scanning with nested ignore files ---
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    files = {
+        ".gitignore": "*.log\n!keep.log\n/build/\ndist/\ndocs/**/draft.md\nnode_modules\n",
+        ".git/info/exclude": "secret.txt\n",
+        "a.py": "", "a.log": "", "keep.log": "", "secret.txt": "", "build/out.js": "", "dist/x.js": "", "src/dist/y.js": "",
+        "src/build/z.js": "", "src/app.log": "", "src/keep.log": "", "src/node_modules/m.js": "",
+        "docs/draft.md": "", "docs/guide/draft.md": "", "docs/guide/final.md": "",
+        "src/pkg/.gitignore": "*.py\n!main.py\n/local/\n", "src/pkg/main.py": "", "src/pkg/util.py": "",
+        "src/pkg/local/l.txt": "", "src/pkg/sub/local/l.txt": "", "src/pkg/sub/other.py": "",
+        "ignored_dir/.gitignore": "", "ignored_dir/inner.txt": "",
+    }
+    for rel, text in files.items(): _write(str(root / rel), text)
+    with open(root / ".gitignore", "a", encoding="utf-8") as f: f.write("ignored_dir/\n!ignored_dir/inner.txt\n") # Can't re-include below an ignored dir
+    return root
+
+def _scanned_files(root) -> set:
+    store, _ = list_project_items(str(root), matcher=NO_EXCLUSIONS, respect_gitignore=True)
+    return {item['Path'] for item in store if not item['IsDir']}
+
+def test_scan_applies_nested_ignore_files(project):
+    assert _scanned_files(project) == {
+        ".gitignore", "a.py", "keep.log", "src/keep.log", "src/build/z.js", "docs/guide/final.md",
+        "src/pkg/.gitignore", "src/pkg/main.py", "src/pkg/sub/local/l.txt",
+    }
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_scan_matches_git(project):
+    subprocess.run(["git", "init", "-q", str(project)], check=True)
+    _write(str(project / ".git" / "info" / "exclude"), "secret.txt\n") # git init may have written its own
+    listed = subprocess.run(["git", "ls-files", "--others", "--exclude-standard"], cwd=str(project), check=True,
+                            capture_output=True, text=True).stdout.split()
+    assert _scanned_files(project) == set(listed)
+
+def test_matcher_caches_rules_and_forgets_them_on_invalidate(project):
+    matcher = GitIgnoreMatcher(str(project))
+    assert matcher.rules_for("src/pkg").is_ignored("src/pkg/util.py", False)
+    _write(str(project / "src" / "pkg" / ".gitignore"), "")
+    assert matcher.rules_for("src/pkg").is_ignored("src/pkg/util.py", False) # Cached
+    matcher.invalidate("src")
+    assert not matcher.rules_for("src/pkg").is_ignored("src/pkg/util.py", False)
+    assert str(project / ".gitignore") in matcher.loaded_files
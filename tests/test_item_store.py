@@ -0,0 +1,102 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context_compiler import ITEM_IS_DIR, ITEM_REMOVED, ITEM_SELECTED, ProjectItemStore, list_project_items
+
+def _random_store(rng: random.Random, dir_count: int = 40) -> ProjectItemStore:
+    store = ProjectItemStore(); store.add_root("project"); dirs = [0]
+    for number in range(dir_count):
+        parent = rng.choice(dirs)
+        first = store.add_children(parent, [f"d{number}"], [f"f{number}_{i}.py" for i in range(rng.randint(0, 4))], rng.random() < 0.7)
+        dirs.append(first)
+    return store
+
+def _recount(store: ProjectItemStore):
+    # Every counter rebuilt from the flags and sizes, children before parents
+    count = len(store.flags); files = [0] * count; selected = [0] * count; total_bytes = [0] * count; selected_bytes = [0] * count
+    for index in range(count - 1, -1, -1):
+        item_flags = store.flags[index]
+        if item_flags & ITEM_REMOVED: continue
+        if not item_flags & ITEM_IS_DIR:
+            size = max(store.sizes[index], 0); files[index] = 1; total_bytes[index] = size
+            if item_flags & ITEM_SELECTED: selected[index] = 1; selected_bytes[index] = size
+        parent = store.parents[index]
+        if parent >= 0:
+            files[parent] += files[index]; selected[parent] += selected[index]
+            total_bytes[parent] += total_bytes[index]; selected_bytes[parent] += selected_bytes[index]
+    return files, selected, total_bytes, selected_bytes
+
+def _assert_counters_match_a_recount(store: ProjectItemStore):
+    live = [index for index in range(len(store.flags)) if not store.flags[index] & ITEM_REMOVED]
+    for name, expected in zip(("file_totals", "selected_files", "total_bytes", "selected_bytes"), _recount(store)):
+        column = getattr(store, name)
+        assert [column[index] for index in live] == [expected[index] for index in live], name
+    for index in live:
+        state = store.check_state(index); total = store.file_totals[index]
+        if total and store.flags[index] & ITEM_IS_DIR: assert state == (None if 0 < store.selected_files[index] < total else store.selected_files[index] == total)
+
+def test_counters_follow_toggles_sizes_additions_and_removals():
+    rng = random.Random(7); store = _random_store(rng); added = 0
+    _assert_counters_match_a_recount(store)
+    for step in range(1500):
+        live = [index for index in range(len(store.flags)) if not store.flags[index] & ITEM_REMOVED]
+        files = [index for index in live if not store.is_dir(index)]; dirs = [index for index in live if store.is_dir(index)]
+        operation = rng.random()
+        if operation < 0.35 and files: store.set_selected(rng.choice(files), rng.random() < 0.5)
+        elif operation < 0.55: store.set_subtree_selected(rng.choice(dirs), rng.random() < 0.5)
+        elif operation < 0.6: store.set_all_selected(rng.random() < 0.5)
+        elif operation < 0.75 and files:
+            store.set_file_sizes((index, rng.randint(0, 10_000)) for index in rng.sample(files, min(len(files), rng.randint(1, 20))))
+        elif operation < 0.85: # New entries in a folder that already has children, like watch mode adds them
+            parent = rng.choice(dirs); added += 1
+            store.add_children(parent, [f"new{added}"] if rng.random() < 0.3 else [], [f"new{added}.txt"], store.is_selected(parent))
+        elif operation < 0.9 and len(dirs) > 1: store.remove_subtree(rng.choice(dirs[1:]))
+        elif len(files) > 1: store.remove_subtree(rng.choice(files))
+        if step % 10 == 0: _assert_counters_match_a_recount(store)
+    _assert_counters_match_a_recount(store)
+
+def test_unsized_files_and_recount_selected():
+    store = ProjectItemStore(); store.add_root("project")
+    first = store.add_children(0, ["src"], ["a.py", "b.py"]); store.add_children(first, [], ["c.py"], False)
+    assert sorted(store.paths[index] for index in store.unsized_files()) == ["a.py", "b.py", "src/c.py"]
+    store.set_file_sizes((index, 100) for index in store.unsized_files())
+    assert store.unsized_files() == [] and store.total_bytes[0] == 300 and store.selected_bytes[0] == 200
+    assert store.check_state(first) is False and store.check_state(0) is None
+    store.flags[store.index_of("src/c.py")] |= ITEM_SELECTED; store._recount_selected() # What apply_selection_rules relies on
+    assert store.selected_files[0] == 3 and store.selected_bytes[first] == 100 and store.check_state(0) is True
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: f.write("x\n")
+
+def test_selection_rules_round_trip_and_new_files_follow_their_folders_majority(tmp_path):
+    root = tmp_path / "project"
+    for rel in ("README.md", "src/a.py", "src/b.py", "src/c.py", "src/d.py", "tests/t1.py", "tests/t2.py", "tests/t3.py", "docs/x.md", "empty/.keep"):
+        _touch(str(root / rel))
+    os.remove(root / "empty" / ".keep")
+    store, _ = list_project_items(str(root))
+    store.set_selected(store.index_of("src/d.py"), False) # src: 3 of 4 checked
+    for name in ("t1.py", "t2.py"): store.set_selected(store.index_of(f"tests/{name}"), False) # tests: 1 of 3 checked
+    store.set_subtree_selected(store.index_of("docs"), False); store.set_selected(store.index_of("empty"), False)
+    selected_before = store.selected_file_paths(); rules = store.selection_rules()
+    assert len(rules) < len(store.paths)
+
+    rescanned, _ = list_project_items(str(root))
+    assert rescanned.apply_selection_rules(rules) == len(selected_before)
+    assert rescanned.selected_file_paths() == selected_before and not rescanned.is_selected(rescanned.index_of("empty"))
+
+    for rel in ("src/new.py", "tests/new.py", "docs/new.md", "src/pkg/deep.py", "new_top.md"): _touch(str(root / rel))
+    rescanned, _ = list_project_items(str(root))
+    rescanned.apply_selection_rules(rules)
+    assert rescanned.selected_file_paths() == sorted(selected_before + ["new_top.md", "src/new.py", "src/pkg/deep.py"])
+    assert rescanned.selected_files[0] == len(rescanned.selected_file_paths())
+    _assert_counters_match_a_recount(rescanned)
+
+def test_apply_selection_rules_rejects_rules_without_a_sign():
+    store = ProjectItemStore(); store.add_root("project"); store.add_children(0, [], ["a.py"])
+    with pytest.raises(ValueError): store.apply_selection_rules(["+", "a.py"])
+    assert store.apply_selection_rules(["-", "+a.py", "+gone/b.py"]) == 1
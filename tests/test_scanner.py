@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+
+from context_compiler import ProjectItemStore, is_excluded, list_project_items, scan_project_tree
+
+def _walk_items(project_path: str):
+    # The original serial scanner (os.walk, topdown), the reference for the parallel scanner's order
+    project_path_abs = os.path.abspath(project_path)
+    items = [("", '📁 Dir', os.path.basename(project_path_abs), True, 0)]
+    for root, dirs, files in os.walk(project_path_abs, topdown=True):
+        relative_root = os.path.relpath(root, project_path_abs)
+        if relative_root == ".": relative_root = ""
+        depth = relative_root.count(os.sep) if relative_root else 0
+        dirs[:] = [d for d in dirs if not is_excluded(d, is_dir=True)]
+        for dir_name in sorted(dirs):
+            items.append((os.path.join(relative_root, dir_name).replace("\\", "/"), '📁 Dir', dir_name, True, depth + 1))
+        for file_name in sorted(f for f in files if not is_excluded(f, is_dir=False)):
+            items.append((os.path.join(relative_root, file_name).replace("\\", "/"), '📄 File', file_name, False, depth + 1))
+    return items
+
+def _scanned_items(store: ProjectItemStore):
+    return [(item['Path'], item['Type'], item['Name'], item['IsDir'], item['Depth']) for item in store]
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: f.write("x\n")
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "project"
+    for rel in ("README.md", "b.py", "A.py", "src/main.py", "src/util/helpers.py", "src/util/Zeta/z.txt", "docs/index.md",
+                "node_modules/pkg/index.js", "src/__pycache__/main.cpython-311.pyc", ".git/HEAD", "src/.hidden/x.py",
+                "image.png", "Thumbs.db", ".env", "locked/secret.txt", "empty/.keep"):
+        _touch(str(root / rel))
+    deep = root / "deep"
+    for level in range(40): deep = deep / f"d{level}"
+    _touch(str(deep / "leaf.txt"))
+    (root / "empty" / ".keep").unlink()
+    if hasattr(os, "symlink"):
+        try:
+            os.symlink(root / "src", root / "link_to_src", target_is_directory=True) # Listed, not entered
+            os.symlink(root / "b.py", root / "link_to_b.py")
+            os.symlink(root / "missing", root / "dangling")
+        except OSError: pass
+    return root
+
+def _lock(monkeypatch, locked_dir: str):
+    # Makes one directory unreadable for os.scandir (and so for os.walk), also when the tests run as root
+    real_scandir = os.scandir
+    def scandir(path="."):
+        if os.path.abspath(os.fspath(path)) == locked_dir: raise PermissionError(13, "Permission denied", os.fspath(path))
+        return real_scandir(path)
+    monkeypatch.setattr(os, "scandir", scandir)
+
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_parallel_scan_matches_the_serial_walk(tree, monkeypatch, max_workers):
+    _lock(monkeypatch, str(tree / "locked"))
+    expected = _walk_items(str(tree))
+    store, message = list_project_items(str(tree), max_workers=max_workers)
+    assert _scanned_items(store) == expected
+    assert ("locked", '📁 Dir', "locked", True, 1) in expected and not any(path.startswith("locked/") for path, *_ in expected)
+    assert any(path == "link_to_src" for path, *_ in expected) and not any(path.startswith("link_to_src/") for path, *_ in expected)
+    assert any(path.endswith("/leaf.txt") for path, *_ in expected)
+    assert message == f"Found {len(expected) - 1} items (excluding root). Scan complete."
+
+def test_subtree_rescan_matches_the_serial_walk_of_that_subtree(tree):
+    store = ProjectItemStore(); store.add_root("project")
+    store.add_children(0, ["src"], [], True)
+    scan_project_tree(str(tree), store, 1)
+    expected = [item for item in _walk_items(str(tree)) if item[0] == "src" or item[0].startswith("src/")]
+    assert _scanned_items(store)[1:] == expected
@@ -0,0 +1,47 @@
+import os
+import sys
+import re
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context_compiler import BPETokenizer, TOKEN_HEAP_MERGE_MIN_BYTES
+
+def _toy_tokenizer(seed: int = 3) -> BPETokenizer:
+    rng = random.Random(seed); alphabet = b"ab =-\n"
+    ranks = {bytes([byte]): byte for byte in range(256)}; tokens = [bytes([byte]) for byte in alphabet]
+    for _ in range(200):
+        merged = rng.choice(tokens) + rng.choice(tokens)
+        if len(merged) <= 12 and merged not in ranks: ranks[merged] = len(ranks); tokens.append(merged)
+    return BPETokenizer("toy", ranks, None, "toy")
+
+def _reference_count(ranks, piece: bytes) -> int:
+    # The textbook loop: merge the lowest-ranked (leftmost on ties) adjacent pair until none is left
+    parts = [piece[i:i + 1] for i in range(len(piece))]
+    while len(parts) > 1:
+        pairs = [(ranks[parts[i] + parts[i + 1]], i) for i in range(len(parts) - 1) if parts[i] + parts[i + 1] in ranks]
+        if not pairs: break
+        _, index = min(pairs)
+        parts[index:index + 2] = [parts[index] + parts[index + 1]]
+    return len(parts)
+
+def test_heap_merge_matches_the_reference_merge_order():
+    tokenizer = _toy_tokenizer(); rng = random.Random(1)
+    for trial in range(1000):
+        size = rng.randint(TOKEN_HEAP_MERGE_MIN_BYTES, 400)
+        piece = bytes(rng.choice(b"ab =-\n") for _ in range(size)) if trial % 2 else (rng.choice([b"=", b" ", b"ab", b"a b"]) * size)[:size]
+        if piece in tokenizer.ranks: continue
+        assert tokenizer._count_piece(piece) == _reference_count(tokenizer.ranks, piece)
+
+def test_long_runs_are_counted_quickly():
+    tokenizer = _toy_tokenizer()
+    piece = b"ab" * 50_000 # Took minutes when every merge rescanned every pair
+    assert 0 < tokenizer._count_piece(piece) <= len(piece)
+
+def test_count_many_matches_count_and_merges_shared_pieces_once():
+    tokenizer = _toy_tokenizer(); tokenizer.split_pattern = re.compile(r" ?[ab]+|[^ab]+")
+    texts = ["ab ab=ba", "ab ab", "", "= - \n" * 40, "ab ab=ba"]
+    expected = [tokenizer.count(text) for text in texts]
+    tokenizer._piece_counts.clear(); merged = []
+    count_piece = tokenizer._count_piece; tokenizer._count_piece = lambda piece: merged.append(piece) or count_piece(piece)
+    assert tokenizer.count_many(texts) == expected
+    assert len(merged) == len(set(merged))
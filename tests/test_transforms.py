@@ -0,0 +1,124 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+
+from context_compiler import (
+    FileRecord, TransformPolicy, apply_transforms, collapse_blank_lines, normalise_indentation, strip_comments, strip_license_header,
+    transform_policy_from_rules,
+)
+
+# --- indent ---
+def test_indent_halves_uniform_levels():
+    source = "def f():\n    if x:\n        return 1\n    return 2\n"
+    assert normalise_indentation(source, "py") == "def f():\n  if x:\n    return 1\n  return 2\n"
+
+def test_indent_keeps_python_valid_with_aligned_continuation_lines():
+    source = ("class A:\n        def f(self):\n            x = 1\n            if x:\n"
+              "                return (1,\n                        2)\n")
+    compile(source, "<before>", "exec")
+    output = normalise_indentation(source, "py")
+    compile(output, "<after>", "exec")
+    assert output.startswith("class A:\n  def f(self):\n    x = 1\n    if x:\n      return (1,\n")
+
+def test_indent_keeps_nesting_order_for_every_unit():
+    for unit in (3, 4, 6, 8):
+        source = "".join(f"{' ' * (unit * level)}if x{level}:\n" for level in range(5)) + " " * (unit * 5) + "pass\n"
+        source += " " * (unit * 2) + "y = (1,\n" + " " * (unit * 2 + 5) + "2)\n"
+        compile(source, "<before>", "exec")
+        compile(normalise_indentation(source, "py"), "<after>", "exec")
+
+def test_indent_keeps_yaml_structure():
+    source = "a:\n    b:\n        - c\n        - d\n    e: 1\nf: 2\n"
+    assert normalise_indentation(source, "yaml") == "a:\n  b:\n    - c\n    - d\n  e: 1\nf: 2\n"
+
+def test_indent_leaves_small_indents_and_tab_significant_files_alone():
+    assert normalise_indentation("a:\n  b: 1\n", "yaml") == "a:\n  b: 1\n"
+    assert normalise_indentation("all:\n\tcc -o x x.c\n", "makefile") == "all:\n\tcc -o x x.c\n"
+
+def test_indent_counts_tabs_as_four_columns():
+    assert normalise_indentation("def f():\n\treturn 1\n", "py") == "def f():\n  return 1\n"
+
+# --- comments ---
+def test_comments_keep_unquoted_stylesheet_urls():
+    source = ".a {\n  background: url(http://example.com/a.png); // bg\n  b: url( //cdn.example.com/x.png );\n}\n"
+    expected = ".a {\n  background: url(http://example.com/a.png);\n  b: url( //cdn.example.com/x.png );\n}\n"
+    for extension in ("scss", "less"): assert strip_comments(source, extension) == expected
+
+def test_comments_stylesheet_slashes_need_whitespace():
+    assert strip_comments("// header\n.a{b:c}//x\n/* block */.d{e:f}\n", "scss") == ".a{b:c}//x\n.d{e:f}\n"
+
+def test_comments_keep_markers_inside_strings():
+    source = 'const url = "http://x/*y*/"; // note\nconst s = \'#not\'; /* gone */\n'
+    assert strip_comments(source, "js") == 'const url = "http://x/*y*/";\nconst s = \'#not\';\n'
+    assert strip_comments("a = 'x # y' # note\nb = \"#{c}\"\n", "rb") == "a = 'x # y'\nb = \"#{c}\"\n"
+
+def test_comments_keep_js_regex_literals():
+    assert strip_comments("const r = /a\\/\\/b/g; // c\n", "js") == "const r = /a\\/\\/b/g;\n"
+
+def test_comments_keep_shebangs():
+    assert strip_comments("#!/bin/sh\n# comment\necho $# hi\n", "sh") == "#!/bin/sh\necho $# hi\n"
+    assert strip_comments("#!/usr/bin/env python\n# comment\nx = 1\n", "py") == "#!/usr/bin/env python\nx = 1\n"
+
+def test_comments_python_keeps_strings_and_docstrings_and_compiles():
+    source = 'def f():\n    """Doc # kept."""\n    # gone\n    return "#x"  # gone\n'
+    output = strip_comments(source, "py")
+    assert output == 'def f():\n    """Doc # kept."""\n    return "#x"\n'
+    compile(output, "<after>", "exec")
+
+def test_comments_drop_html_and_sql_comments():
+    assert strip_comments("<p>a</p><!-- x -->\n<!--\n  y\n-->\n<b/>\n", "html") == "<p>a</p>\n\n\n<b/>\n" # Lines inside kept blank
+    assert strip_comments("SELECT '--x' -- c\nFROM t /* d */;\n", "sql") == "SELECT '--x'\nFROM t ;\n"
+
+# --- license ---
+def test_license_drops_leading_block_comment():
+    source = "/*\n * Copyright 2024 Example Corp.\n * Licensed under the MIT License.\n */\n\nimport x from 'y';\n"
+    assert strip_license_header(source, "js") == "import x from 'y';"
+
+def test_license_drops_hash_header_after_shebang_and_compiles():
+    source = "#!/usr/bin/env python\n# Copyright (c) 2024 Example\n# SPDX-License-Identifier: MIT\n\nimport os\n"
+    output = strip_license_header(source, "py")
+    assert output == "#!/usr/bin/env python\nimport os"
+    compile(output, "<after>", "exec")
+
+def test_license_keeps_comments_without_licence_words():
+    source = "// Helpers for parsing dates.\nexport const a = 1;\n"
+    assert strip_license_header(source, "ts") == source
+
+def test_license_ignores_unknown_extensions():
+    assert strip_license_header("Copyright 2024\ntext\n", "txt") == "Copyright 2024\ntext\n"
+
+# --- blank_lines ---
+def test_blank_lines_trims_trailing_whitespace_and_collapses_runs():
+    assert collapse_blank_lines("a  \n\n\n\n\tb\t\n\n", "py") == "a\n\n\tb\n\n"
+
+def test_blank_lines_keeps_python_valid():
+    source = "def f():\n    x = 1   \n\n\n\n    return x\n"
+    compile(collapse_blank_lines(source, "py"), "<after>", "exec")
+
+# --- policy and pipeline ---
+def test_policy_orders_transforms_and_falls_back_to_star():
+    policy = transform_policy_from_rules(["py=blank_lines,comments", "*=blank_lines"])
+    assert policy.for_extension("py") == ("comments", "blank_lines")
+    assert policy.for_extension("go") == ("blank_lines",)
+    assert transform_policy_from_rules([]) is None
+
+def test_policy_rejects_unknown_transforms():
+    with pytest.raises(ValueError): TransformPolicy({"py": ["minify"]})
+    with pytest.raises(ValueError): transform_policy_from_rules(["py=minify"])
+    with pytest.raises(ValueError): transform_policy_from_rules(["comments"])
+
+def test_apply_transforms_runs_every_transform_and_python_compiles():
+    source = ("#!/usr/bin/env python\n# Copyright 2024 Example\n# Licensed under MIT\n\nclass A:\n        # note\n"
+              "        def f(self):\n            s = '# not a comment'\n\n\n\n            return (s,\n                    1)\n")
+    record = FileRecord("a.py", "text", source, "py")
+    savings = apply_transforms(record, transform_policy_from_rules(["py=license,comments,indent,blank_lines"]))
+    assert [name for name, _, _ in savings] == ["license", "comments", "indent", "blank_lines"]
+    assert all(after <= before for _, before, after in savings)
+    assert "# not a comment" in record.content and "Copyright" not in record.content and "# note" not in record.content
+    compile(record.content, "<after>", "exec")
+
+def test_apply_transforms_skips_non_text_records():
+    record = FileRecord("a.py", "skipped", None, "py", message="Binary")
+    assert apply_transforms(record, TransformPolicy({"*": ["comments"]})) == []